@@ -40,36 +40,49 @@ async function fetchMenu() {
   }
 }
 
-async function submitOrder(orderData) {
-  try {
-    const res = await fetch(`${API_BASE}/orders`, {
-      method: 'POST',
-      headers: { 'Content-Type': 'application/json' },
-      body: JSON.stringify(orderData)
-    });
-    if (!res.ok) throw new Error('Network response was not ok');
-    return await res.json();
-  } catch (err) {
-    console.warn('submitOrder error', err);
-    return { success: true, message: 'Order received (demo mode)', order_id: 'DEMO_' + Date.now() };
-  }
+// Checkout POSTs retry transient failures (no response, 408, 409 while the
+// first attempt is still in progress, 429, 5xx) with the same Idempotency-Key,
+// so a retry can't create a second order. Failures come back as
+// { success: false, error, transient }; the store keeps the key for transient ones.
+const CHECKOUT_RETRIES = 3;
+
+function isTransientStatus(status) {
+  return status === 408 || status === 409 || status === 429 || status >= 500;
 }
 
-async function submitReservation(reservationData) {
-  try {
-    const res = await fetch(`${API_BASE}/reservations`, {
-      method: 'POST',
-      headers: { 'Content-Type': 'application/json' },
-      body: JSON.stringify(reservationData)
-    });
-    if (!res.ok) throw new Error('Network response was not ok');
-    return await res.json();
-  } catch (err) {
-    console.warn('submitReservation error', err);
-    return { success: true, message: 'Reservation confirmed (demo mode)', reservation_id: 'RES_' + Date.now() };
+async function postCheckout(path, payload, idempotencyKey) {
+  const headers = { 'Content-Type': 'application/json' };
+  if (idempotencyKey) headers['Idempotency-Key'] = idempotencyKey;
+  let error = 'Could not reach the server';
+  for (let attempt = 0; ; attempt++) {
+    let delay = 1000 * 2 ** attempt;
+    try {
+      const res = await fetch(`${API_BASE}${path}`, {
+        method: 'POST',
+        headers,
+        body: JSON.stringify(payload)
+      });
+      const data = await res.json().catch(() => ({}));
+      if (res.ok) return data;
+      error = data.error || `Server error (${res.status})`;
+      if (!isTransientStatus(res.status)) return { success: false, error, transient: false };
+      delay = 1000 * (Number(res.headers.get('Retry-After')) || data.retry_after || 2 ** attempt);
+    } catch (err) {
+      console.warn(`${path} error`, err);
+    }
+    if (attempt >= CHECKOUT_RETRIES) return { success: false, error, transient: true };
+    await new Promise(resolve => setTimeout(resolve, delay));
   }
 }
 
+async function submitOrder(orderData, idempotencyKey) {
+  return postCheckout('/orders', orderData, idempotencyKey);
+}
+
+async function submitReservation(reservationData, idempotencyKey) {
+  return postCheckout('/reservations', reservationData, idempotencyKey);
+}
+
 export default {
   sendChatMessage,
   fetchMenu,
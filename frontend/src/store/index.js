@@ -12,6 +12,8 @@ export const useMainStore = defineStore('main', {
     toastMessage: '',
     apiEndpoint: 'http://127.0.0.1:5000/api',
     appTheme: 'auto',
+    // Idempotency-Key per checkout, reused by double clicks and retries
+    checkoutKeys: {},
 
     chatInput: '',
     conversationHistory: [],
@@ -73,6 +75,15 @@ export const useMainStore = defineStore('main', {
       this.sessionId = 'session_' + Date.now() + '_' + Math.random().toString(36).substr(2, 9);
     },
 
+    checkoutKey(kind) {
+      if (!this.checkoutKeys[kind]) {
+        this.checkoutKeys[kind] = (window.crypto && crypto.randomUUID)
+          ? crypto.randomUUID()
+          : 'key_' + Date.now() + '_' + Math.random().toString(36).substr(2, 9);
+      }
+      return this.checkoutKeys[kind];
+    },
+
     showToast(message) {
       this.toastMessage = message;
       this.showToast = true;
@@ -213,7 +224,11 @@ export const useMainStore = defineStore('main', {
       };
       this.isLoading = true;
       try {
-        const res = await api.submitOrder(orderData);
+        const res = await api.submitOrder(orderData, this.checkoutKey('order'));
+        // A transient failure may still have reached the server: keep the key
+        // so placing the order again replays it rather than ordering twice
+        if (!res.transient) delete this.checkoutKeys.order;
+        if (res.success === false) { this.showToast(`Order not placed: ${res.error || 'please try again'}`); return }
         this.showToast('Order placed successfully!');
         this.addMessage(`Order placed successfully! Order ID: ${res.order_id || 'N/A'}`, false);
         this.clearCart();
@@ -234,7 +249,9 @@ export const useMainStore = defineStore('main', {
           time: form.time,
           special_requests: form.special_requests,
           session_id: this.sessionId
-        });
+        }, this.checkoutKey('reservation'));
+        if (!res.transient) delete this.checkoutKeys.reservation;
+        if (res.success === false) { this.showToast(`Reservation not made: ${res.error || 'please try again'}`); return }
         this.reservationConfirmationId = res.reservation_id || 'N/A';
         this.reservationConfirmed = true;
         this.showToast('Reservation confirmed!');
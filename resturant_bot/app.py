@@ -1,20 +1,45 @@
 
+import io
 import os
+import re
+import csv
+import gzip
 import json
+import math
+import queue
+import random
+import sqlite3
+import hashlib
+import hmac
+import ipaddress
 import logging
-from datetime import datetime, timedelta
+import threading
+import time
+import zlib
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, datetime, timedelta
 from functools import wraps
 from typing import Dict, List, Optional, Tuple
 
-from flask import Flask, request, jsonify, session
+import click
+from flask import Flask, request, jsonify, session, g, has_app_context, has_request_context, stream_with_context
 from flask_cors import CORS
 from flask_sqlalchemy import SQLAlchemy
+from flask_sqlalchemy.session import Session as FlaskSQLAlchemySession
 from flask_limiter import Limiter
-from flask_limiter.util import get_remote_address
-import google.generativeai as genai
+from limits import parse_many
+from sqlalchemy import bindparam, event, func, literal_column, or_, select, text, update, inspect as sqlalchemy_inspect
+from sqlalchemy.engine import Engine
+from sqlalchemy.exc import DatabaseError, DBAPIError
+from sqlalchemy.schema import CreateTable
+from sqlalchemy.types import TypeDecorator
 from dotenv import load_dotenv
 import jwt
 
+from llm import get_llm_client, CircuitOpenError
+import ratelimit  # noqa: F401 - registers the hybrid+redis:// limiter storage
+
 # ============================================================================
 # CONFIGURATION
 # ============================================================================
@@ -32,53 +57,208 @@ app.config['SQLALCHEMY_DATABASE_URI'] = os.getenv(
 app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
 app.config['SECRET_KEY'] = os.getenv('SECRET_KEY', 'dev-key-change-in-production')
 
+# Optional read replica, used by read_from_replica() (see READ REPLICA)
+REPLICA_DATABASE_URL = os.getenv('REPLICA_DATABASE_URL')
+if REPLICA_DATABASE_URL:
+    app.config['SQLALCHEMY_BINDS'] = {'replica': REPLICA_DATABASE_URL}
+
+
+class RoutingSession(FlaskSQLAlchemySession):
+    """Sends reads made inside read_from_replica() to the replica; writes always go to the primary"""
+
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        if bind is None:
+            if self._flushing or getattr(clause, 'is_dml', False):
+                note_database_write()
+            elif has_app_context() and g.get('db_route') == 'replica':
+                return self._db.engines['replica']
+        return super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+
+
 # Initialize extensions
-db = SQLAlchemy(app)
+db = SQLAlchemy(app, session_options={'class_': RoutingSession})
 CORS(app, resources={
     r"/api/*": {
         "origins": os.getenv('CORS_ORIGINS', '*').split(',') if os.getenv('CORS_ORIGINS') else '*',
-        "allow_headers": ["Content-Type", "Authorization"],
+        "allow_headers": ["Content-Type", "Authorization", "Idempotency-Key", "X-Tenant-ID"],
+        "expose_headers": ["Retry-After", "Idempotent-Replayed"],
         "methods": ["GET", "POST", "PUT", "DELETE", "OPTIONS"],
         "supports_credentials": True
     }
 })
 
-# Rate limiting
+# Rate limiting (RATELIMIT_ENABLED=false turns it off, e.g. for load tests).
+# Limits are sliding window counters. With REDIS_URL they live in Redis and are
+# shared by every worker. Each worker leases entries in batches (see
+# ratelimit.py), so most checks don't leave the process. Without Redis each
+# worker counts on its own. Route limits are per client IP (the peer address,
+# or CF-Connecting-IP from a TRUSTED_PROXIES peer), and chat routes also share a
+# per-session limit (SESSION_RATE_LIMIT). /api/chat and /api/chat/batch draw on
+# one per-IP chat limit (CHAT_RATE_LIMIT); a batch costs one hit per message.
+app.config['RATELIMIT_ENABLED'] = os.getenv('RATELIMIT_ENABLED', 'true').lower() == 'true'
+RATELIMIT_STORAGE_URI = os.getenv(
+    'RATELIMIT_STORAGE_URI', f"hybrid+{os.getenv('REDIS_URL')}" if os.getenv('REDIS_URL') else 'memory://'
+)
+RATELIMIT_LEASE_SIZE = int(os.getenv('RATELIMIT_LEASE_SIZE', 20))
+RATELIMIT_LEASE_FRACTION = float(os.getenv('RATELIMIT_LEASE_FRACTION', 0.1))
+RATELIMIT_LEASE_SECONDS = float(os.getenv('RATELIMIT_LEASE_SECONDS', 1.0))
+SESSION_RATE_LIMIT = os.getenv('SESSION_RATE_LIMIT', '20 per minute')
+CHAT_RATE_LIMIT = os.getenv('CHAT_RATE_LIMIT', '30 per minute')
 limiter = Limiter(
     app=app,
-    key_func=get_remote_address,
+    key_func=lambda: get_client_ip(),
     default_limits=["200 per day", "50 per hour"],
-    storage_uri=os.getenv('REDIS_URL', None)
+    strategy='sliding-window-counter',
+    storage_uri=RATELIMIT_STORAGE_URI,
+    storage_options={
+        'lease_size': RATELIMIT_LEASE_SIZE,
+        'lease_fraction': RATELIMIT_LEASE_FRACTION,
+        'lease_seconds': RATELIMIT_LEASE_SECONDS,
+        'socket_timeout': 0.5
+    } if RATELIMIT_STORAGE_URI.startswith('hybrid+') else {},
+    in_memory_fallback_enabled=True
+)
+session_limit = limiter.shared_limit(
+    SESSION_RATE_LIMIT, scope='session', key_func=lambda: f'session:{request_session_id()}',
+    exempt_when=lambda: request_session_id() is None
 )
+chat_limit = limiter.shared_limit(CHAT_RATE_LIMIT, scope='chat')
+chat_batch_limit = limiter.shared_limit(CHAT_RATE_LIMIT, scope='chat', cost=lambda: chat_batch_size())
 
 # Logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-# Configure Gemini API
-GEMINI_API_KEY = os.getenv('GEMINI_API_KEY')
-if not GEMINI_API_KEY:
-    raise ValueError("GEMINI_API_KEY environment variable not set")
-
-genai.configure(api_key=GEMINI_API_KEY)
-model = genai.GenerativeModel('gemini-2.0-flash')
+# The LLM client (see llm.py) is built lazily on first use, so processes
+# that never call the model don't import the Gemini SDK or need a key
 
 # ============================================================================
 # DATABASE MODELS
 # ============================================================================
 
+# Long text columns use CompressedText. With COLUMN_COMPRESSION=zstd, SQLite
+# stores values of COMPRESSION_MIN_BYTES or more as zstd frames, using the
+# trained dictionary from COMPRESSION_DIR when there is one (see COLUMN
+# COMPRESSION). Postgres keeps plain text and switches those columns to lz4
+# TOAST compression instead, so its full-text index keeps working.
+COLUMN_COMPRESSION = os.getenv('COLUMN_COMPRESSION', 'none')  # none or zstd (needs zstandard)
+COMPRESSION_DIR = os.getenv('COMPRESSION_DIR', os.path.join(app.instance_path, 'compression'))
+COMPRESSION_LEVEL = int(os.getenv('COMPRESSION_LEVEL', 3))
+COMPRESSION_MIN_BYTES = int(os.getenv('COMPRESSION_MIN_BYTES', 32))
+ZSTD_FRAME_MAGIC = b'\x28\xb5\x2f\xfd'
+
+
+class TextCodec:
+    """zstd codec for CompressedText values; each frame records the dictionary it was written with"""
+
+    def __init__(self, directory: str):
+        self.directory = directory
+        self._dictionaries = {}
+        self._current_id = None
+        self._lock = threading.Lock()
+        self._local = threading.local()  # zstd contexts aren't thread-safe
+
+    def current_dictionary_id(self) -> int:
+        """Dictionary new values are written with; 0 until one is trained"""
+        if self._current_id is None:
+            path = os.path.join(self.directory, 'current')
+            if os.path.exists(path):
+                with open(path) as f:
+                    self._current_id = int(f.read().strip())
+            else:
+                self._current_id = 0
+        return self._current_id
+
+    def reload(self):
+        self._current_id = None
+
+    def _dictionary(self, dict_id: int):
+        import zstandard
+        with self._lock:
+            if dict_id not in self._dictionaries:
+                with open(os.path.join(self.directory, f'{dict_id}.zdict'), 'rb') as f:
+                    self._dictionaries[dict_id] = zstandard.ZstdCompressionDict(f.read())
+            return self._dictionaries[dict_id]
+
+    def _context(self, kind: str, dict_id: int):
+        import zstandard
+        contexts = self._local.__dict__.setdefault(kind, {})
+        if dict_id not in contexts:
+            dictionary = self._dictionary(dict_id) if dict_id else None
+            if kind == 'compress':
+                contexts[dict_id] = zstandard.ZstdCompressor(level=COMPRESSION_LEVEL, dict_data=dictionary)
+            else:
+                contexts[dict_id] = zstandard.ZstdDecompressor(dict_data=dictionary)
+        return contexts[dict_id]
+
+    def encode(self, value: str):
+        """zstd frame for the value, or the value itself when compressing doesn't pay"""
+        data = value.encode('utf-8')
+        if len(data) < COMPRESSION_MIN_BYTES:
+            return value
+        compressed = self._context('compress', self.current_dictionary_id()).compress(data)
+        return compressed if len(compressed) < len(data) else value
+
+    def frame_dictionary_id(self, value) -> Optional[int]:
+        """Dictionary id of a stored zstd frame; None for plain values"""
+        if isinstance(value, str) or bytes(value[:4]) != ZSTD_FRAME_MAGIC:
+            return None
+        import zstandard
+        return zstandard.get_frame_parameters(bytes(value)).dict_id
+
+    def decode(self, value) -> str:
+        if isinstance(value, str):
+            return value
+        dict_id = self.frame_dictionary_id(value)
+        if dict_id is None:
+            return bytes(value).decode('utf-8')
+        return self._context('decompress', dict_id).decompress(bytes(value)).decode('utf-8')
+
+
+text_codec = TextCodec(COMPRESSION_DIR)
+
+
+class CompressedText(TypeDecorator):
+    """Text that SQLite stores zstd-compressed when COLUMN_COMPRESSION=zstd.
+
+    Reads always return str, so rows written before compression was switched
+    on (or after it was switched off) stay readable; recompress-columns
+    rewrites them.
+    """
+    impl = db.Text
+    cache_ok = True
+
+    def process_bind_param(self, value, dialect):
+        if value is None or COLUMN_COMPRESSION != 'zstd' or dialect.name != 'sqlite':
+            return value
+        return text_codec.encode(value)
+
+    def process_result_value(self, value, dialect):
+        return value if value is None else text_codec.decode(value)
+
+
+@event.listens_for(Engine, 'connect')
+def register_sqlite_functions(dbapi_connection, connection_record):
+    """text_value(column) decodes CompressedText inside SQLite, for the search index triggers"""
+    if isinstance(dbapi_connection, sqlite3.Connection):
+        dbapi_connection.create_function(
+            'text_value', 1, lambda value: value if value is None else text_codec.decode(value), deterministic=True
+        )
+
+
 class Order(db.Model):
     """Order model for tracking customer orders"""
     __tablename__ = 'orders'
     
     id = db.Column(db.Integer, primary_key=True)
+    tenant_id = db.Column(db.String(64), nullable=False, default=lambda: current_tenant_id(), index=True)
     customer_name = db.Column(db.String(100), nullable=False)
     customer_email = db.Column(db.String(120))
     customer_phone = db.Column(db.String(20))
     items = db.Column(db.Text, nullable=False)  # JSON string
-    special_requests = db.Column(db.Text)
+    special_requests = db.Column(CompressedText)
     total_price = db.Column(db.Float, nullable=False)
-    status = db.Column(db.String(50), default='pending')  # pending, confirmed, preparing, ready, delivered
+    status = db.Column(db.String(50), default='pending')  # pending, confirmed, preparing, ready, delivered, cancelled
     session_id = db.Column(db.String(100))
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
@@ -103,6 +283,7 @@ class Reservation(db.Model):
     __tablename__ = 'reservations'
     
     id = db.Column(db.Integer, primary_key=True)
+    tenant_id = db.Column(db.String(64), nullable=False, default=lambda: current_tenant_id(), index=True)
     customer_name = db.Column(db.String(100), nullable=False)
     email = db.Column(db.String(120), nullable=False)
     phone = db.Column(db.String(20), nullable=False)
@@ -131,13 +312,17 @@ class Reservation(db.Model):
 class Conversation(db.Model):
     """Conversation history model"""
     __tablename__ = 'conversations'
+    __table_args__ = (
+        db.Index('ix_conversations_tenant_session', 'tenant_id', 'session_id', 'timestamp'),
+    )
     
     id = db.Column(db.Integer, primary_key=True)
+    tenant_id = db.Column(db.String(64), nullable=False, default=lambda: current_tenant_id())
     session_id = db.Column(db.String(100), nullable=False, index=True)
-    user_message = db.Column(db.Text, nullable=False)
-    bot_response = db.Column(db.Text, nullable=False)
+    user_message = db.Column(CompressedText, nullable=False)
+    bot_response = db.Column(CompressedText, nullable=False)
     message_type = db.Column(db.String(50))  # text, order, reservation, recommendation
-    timestamp = db.Column(db.DateTime, default=datetime.utcnow)
+    timestamp = db.Column(db.DateTime, default=datetime.utcnow, index=True)
     
     def to_dict(self):
         return {
@@ -154,12 +339,17 @@ class UserSession(db.Model):
     """Session tracking for analytics"""
     __tablename__ = 'user_sessions'
     
+    __table_args__ = (
+        db.Index('uq_user_sessions_tenant_session', 'tenant_id', 'session_id', unique=True),
+    )
+
     id = db.Column(db.Integer, primary_key=True)
-    session_id = db.Column(db.String(100), unique=True, nullable=False)
+    tenant_id = db.Column(db.String(64), nullable=False, default=lambda: current_tenant_id(), index=True)
+    session_id = db.Column(db.String(100), nullable=False)
     user_agent = db.Column(db.String(500))
     ip_address = db.Column(db.String(50))
     started_at = db.Column(db.DateTime, default=datetime.utcnow)
-    last_activity = db.Column(db.DateTime, default=datetime.utcnow)
+    last_activity = db.Column(db.DateTime, default=datetime.utcnow, index=True)
     total_messages = db.Column(db.Integer, default=0)
     
     def to_dict(self):
@@ -170,6 +360,130 @@ class UserSession(db.Model):
         }
 
 
+class HourlyRevenue(db.Model):
+    """Per-hour order count and revenue rollup"""
+    __tablename__ = 'rollup_hourly_revenue'
+    
+    tenant_id = db.Column(db.String(64), primary_key=True, default=lambda: current_tenant_id())
+    hour = db.Column(db.DateTime, primary_key=True)
+    order_count = db.Column(db.Integer, nullable=False, default=0)
+    revenue = db.Column(db.Float, nullable=False, default=0.0)
+    
+    def to_dict(self):
+        return {
+            'hour': self.hour.isoformat(),
+            'order_count': self.order_count,
+            'revenue': round(self.revenue, 2)
+        }
+
+
+class ItemDailyCount(db.Model):
+    """Per-day quantity and revenue rollup for each ordered item"""
+    __tablename__ = 'rollup_item_daily'
+    
+    tenant_id = db.Column(db.String(64), primary_key=True, default=lambda: current_tenant_id())
+    day = db.Column(db.Date, primary_key=True)
+    item_key = db.Column(db.String(100), primary_key=True)  # menu id, or name for free-form items
+    item_name = db.Column(db.String(100))
+    quantity = db.Column(db.Integer, nullable=False, default=0)
+    revenue = db.Column(db.Float, nullable=False, default=0.0)
+
+
+class SessionRollup(db.Model):
+    """Per-session message and order counts"""
+    __tablename__ = 'rollup_sessions'
+    
+    tenant_id = db.Column(db.String(64), primary_key=True, default=lambda: current_tenant_id())
+    session_id = db.Column(db.String(100), primary_key=True)
+    first_seen = db.Column(db.Date, nullable=False)
+    message_count = db.Column(db.Integer, nullable=False, default=0)
+    order_count = db.Column(db.Integer, nullable=False, default=0)
+
+
+class ConversionDaily(db.Model):
+    """Sessions started per day and how many of them went on to order"""
+    __tablename__ = 'rollup_conversion_daily'
+    
+    tenant_id = db.Column(db.String(64), primary_key=True, default=lambda: current_tenant_id())
+    day = db.Column(db.Date, primary_key=True)
+    sessions_started = db.Column(db.Integer, nullable=False, default=0)
+    sessions_converted = db.Column(db.Integer, nullable=False, default=0)
+    
+    def to_dict(self):
+        return {
+            'day': self.day.isoformat(),
+            'sessions_started': self.sessions_started,
+            'sessions_converted': self.sessions_converted
+        }
+
+
+class RollupState(db.Model):
+    """High-water marks (last processed source id) for the rollup job"""
+    __tablename__ = 'rollup_state'
+    
+    name = db.Column(db.String(50), primary_key=True)
+    high_water_mark = db.Column(db.Integer, nullable=False, default=0)
+
+
+class IdempotencyRecord(db.Model):
+    """Idempotency keys shared by all workers when there is no Redis"""
+    __tablename__ = 'idempotency_records'
+
+    key = db.Column(db.String(500), primary_key=True)
+    record = db.Column(db.Text)  # stored response as JSON; NULL while the first request runs
+    locked_until = db.Column(db.DateTime, nullable=False)  # pending marker, extended while the request runs
+    expires_at = db.Column(db.DateTime, nullable=False, index=True)
+
+
+class PrecomputedAnswer(db.Model):
+    """Answers generated ahead of time for the most frequent chat questions"""
+    __tablename__ = 'precomputed_answers'
+    __table_args__ = (
+        db.UniqueConstraint('content_version', 'question_key', name='uq_precomputed_answer_version_key'),
+    )
+    
+    id = db.Column(db.Integer, primary_key=True)
+    tenant_id = db.Column(db.String(64), nullable=False, default=lambda: current_tenant_id(), index=True)
+    content_version = db.Column(db.String(16), nullable=False, index=True)  # hash of the system prompt and menu
+    question_key = db.Column(db.String(300), nullable=False)  # normalized cluster key
+    question = db.Column(db.Text, nullable=False)  # most common phrasing in the cluster
+    answer = db.Column(db.Text, nullable=False)
+    occurrences = db.Column(db.Integer, nullable=False, default=0)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'content_version': self.content_version,
+            'question': self.question,
+            'answer': self.answer,
+            'occurrences': self.occurrences,
+            'created_at': self.created_at.isoformat()
+        }
+
+
+class TokenUsage(db.Model):
+    """LLM token usage per session per day"""
+    __tablename__ = 'token_usage'
+    
+    day = db.Column(db.Date, primary_key=True)
+    tenant_id = db.Column(db.String(64), primary_key=True, default=lambda: current_tenant_id())
+    session_id = db.Column(db.String(100), primary_key=True)
+    ip_address = db.Column(db.String(50))
+    calls = db.Column(db.Integer, nullable=False, default=0)
+    prompt_tokens = db.Column(db.Integer, nullable=False, default=0)
+    completion_tokens = db.Column(db.Integer, nullable=False, default=0)
+    
+    def to_dict(self):
+        return {
+            'day': self.day.isoformat(),
+            'session_id': self.session_id,
+            'calls': self.calls,
+            'prompt_tokens': self.prompt_tokens,
+            'completion_tokens': self.completion_tokens
+        }
+
+
 # ============================================================================
 # RESTAURANT DATA & SYSTEM PROMPT
 # ============================================================================
@@ -218,54 +532,36 @@ RESTAURANT_CONFIG = {
     }
 }
 
-SYSTEM_PROMPT = f"""You are a professional AI assistant for {RESTAURANT_CONFIG['name']}, a fine dining restaurant.
+def build_system_prompt(config: Dict) -> str:
+    """System prompt for a restaurant config: details, hours, the menu and guidelines"""
+    prompt = f"""You are a professional AI assistant for {config['name']}, a fine dining restaurant.
 
 RESTAURANT DETAILS:
-- Name: {RESTAURANT_CONFIG['name']}
-- Location: {RESTAURANT_CONFIG['location']}
-- Phone: {RESTAURANT_CONFIG['phone']}
-- Email: {RESTAURANT_CONFIG['email']}
-- Website: {RESTAURANT_CONFIG['website']}
+- Name: {config['name']}
+- Location: {config['location']}
+- Phone: {config['phone']}
+- Email: {config['email']}
+- Website: {config['website']}
 
 HOURS OF OPERATION:
-- Monday to Thursday: {RESTAURANT_CONFIG['hours']['monday_thursday']}
-- Friday to Saturday: {RESTAURANT_CONFIG['hours']['friday_saturday']}
-- Sunday: {RESTAURANT_CONFIG['hours']['sunday']}
+- Monday to Thursday: {config['hours']['monday_thursday']}
+- Friday to Saturday: {config['hours']['friday_saturday']}
+- Sunday: {config['hours']['sunday']}
 
 MENU CATEGORIES:
-
-APPETIZERS:
 """
 
-for item in RESTAURANT_CONFIG['menu']['appetizers']:
-    dietary = []
-    if item.get('vegan'): dietary.append('Vegan')
-    elif item.get('vegetarian'): dietary.append('Vegetarian')
-    dietary_str = f" ({', '.join(dietary)})" if dietary else ""
-    SYSTEM_PROMPT += f"- {item['name']} (${item['price']:.2f}){dietary_str}: {item['description']}\n"
-
-SYSTEM_PROMPT += "\nMAIN COURSES:\n"
-for item in RESTAURANT_CONFIG['menu']['main_courses']:
-    dietary = []
-    if item.get('vegan'): dietary.append('Vegan')
-    elif item.get('vegetarian'): dietary.append('Vegetarian')
-    if item.get('spicy'): dietary.append('Spicy')
-    dietary_str = f" ({', '.join(dietary)})" if dietary else ""
-    SYSTEM_PROMPT += f"- {item['name']} (${item['price']:.2f}){dietary_str}: {item['description']}\n"
-
-SYSTEM_PROMPT += "\nDESSERTS:\n"
-for item in RESTAURANT_CONFIG['menu']['desserts']:
-    dietary = []
-    if item.get('vegan'): dietary.append('Vegan')
-    elif item.get('vegetarian'): dietary.append('Vegetarian')
-    dietary_str = f" ({', '.join(dietary)})" if dietary else ""
-    SYSTEM_PROMPT += f"- {item['name']} (${item['price']:.2f}){dietary_str}: {item['description']}\n"
-
-SYSTEM_PROMPT += "\nBEVERAGES:\n"
-for item in RESTAURANT_CONFIG['menu']['beverages']:
-    SYSTEM_PROMPT += f"- {item['name']} (${item['price']:.2f}): {item['description']}\n"
-
-SYSTEM_PROMPT += f"""
+    for category, items in config['menu'].items():
+        prompt += f"\n{category.replace('_', ' ').upper()}:\n"
+        for item in items:
+            dietary = []
+            if item.get('vegan'): dietary.append('Vegan')
+            elif item.get('vegetarian'): dietary.append('Vegetarian')
+            if item.get('spicy'): dietary.append('Spicy')
+            dietary_str = f" ({', '.join(dietary)})" if dietary else ""
+            prompt += f"- {item['name']} (${item['price']:.2f}){dietary_str}: {item['description']}\n"
+
+    prompt += f"""
 
 YOUR RESPONSIBILITIES:
 1. Provide friendly, natural conversation with customers
@@ -292,6 +588,270 @@ RESPONSE STYLE:
 - Conversational and engaging
 - Respectful of dietary choices
 """
+    return prompt
+
+
+SYSTEM_PROMPT = build_system_prompt(RESTAURANT_CONFIG)
+
+
+# ============================================================================
+# TENANCY
+# ============================================================================
+
+# Each restaurant (tenant) has its own config, prompt and menu. The built-in
+# RESTAURANT_CONFIG is the default tenant; others are JSON files of the same
+# shape in TENANTS_DIR, named <tenant_id>.json, optionally listing the
+# "hosts" they are served on.
+DEFAULT_TENANT = os.getenv('DEFAULT_TENANT', 'default')
+TENANTS_DIR = os.getenv('TENANTS_DIR', os.path.join(app.instance_path, 'tenants'))
+TENANT_CACHE_SIZE = int(os.getenv('TENANT_CACHE_SIZE', 256))
+TENANT_HOSTS_REFRESH_SECONDS = int(os.getenv('TENANT_HOSTS_REFRESH_SECONDS', 60))
+TENANT_HEADER = 'X-Tenant-ID'
+TENANT_ID_RE = re.compile(r'^[a-z0-9][a-z0-9_-]{0,63}$')
+
+if not TENANT_ID_RE.match(DEFAULT_TENANT):
+    raise ValueError(f"Invalid DEFAULT_TENANT '{DEFAULT_TENANT}'")
+
+
+class Tenant:
+    """A restaurant served by this deployment"""
+
+    def __init__(self, tenant_id: str, config: Dict):
+        self.id = tenant_id
+        self.config = config
+        self.system_prompt = build_system_prompt(config)
+        # Everything a precomputed answer depends on (prompt, menu, hours)
+        self.content_version = hashlib.sha256(self.system_prompt.encode('utf-8')).hexdigest()[:16]
+        self._menu_index = None
+        self._price_index = None
+
+    @property
+    def menu_index(self) -> Dict:
+        if self._menu_index is None:
+            self._menu_index = build_menu_index(self.config)
+        return self._menu_index
+
+    @property
+    def price_index(self) -> Dict:
+        if self._price_index is None:
+            self._price_index = build_price_index(self.config)
+        return self._price_index
+
+
+class TenantRegistry:
+    """Tenants loaded on demand and kept in an LRU, so cold tenants fall out"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._tenants: 'OrderedDict[str, Tenant]' = OrderedDict()
+        self._default = None
+        self._hosts: Dict[str, str] = {}
+        self._hosts_loaded_at = 0.0
+
+    @property
+    def default(self) -> Tenant:
+        if self._default is None:
+            self._default = Tenant(DEFAULT_TENANT, RESTAURANT_CONFIG)
+        return self._default
+
+    def _config_path(self, tenant_id: str) -> str:
+        return os.path.join(TENANTS_DIR, f'{tenant_id}.json')
+
+    def get(self, tenant_id: str) -> Optional[Tenant]:
+        """The tenant with this id, or None if it isn't configured"""
+        if tenant_id == DEFAULT_TENANT:
+            return self.default
+        with self._lock:
+            tenant = self._tenants.get(tenant_id)
+            if tenant is not None:
+                self._tenants.move_to_end(tenant_id)
+                return tenant
+
+        if not TENANT_ID_RE.match(tenant_id) or not os.path.exists(self._config_path(tenant_id)):
+            return None
+        with open(self._config_path(tenant_id), encoding='utf-8') as f:
+            tenant = Tenant(tenant_id, json.load(f))
+
+        with self._lock:
+            self._tenants[tenant_id] = tenant
+            self._tenants.move_to_end(tenant_id)
+            while len(self._tenants) > TENANT_CACHE_SIZE:
+                self._tenants.popitem(last=False)
+        return tenant
+
+    def invalidate(self, tenant_id: Optional[str] = None):
+        """Drop cached tenants (all of them by default) after their config changed"""
+        with self._lock:
+            if tenant_id is None:
+                self._tenants.clear()
+                self._hosts_loaded_at = 0.0
+            else:
+                self._tenants.pop(tenant_id, None)
+
+    def tenant_for_host(self, host: str) -> Optional[str]:
+        """Tenant id for a request host: a listed host, else a subdomain named after the tenant"""
+        if time.time() - self._hosts_loaded_at > TENANT_HOSTS_REFRESH_SECONDS:
+            hosts = {}
+            if os.path.isdir(TENANTS_DIR):
+                for filename in os.listdir(TENANTS_DIR):
+                    if not filename.endswith('.json'):
+                        continue
+                    try:
+                        with open(os.path.join(TENANTS_DIR, filename), encoding='utf-8') as f:
+                            for listed_host in json.load(f).get('hosts', []):
+                                hosts[listed_host.lower()] = filename[:-len('.json')]
+                    except (OSError, ValueError) as e:
+                        logger.error(f"Tenant config error in {filename}: {e}")
+            self._hosts, self._hosts_loaded_at = hosts, time.time()
+
+        if host in self._hosts:
+            return self._hosts[host]
+        label = host.split('.', 1)[0]
+        if '.' in host and TENANT_ID_RE.match(label) and os.path.exists(self._config_path(label)):
+            return label
+        return None
+
+
+tenants = TenantRegistry()
+
+
+def current_tenant() -> Tenant:
+    """Tenant of the current request; the default tenant outside requests"""
+    if has_app_context():
+        tenant = g.get('tenant')
+        if tenant is not None:
+            return tenant
+    return tenants.default
+
+
+def current_tenant_id() -> str:
+    return current_tenant().id
+
+
+def select_tenant() -> Optional[Tuple[Dict, int]]:
+    """Resolve the request's tenant from the X-Tenant-ID header or the host.
+
+    Returns an error (body, status) for an unknown tenant.
+    """
+    tenant_id = request.headers.get(TENANT_HEADER, '').strip().lower()
+    if not tenant_id:
+        tenant_id = tenants.tenant_for_host(request.host.split(':', 1)[0].lower()) or DEFAULT_TENANT
+    tenant = tenants.get(tenant_id)
+    if tenant is None:
+        return {'error': f"Unknown restaurant '{tenant_id}'"}, 404
+    g.tenant = tenant
+    return None
+
+
+@app.before_request
+def load_tenant():
+    error = select_tenant()
+    if error is not None:
+        return jsonify(error[0]), error[1]
+    return None
+
+
+TENANT_MODELS = ('Order', 'Reservation', 'Conversation', 'UserSession', 'PrecomputedAnswer')
+# tenant_id is part of these tables' primary keys, which can't be altered in
+# place. Rollups are rebuilt from the source rows; token usage is copied over.
+ROLLUP_MODELS = ('HourlyRevenue', 'ItemDailyCount', 'SessionRollup', 'ConversionDaily')
+
+
+def migrate_tenant_columns():
+    """Add tenant_id to tables created before tenancy; existing rows join the default tenant"""
+    inspector = sqlalchemy_inspect(db.engine)
+    for name in TENANT_MODELS:
+        table = globals()[name].__table__
+        if 'tenant_id' in {column['name'] for column in inspector.get_columns(table.name)}:
+            continue
+        try:
+            with db.engine.begin() as conn:
+                conn.execute(text(
+                    f"ALTER TABLE {table.name} ADD COLUMN tenant_id VARCHAR(64) NOT NULL DEFAULT '{DEFAULT_TENANT}'"
+                ))
+                for index in table.indexes:
+                    if 'tenant_id' in index.columns:
+                        index.create(conn, checkfirst=True)
+            logger.info(f"Added tenant_id to {table.name}")
+        except DatabaseError as e:
+            # Another worker migrated the table first
+            logger.info(f"Skipped tenant_id migration for {table.name}: {e}")
+    migrate_session_uniqueness()
+    migrate_tenant_keys()
+
+
+def _rebuild_table(conn, table, copy: bool):
+    """Recreate a table from its model, copying rows (into the default tenant) when asked"""
+    create = str(CreateTable(table).compile(dialect=db.engine.dialect))
+    conn.execute(text(create.replace(f'CREATE TABLE {table.name} ', f'CREATE TABLE {table.name}_new ', 1)))
+    if copy:
+        existing = {column['name'] for column in sqlalchemy_inspect(conn).get_columns(table.name)}
+        columns = ', '.join(column.name for column in table.columns if column.name in existing)
+        conn.execute(text(
+            f"INSERT INTO {table.name}_new (tenant_id, {columns}) "
+            f"SELECT '{DEFAULT_TENANT}', {columns} FROM {table.name}"
+        ))
+    conn.execute(text(f"DROP TABLE {table.name}"))
+    conn.execute(text(f"ALTER TABLE {table.name}_new RENAME TO {table.name}"))
+    for index in table.indexes:
+        index.create(conn, checkfirst=True)
+
+
+def migrate_tenant_keys():
+    """Add tenant_id to the primary keys of the rollup and token usage tables"""
+    inspector = sqlalchemy_inspect(db.engine)
+
+    def untenanted(table) -> bool:
+        return 'tenant_id' not in {column['name'] for column in inspector.get_columns(table.name)}
+
+    rollups = [globals()[name].__table__ for name in ROLLUP_MODELS]
+    try:
+        if any(untenanted(table) for table in rollups):
+            # The old rollups mix every tenant's rows; count everything again
+            with db.engine.begin() as conn:
+                for table in rollups:
+                    _rebuild_table(conn, table, copy=False)
+                conn.execute(RollupState.__table__.delete())
+            logger.info("Rebuilt the analytics rollup tables per tenant; the rollup job recounts them")
+        if untenanted(TokenUsage.__table__):
+            with db.engine.begin() as conn:
+                _rebuild_table(conn, TokenUsage.__table__, copy=True)
+            logger.info("Added tenant_id to token_usage")
+    except DatabaseError as e:
+        # Another worker migrated the tables first
+        logger.info(f"Skipped tenant key migration: {e}")
+
+
+def migrate_session_uniqueness():
+    """Replace the pre-tenancy UNIQUE(session_id) on user_sessions with UNIQUE(tenant_id, session_id)"""
+    inspector = sqlalchemy_inspect(db.engine)  # fresh, after the tenant_id columns were added
+    table = UserSession.__table__
+    constraints = [c for c in inspector.get_unique_constraints(table.name) if c['column_names'] == ['session_id']]
+    indexes = [i for i in inspector.get_indexes(table.name) if i['unique'] and i['column_names'] == ['session_id']]
+    if not constraints and not indexes:
+        return
+    try:
+        with db.engine.begin() as conn:
+            if db.engine.dialect.name == 'sqlite':
+                # SQLite can't drop an inline constraint, so rebuild the table
+                columns = ', '.join(
+                    column['name'] for column in inspector.get_columns(table.name) if column['name'] in table.c
+                )
+                create = str(CreateTable(table).compile(dialect=db.engine.dialect))
+                conn.execute(text(create.replace(f'CREATE TABLE {table.name} ', f'CREATE TABLE {table.name}_new ', 1)))
+                conn.execute(text(f"INSERT INTO {table.name}_new ({columns}) SELECT {columns} FROM {table.name}"))
+                conn.execute(text(f"DROP TABLE {table.name}"))
+                conn.execute(text(f"ALTER TABLE {table.name}_new RENAME TO {table.name}"))
+            else:
+                for constraint in constraints:
+                    conn.execute(text(f'ALTER TABLE {table.name} DROP CONSTRAINT "{constraint["name"]}"'))
+                for index in indexes:
+                    conn.execute(text(f'DROP INDEX "{index["name"]}"'))
+            for index in table.indexes:
+                index.create(conn, checkfirst=True)
+        logger.info(f"Made {table.name}.session_id unique per tenant")
+    except DatabaseError as e:
+        logger.info(f"Skipped session uniqueness migration for {table.name}: {e}")
 
 # ============================================================================
 # UTILITY FUNCTIONS
@@ -311,17 +871,59 @@ def validate_phone(phone: str) -> bool:
     return re.match(pattern, phone) is not None
 
 
+def bearer_token_matches(key: Optional[str]) -> bool:
+    """True if the request sends `Authorization: Bearer <key>`; False when no key is configured"""
+    if not key:
+        return False
+    sent = request.headers.get('Authorization', '').encode('utf-8')
+    return hmac.compare_digest(sent, f'Bearer {key}'.encode('utf-8'))
+
+
+# Peers (IPs or CIDR ranges) allowed to report the client address in CF-Connecting-IP,
+# e.g. the local reverse proxy in front of the app. From anyone else the header is ignored.
+TRUSTED_PROXIES = [
+    ipaddress.ip_network(value.strip(), strict=False)
+    for value in os.getenv('TRUSTED_PROXIES', '').split(',') if value.strip()
+]
+
+
+def _is_trusted_proxy(address: Optional[str]) -> bool:
+    try:
+        peer = ipaddress.ip_address(address)
+    except (TypeError, ValueError):
+        return False
+    return any(peer in network for network in TRUSTED_PROXIES)
+
+
 def get_client_ip() -> str:
-    """Get client IP address"""
-    if request.environ.get('HTTP_CF_CONNECTING_IP'):
-        return request.environ['HTTP_CF_CONNECTING_IP']
+    """Client IP address; CF-Connecting-IP is honoured only from a trusted proxy"""
+    forwarded = request.environ.get('HTTP_CF_CONNECTING_IP')
+    if forwarded and _is_trusted_proxy(request.remote_addr):
+        return forwarded.strip()
     return request.remote_addr
 
 
+def request_session_id() -> Optional[str]:
+    """Chat session id from the URL, query string or JSON body, if the request has one"""
+    session_id = (request.view_args or {}).get('session_id') or request.args.get('session_id')
+    if not session_id and request.is_json:
+        body = request.get_json(silent=True)
+        session_id = body.get('session_id') if isinstance(body, dict) else None
+    return str(session_id) if session_id else None
+
+
+def hit_session_limit(session_id: str) -> bool:
+    """Charge session_limit for a message outside its session's own request
+    (a /api/chat/batch item); False when the session is over its limit"""
+    if not limiter.enabled:
+        return True
+    return all([limiter.limiter.hit(item, f'session:{session_id}', 'session') for item in parse_many(SESSION_RATE_LIMIT)])
+
+
 def track_session(session_id: str, message_count: int = 1):
     """Track user session"""
     try:
-        session_record = UserSession.query.filter_by(session_id=session_id).first()
+        session_record = UserSession.query.filter_by(tenant_id=current_tenant_id(), session_id=session_id).first()
         if session_record:
             session_record.last_activity = datetime.utcnow()
             session_record.total_messages += message_count
@@ -338,6 +940,64 @@ def track_session(session_id: str, message_count: int = 1):
         logger.error(f"Error tracking session: {e}")
 
 
+def track_sessions(message_counts: Dict[str, int]):
+    """Bulk track_session for a batch of messages; the caller commits"""
+    existing = {
+        record.session_id: record
+        for record in UserSession.query.filter(
+            UserSession.tenant_id == current_tenant_id(), UserSession.session_id.in_(list(message_counts))
+        )
+    }
+    for session_id, count in message_counts.items():
+        session_record = existing.get(session_id)
+        if session_record:
+            session_record.last_activity = datetime.utcnow()
+            session_record.total_messages += count
+        else:
+            db.session.add(UserSession(
+                session_id=session_id,
+                user_agent=request.headers.get('User-Agent', ''),
+                ip_address=get_client_ip(),
+                total_messages=count
+            ))
+
+
+_redis_client = None
+
+
+def get_redis():
+    """Shared Redis client when REDIS_URL is set, otherwise None"""
+    global _redis_client
+    if _redis_client is None and os.getenv('REDIS_URL'):
+        import redis
+        _redis_client = redis.Redis.from_url(os.getenv('REDIS_URL'), socket_timeout=0.5)
+    return _redis_client
+
+
+class ProcessLock:
+    """Non-blocking cross-process file lock for background jobs.
+
+    `with ProcessLock('name') as acquired:` yields False when another worker
+    or CLI run already holds the lock.
+    """
+
+    def __init__(self, name: str):
+        self.path = os.path.join(app.instance_path, f'{name}.lock')
+
+    def __enter__(self):
+        import fcntl
+        os.makedirs(app.instance_path, exist_ok=True)
+        self._file = open(self.path, 'w')
+        try:
+            fcntl.flock(self._file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            return True
+        except OSError:
+            return False
+
+    def __exit__(self, *exc):
+        self._file.close()
+
+
 def detect_order_intent(message: str) -> bool:
     """Detect if user wants to place an order"""
     order_keywords = ['order', 'place an order', 'i want', 'can i have', 'give me', 'get me', 'buy', 'purchase']
@@ -350,20 +1010,33 @@ def detect_reservation_intent(message: str) -> bool:
     return any(keyword in message.lower() for keyword in reservation_keywords)
 
 
+def build_menu_index(config: Dict) -> Dict:
+    """Flatten a menu into lookup structures shared by the order flows"""
+    items = []
+    for category, category_items in config['menu'].items():
+        if isinstance(category_items, list):
+            items.extend(category_items)
+
+    return {
+        'items': items,
+        'by_id': {item['id']: item for item in items},
+        'names': [(item['name'].lower(), item) for item in items]
+    }
+
+
+def get_menu_index() -> Dict:
+    """Menu index of the current tenant, built on first use"""
+    return current_tenant().menu_index
+
+
 def extract_order_items_from_message(message: str) -> List[Dict]:
     """Extract menu items mentioned in user message"""
     items = []
-    menu_flat = []
-    
-    # Flatten all menu items
-    for category, category_items in RESTAURANT_CONFIG['menu'].items():
-        if isinstance(category_items, list):
-            menu_flat.extend(category_items)
     
     # Check which items are mentioned
     message_lower = message.lower()
-    for item in menu_flat:
-        if item['name'].lower() in message_lower:
+    for name_lower, item in get_menu_index()['names']:
+        if name_lower in message_lower:
             items.append({
                 'id': item['id'],
                 'name': item['name'],
@@ -381,6 +1054,7 @@ def process_order_intent_step(message: str, session_id: str = 'anonymous', step:
 
     response_text = ""
     next_step = step
+    order_created = False
 
     try:
         if step == 0:  # Collect items
@@ -414,10 +1088,14 @@ def process_order_intent_step(message: str, session_id: str = 'anonymous', step:
                 next_step = 3
             else:
                 collected_data['customer_phone'] = message
-                items_summary = ', '.join([f"{item['quantity']}x {item['name']}" for item in collected_data.get('items', [])])
-                total = sum(item['price'] * item['quantity'] for item in collected_data.get('items', []))
-                response_text = f"Perfect! Here's your order summary:\n{items_summary}\nTotal: ${total:.2f}\n\nAny special requests? (or just say 'no')"
-                next_step = 4
+                quote = quote_cart(collected_data.get('items'))
+                if quote['success']:
+                    items_summary = ', '.join([f"{item['quantity']}x {item['name']}" for item in quote['lines']])
+                    response_text = f"Perfect! Here's your order summary:\n{items_summary}\nTotal: ${quote['total']:.2f}\n\nAny special requests? (or just say 'no')"
+                    next_step = 4
+                else:
+                    response_text = "Sorry, I couldn't price those items. Which items would you like to order?"
+                    next_step = 0
 
         elif step == 4:  # Collect special requests and confirm
             if message.lower() not in ['no', 'none', 'skip']:
@@ -425,24 +1103,30 @@ def process_order_intent_step(message: str, session_id: str = 'anonymous', step:
             else:
                 collected_data['special_requests'] = ''
 
-            # Create the order
-            total_price = sum(item['price'] * item['quantity'] for item in collected_data.get('items', []))
-            order = Order(
-                customer_name=collected_data['customer_name'],
-                customer_email=collected_data.get('customer_email', ''),
-                customer_phone=collected_data.get('customer_phone', ''),
-                items=json.dumps(collected_data['items']),
-                special_requests=collected_data.get('special_requests', ''),
-                total_price=total_price,
-                status='confirmed',
-                session_id=session_id
-            )
-
-            db.session.add(order)
-            db.session.commit()
-
-            response_text = f"✅ Order #{order.id} Confirmed!\nTotal: ${total_price:.2f}\nThank you for your order!"
-            next_step = 0  # reset
+            # Create the order, priced from the menu rather than the client's collected_data
+            quote = quote_cart(collected_data.get('items'))
+            if not quote['success']:
+                response_text = "Sorry, I couldn't price those items. Which items would you like to order?"
+                next_step = 0
+            else:
+                total_price = quote['total']
+                order = Order(
+                    customer_name=collected_data['customer_name'],
+                    customer_email=collected_data.get('customer_email', ''),
+                    customer_phone=collected_data.get('customer_phone', ''),
+                    items=json.dumps(quote['lines']),
+                    special_requests=collected_data.get('special_requests', ''),
+                    total_price=total_price,
+                    status='confirmed',
+                    session_id=session_id
+                )
+
+                db.session.add(order)
+                db.session.commit()
+
+                response_text = f"✅ Order #{order.id} Confirmed!\nTotal: ${total_price:.2f}\nThank you for your order!"
+                next_step = 0  # reset
+                order_created = True
 
         # Store conversation
         conversation = Conversation(
@@ -454,6 +1138,10 @@ def process_order_intent_step(message: str, session_id: str = 'anonymous', step:
         db.session.add(conversation)
         db.session.commit()
 
+        if order_created:
+            refresh_analytics_rollups()
+            publish_order_event('order.created', order)
+
         return {
             'success': True,
             'response': response_text,
@@ -598,6 +1286,599 @@ def process_reservation_intent_step(message: str, session_id: str = 'anonymous',
         }
 
 
+CHAT_GENERATION_CONFIG = {
+    'temperature': 0.8,
+    'top_k': 40,
+    'top_p': 0.9,
+    'max_output_tokens': 300,
+    'safety_settings': [
+        {
+            "category": "HARM_CATEGORY_HARASSMENT",
+            "threshold": "BLOCK_MEDIUM_AND_ABOVE"
+        }
+    ]
+}
+
+
+def start_chat_turn(data: Optional[Dict], batch_rows: Optional[List] = None) -> Tuple[Dict, int, Optional[Dict]]:
+    """Handle the parts of a chat message that don't need the LLM.
+
+    Returns (body, status, pending). When `pending` is None the turn is
+    finished and `body`/`status` are the response. Otherwise the caller sends
+    `pending['prompt']` to the model and passes the reply to
+    finish_chat_turn(). Splitting the turn this way lets the sync view and
+    the ASGI server (asgi.py) share everything except the model call.
+
+    `batch_rows` is set by /api/chat/batch: Conversation rows are collected
+    there instead of committed, and session tracking is left to the batch.
+    """
+    if not data:
+        return {'error': 'No JSON data provided'}, 400, None
+
+    user_message = data.get('message', '').strip()
+    session_id = data.get('session_id', 'anonymous')
+
+    if not user_message:
+        return {'error': 'Message cannot be empty'}, 400, None
+
+    if len(user_message) > 1000:
+        return {'error': 'Message too long (max 1000 characters)'}, 400, None
+
+    # Track session
+    if batch_rows is None:
+        track_session(session_id)
+
+    # If client provided explicit step/collected_data for an intent flow, prefer that
+    step = data.get('step', None)
+    collected_data = data.get('collected_data', None)
+
+    # If this message indicates ordering/reserving intent (or client is continuing a step), handle here
+    if step is not None:
+        # client explicitly continuing a flow: check type param if provided, default to order if both match
+        intent_type = data.get('intent_type', None)  # 'order' or 'reservation'
+        if intent_type == 'reservation':
+            return process_reservation_intent_step(user_message, session_id=session_id, step=step, collected_data=collected_data), 200, None
+        # default to order processing
+        return process_order_intent_step(user_message, session_id=session_id, step=step, collected_data=collected_data), 200, None
+
+    # Automatic intent detection from the message
+    if detect_order_intent(user_message):
+        # start order flow (step 0)
+        return process_order_intent_step(user_message, session_id=session_id, step=0, collected_data={}), 200, None
+
+    if detect_reservation_intent(user_message):
+        # start reservation flow (step 0)
+        return process_reservation_intent_step(user_message, session_id=session_id, step=0, collected_data={}), 200, None
+
+    pending = {'session_id': session_id, 'user_message': user_message, 'ip_address': get_client_ip()}
+
+    # Frequent questions are answered ahead of time (see precompute_answers)
+    answer = lookup_precomputed_answer(user_message)
+    if answer is not None:
+        return finish_chat_turn(pending, answer, batch_rows=batch_rows), 200, None
+
+    # Sessions over their token budget get a templated answer or a 429
+    retry_after = check_token_budget(session_id, pending['ip_address'])
+    if retry_after:
+        answer = templated_answer(user_message)
+        if answer is not None:
+            return finish_chat_turn(pending, answer, batch_rows=batch_rows), 200, None
+        body, status = over_budget_response(retry_after)
+        return body, status, None
+
+    # Otherwise, proceed with Gemini as before (regular chat)
+    history = read_from_replica(
+        lambda: Conversation.query.filter_by(tenant_id=current_tenant_id(), session_id=session_id).order_by(
+            Conversation.timestamp.desc()
+        ).limit(5).all()
+    )[::-1]
+    if batch_rows:
+        # Earlier turns of this batch aren't written yet
+        history = (history + [row for row in batch_rows if row.session_id == session_id])[-5:]
+
+    context = "\n".join([
+        f"User: {c.user_message}\nAssistant: {c.bot_response}"
+        for c in history
+    ]) if history else ""
+
+    full_prompt = f"{current_tenant().system_prompt}\n"
+    if context:
+        full_prompt += f"\nPrevious conversation context:\n{context}\n"
+    full_prompt += f"\nUser: {user_message}"
+
+    pending['prompt'] = full_prompt
+    return {}, 200, pending
+
+
+def finish_chat_turn(pending: Dict, bot_message: str, usage=None, batch_rows: Optional[List] = None) -> Dict:
+    """Store the model's reply for a pending chat turn and build the response.
+
+    `usage` is the LLMResponse when the reply came from the model, so its
+    tokens are counted against the session's budget. With `batch_rows` the
+    Conversation row is appended there for a bulk write.
+    """
+    if usage is not None:
+        record_token_usage(pending['session_id'], pending.get('ip_address'),
+                           usage.prompt_tokens, usage.completion_tokens)
+
+    conversation = Conversation(
+        session_id=pending['session_id'],
+        user_message=pending['user_message'],
+        bot_response=bot_message,
+        message_type='text'
+    )
+    if batch_rows is not None:
+        conversation.timestamp = datetime.utcnow()  # keeps turn order through the bulk insert
+        batch_rows.append(conversation)
+    else:
+        db.session.add(conversation)
+        db.session.commit()
+
+    return {
+        'success': True,
+        'response': bot_message,
+        'session_id': pending['session_id'],
+        'timestamp': datetime.utcnow().isoformat()
+    }
+
+
+# ============================================================================
+# IDEMPOTENCY KEYS
+# ============================================================================
+
+IDEMPOTENCY_TTL_SECONDS = int(os.getenv('IDEMPOTENCY_TTL_SECONDS', 24 * 3600))
+# How long a duplicate waits for the original request before giving up with 409
+IDEMPOTENCY_WAIT_SECONDS = float(os.getenv('IDEMPOTENCY_WAIT_SECONDS', 10))
+# How long an in-progress marker outlives its last heartbeat, so a crashed request frees its key
+IDEMPOTENCY_PENDING_SECONDS = max(3, int(IDEMPOTENCY_WAIT_SECONDS * 3))
+
+
+class DatabaseIdempotencyStore:
+    """Key store in the database, so duplicates on different workers are serialized without Redis"""
+
+    def claim(self, key: str) -> Tuple[str, Optional[Dict]]:
+        """('new', None) for the first request, ('done', record) for repeats, ('busy', None) on timeout"""
+        deadline = time.monotonic() + IDEMPOTENCY_WAIT_SECONDS
+        while True:
+            now = datetime.utcnow()
+            try:
+                db.session.add(IdempotencyRecord(
+                    key=key,
+                    locked_until=now + timedelta(seconds=IDEMPOTENCY_PENDING_SECONDS),
+                    expires_at=now + timedelta(seconds=IDEMPOTENCY_TTL_SECONDS)
+                ))
+                db.session.commit()
+                if random.random() < 0.01:
+                    IdempotencyRecord.query.filter(IdempotencyRecord.expires_at < now).delete()
+                    db.session.commit()
+                return 'new', None
+            except DatabaseError:
+                db.session.rollback()
+
+            entry = db.session.query(
+                IdempotencyRecord.record, IdempotencyRecord.locked_until, IdempotencyRecord.expires_at
+            ).filter_by(key=key).first()
+            db.session.rollback()
+            if entry is not None and entry.expires_at < now:
+                IdempotencyRecord.query.filter_by(key=key, expires_at=entry.expires_at).delete()
+                db.session.commit()
+                continue
+            if entry is not None and entry.record is not None:
+                return 'done', json.loads(entry.record)
+            if entry is not None and entry.locked_until < now:
+                # The first request died without finishing; take the key over
+                taken = db.session.execute(
+                    update(IdempotencyRecord)
+                    .where(IdempotencyRecord.key == key, IdempotencyRecord.record.is_(None),
+                           IdempotencyRecord.locked_until == entry.locked_until)
+                    .values(locked_until=now + timedelta(seconds=IDEMPOTENCY_PENDING_SECONDS))
+                ).rowcount
+                db.session.commit()
+                if taken:
+                    return 'new', None
+            if time.monotonic() >= deadline:
+                return 'busy', None
+            time.sleep(0.05)
+
+    def extend(self, key: str):
+        with app.app_context():
+            db.session.execute(
+                update(IdempotencyRecord)
+                .where(IdempotencyRecord.key == key, IdempotencyRecord.record.is_(None))
+                .values(locked_until=datetime.utcnow() + timedelta(seconds=IDEMPOTENCY_PENDING_SECONDS))
+            )
+            db.session.commit()
+
+    def complete(self, key: str, record: Dict):
+        IdempotencyRecord.query.filter_by(key=key).update({
+            'record': json.dumps(record),
+            'expires_at': datetime.utcnow() + timedelta(seconds=IDEMPOTENCY_TTL_SECONDS)
+        })
+        db.session.commit()
+
+    def release(self, key: str):
+        db.session.rollback()
+        IdempotencyRecord.query.filter(IdempotencyRecord.key == key, IdempotencyRecord.record.is_(None)).delete()
+        db.session.commit()
+
+
+class RedisIdempotencyStore:
+    """Key store shared by all workers; duplicates poll until the original finishes"""
+
+    PENDING = b'pending'
+    # Extend the pending marker only while the key is still pending
+    EXTEND_SCRIPT = """
+if redis.call('GET', KEYS[1]) == ARGV[1] then
+    return redis.call('EXPIRE', KEYS[1], ARGV[2])
+end
+return 0
+"""
+
+    def __init__(self, client):
+        self._redis = client
+        self._extend = client.register_script(self.EXTEND_SCRIPT)
+
+    def claim(self, key: str) -> Tuple[str, Optional[Dict]]:
+        deadline = time.monotonic() + IDEMPOTENCY_WAIT_SECONDS
+        # The pending marker outlives a crashed request only briefly
+        if self._redis.set(key, self.PENDING, nx=True, ex=IDEMPOTENCY_PENDING_SECONDS):
+            return 'new', None
+        while True:
+            value = self._redis.get(key)
+            if value is None:
+                if self._redis.set(key, self.PENDING, nx=True, ex=IDEMPOTENCY_PENDING_SECONDS):
+                    return 'new', None
+            elif value != self.PENDING:
+                return 'done', json.loads(value)
+            if time.monotonic() >= deadline:
+                return 'busy', None
+            time.sleep(0.05)
+
+    def extend(self, key: str):
+        self._extend(keys=[key], args=[self.PENDING, IDEMPOTENCY_PENDING_SECONDS])
+
+    def complete(self, key: str, record: Dict):
+        self._redis.set(key, json.dumps(record), ex=IDEMPOTENCY_TTL_SECONDS)
+
+    def release(self, key: str):
+        self._redis.delete(key)
+
+
+_idempotency_store = None
+
+
+def get_idempotency_store():
+    global _idempotency_store
+    if _idempotency_store is None:
+        client = get_redis()
+        _idempotency_store = RedisIdempotencyStore(client) if client is not None else DatabaseIdempotencyStore()
+    return _idempotency_store
+
+
+def idempotent(view):
+    """Honour an Idempotency-Key header on a POST endpoint.
+
+    The first request with a key runs normally and its response (unless it
+    is a 5xx) is stored for IDEMPOTENCY_TTL_SECONDS. Repeats get the stored
+    response back, and concurrent duplicates wait for the first to finish.
+    Reusing a key with a different body is rejected with 422. Keys are scoped
+    to the client (its session id, or else its IP), and the in-progress
+    marker is kept alive for as long as the first request runs.
+    """
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        key = request.headers.get('Idempotency-Key', '').strip()
+        if not key:
+            return view(*args, **kwargs)
+        if len(key) > 255:
+            return jsonify({'success': False, 'error': 'Idempotency-Key must be at most 255 characters'}), 400
+
+        store = get_idempotency_store()
+        client = hashlib.sha256((request_session_id() or get_client_ip() or '').encode()).hexdigest()[:16]
+        store_key = f"idempotency:{current_tenant_id()}:{request.endpoint}:{client}:{key}"
+        fingerprint = hashlib.sha256(request.get_data()).hexdigest()
+        try:
+            state, record = store.claim(store_key)
+        except Exception as e:
+            logger.error(f"Idempotency store error: {e}")
+            return view(*args, **kwargs)
+
+        if state == 'busy':
+            return api_response({
+                'success': False,
+                'error': 'A request with this Idempotency-Key is still in progress',
+                'retry_after': 1
+            }, 409)
+        if state == 'done':
+            if record['fingerprint'] != fingerprint:
+                return jsonify({
+                    'success': False,
+                    'error': 'Idempotency-Key was already used for a different request'
+                }), 422
+            response = app.response_class(record['body'], status=record['status'], mimetype=record['mimetype'])
+            response.headers['Idempotent-Replayed'] = 'true'
+            return response
+
+        stop_heartbeat = threading.Event()
+
+        def heartbeat():
+            while not stop_heartbeat.wait(IDEMPOTENCY_PENDING_SECONDS / 3):
+                try:
+                    store.extend(store_key)
+                except Exception as e:
+                    logger.error(f"Idempotency heartbeat error: {e}")
+
+        threading.Thread(target=heartbeat, name='idempotency-heartbeat', daemon=True).start()
+        try:
+            response = app.make_response(view(*args, **kwargs))
+        except Exception:
+            store.release(store_key)
+            raise
+        finally:
+            stop_heartbeat.set()
+        if response.status_code >= 500:
+            store.release(store_key)  # let the client retry
+        else:
+            store.complete(store_key, {
+                'fingerprint': fingerprint,
+                'status': response.status_code,
+                'mimetype': response.mimetype,
+                'body': response.get_data(as_text=True)
+            })
+        return response
+
+    return wrapper
+
+
+# ============================================================================
+# READ REPLICA
+# ============================================================================
+
+# With REPLICA_DATABASE_URL set, read-only lookups wrapped in
+# read_from_replica() run on the replica. A client that wrote recently (same
+# session id or IP) keeps reading from the primary for REPLICA_STICKY_SECONDS,
+# which should exceed the replication lag; the markers are shared through
+# Redis when REDIS_URL is set. A replica that errors is skipped for
+# REPLICA_RETRY_SECONDS and the read is retried on the primary.
+REPLICA_ENABLED = bool(REPLICA_DATABASE_URL)
+REPLICA_STICKY_SECONDS = float(os.getenv('REPLICA_STICKY_SECONDS', 5))
+REPLICA_RETRY_SECONDS = float(os.getenv('REPLICA_RETRY_SECONDS', 30))
+REPLICA_STICKY_MAX_KEYS = int(os.getenv('REPLICA_STICKY_MAX_KEYS', 100000))
+
+_recent_writes: 'OrderedDict[str, float]' = OrderedDict()
+_recent_writes_lock = threading.Lock()
+_replica_down_until = 0.0
+
+
+def note_database_write():
+    if has_request_context():
+        g.db_wrote = True
+
+
+def _consistency_keys() -> List[str]:
+    """The identities whose recent writes this request must see: client IP and session id"""
+    tenant_id = current_tenant_id()
+    keys = [f'{tenant_id}:ip:{get_client_ip()}']
+    session_id = request_session_id()
+    if session_id:
+        keys.append(f'{tenant_id}:session:{session_id}')
+    return keys
+
+
+@app.after_request
+def remember_database_write(response):
+    """Pin the writing client to the primary for the stickiness window"""
+    if REPLICA_ENABLED and g.get('db_wrote'):
+        keys = _consistency_keys()
+        expires = time.monotonic() + REPLICA_STICKY_SECONDS
+        with _recent_writes_lock:
+            for key in keys:
+                _recent_writes[key] = expires
+                _recent_writes.move_to_end(key)
+            while len(_recent_writes) > REPLICA_STICKY_MAX_KEYS:
+                _recent_writes.popitem(last=False)
+
+        client = get_redis()
+        if client is not None:
+            try:
+                pipe = client.pipeline(transaction=False)
+                for key in keys:
+                    pipe.set(f'ryw:{key}', 1, px=int(REPLICA_STICKY_SECONDS * 1000))
+                pipe.execute()
+            except Exception as e:
+                logger.error(f"Error storing read-your-writes marker: {e}")
+    return response
+
+
+def _wrote_recently() -> bool:
+    keys = _consistency_keys()
+    now = time.monotonic()
+    with _recent_writes_lock:
+        if any(_recent_writes.get(key, 0) > now for key in keys):
+            return True
+
+    client = get_redis()
+    if client is None:
+        return False
+    try:
+        return client.exists(*[f'ryw:{key}' for key in keys]) > 0
+    except Exception as e:
+        logger.error(f"Error checking read-your-writes marker: {e}")
+        return True
+
+
+def replica_available() -> bool:
+    return REPLICA_ENABLED and time.monotonic() >= _replica_down_until
+
+
+def read_from_replica(query):
+    """Return query(), run on the replica when that can't hide the client's own writes.
+
+    Uncommitted changes in the session, a recent write by the same client, or
+    an unavailable replica send the read to the primary. Only wrap reads that
+    don't depend on rows committed earlier in the same request.
+    """
+    global _replica_down_until
+    if not (replica_available() and has_request_context()) or db.session.new or db.session.dirty \
+            or db.session.deleted or _wrote_recently():
+        return query()
+
+    previous_route = g.get('db_route')
+    g.db_route = 'replica'
+    try:
+        return query()
+    except DBAPIError as e:
+        logger.error(f"Replica read failed, using the primary for {REPLICA_RETRY_SECONDS:.0f}s: {e}")
+        _replica_down_until = time.monotonic() + REPLICA_RETRY_SECONDS
+        db.session.rollback()
+    finally:
+        g.db_route = previous_route
+    return query()
+
+
+@app.cli.command('sync-replica')
+def sync_replica_command():
+    """Copy the primary SQLite database to the replica file (local testing without real replication)"""
+    import sqlite3
+
+    if not REPLICA_ENABLED:
+        raise click.ClickException('REPLICA_DATABASE_URL is not set')
+    primary, replica = db.engines[None].url, db.engines['replica'].url
+    if primary.get_backend_name() != 'sqlite' or replica.get_backend_name() != 'sqlite':
+        raise click.ClickException('sync-replica only copies between SQLite files')
+
+    source = sqlite3.connect(primary.database)
+    target = sqlite3.connect(replica.database)
+    try:
+        source.backup(target)
+    finally:
+        source.close()
+        target.close()
+    click.echo(f"Copied {primary.database} to {replica.database}")
+
+
+# ============================================================================
+# RESPONSE CACHE
+# ============================================================================
+
+# Serialized GET /api/orders/<id> and /api/reservations/<id> bodies. Every
+# write that changes one of those rows must call response_cache.invalidate()
+# after committing. That bumps the row's version, and entries for older
+# versions are never served again. With REDIS_URL the version lives in Redis,
+# so a write on one worker takes effect on all of them. Without it, versions
+# are per worker, and entries are trusted for only RESPONSE_CACHE_LOCAL_SECONDS.
+RESPONSE_CACHE_ENABLED = os.getenv('RESPONSE_CACHE_ENABLED', 'true').lower() == 'true'
+RESPONSE_CACHE_SECONDS = int(os.getenv('RESPONSE_CACHE_SECONDS', 300))
+RESPONSE_CACHE_LOCAL_SECONDS = float(os.getenv('RESPONSE_CACHE_LOCAL_SECONDS', 2))
+RESPONSE_CACHE_MAX_ENTRIES = int(os.getenv('RESPONSE_CACHE_MAX_ENTRIES', 10000))
+
+# KEYS[1] version key, KEYS[2] body key prefix. ARGV[1] the version this worker holds.
+# Returns the current version, and its body unless the worker already has it.
+RESPONSE_CACHE_LOOKUP_SCRIPT = """
+local version = redis.call('GET', KEYS[1]) or '0'
+if version == ARGV[1] then
+    return {version, false}
+end
+return {version, redis.call('GET', KEYS[2] .. version)}
+"""
+
+
+class ResponseCache:
+    """Read-through cache of JSON response bodies, keyed by tenant, kind and row id"""
+
+    def __init__(self):
+        self._entries: 'OrderedDict[str, Tuple[str, float, str]]' = OrderedDict()  # key -> (version, expires_at, body)
+        self._versions: 'OrderedDict[str, int]' = OrderedDict()  # per-worker versions, without Redis
+        self._lock = threading.Lock()
+        self._lookup_script = None
+        self.stats = {'hits': 0, 'misses': 0, 'invalidations': 0, 'errors': 0}
+
+    def get(self, kind: str, object_id: int, load):
+        """Response with the cached body, or from `load()` on a miss; None when load() finds nothing"""
+        key = f'{current_tenant_id()}:{kind}:{object_id}'
+        client = get_redis()
+        now = time.monotonic()
+        local = self._entries.get(key)
+
+        if client is None:
+            version = str(self._versions.get(key, 0))
+            if local is not None and local[0] == version and local[1] > now:
+                return self._hit(key, local[2])
+        else:
+            try:
+                if self._lookup_script is None:
+                    self._lookup_script = client.register_script(RESPONSE_CACHE_LOOKUP_SCRIPT)
+                version, body = self._lookup_script(
+                    keys=[f'rcache:v:{key}', f'rcache:{key}:'], args=[local[0] if local else '']
+                )
+                version = version.decode()
+            except Exception as e:
+                logger.error(f"Response cache lookup error: {e}")
+                self.stats['errors'] += 1
+                payload = load()
+                return jsonify(payload) if payload is not None else None
+            if body is not None:
+                self._store(key, version, body.decode(), now + RESPONSE_CACHE_SECONDS)
+                return self._hit(key, body.decode())
+            if local is not None and local[0] == version and local[1] > now:
+                return self._hit(key, local[2])
+
+        self.stats['misses'] += 1
+        payload = load()
+        if payload is None:
+            return None
+        body = app.json.dumps(payload)
+        if client is None:
+            if str(self._versions.get(key, 0)) == version:  # no write landed while loading
+                self._store(key, version, body, now + RESPONSE_CACHE_LOCAL_SECONDS)
+        else:
+            self._store(key, version, body, now + RESPONSE_CACHE_SECONDS)
+            try:
+                client.set(f'rcache:{key}:{version}', body, ex=RESPONSE_CACHE_SECONDS)
+            except Exception as e:
+                logger.error(f"Response cache store error: {e}")
+        return app.response_class(body, mimetype=app.json.mimetype)
+
+    def invalidate(self, kind: str, object_id: int, tenant_id: Optional[str] = None):
+        """Call after committing a change to the row; older cached bodies are never served again"""
+        key = f'{tenant_id or current_tenant_id()}:{kind}:{object_id}'
+        self.stats['invalidations'] += 1
+        with self._lock:
+            self._entries.pop(key, None)
+            self._versions[key] = self._versions.get(key, 0) + 1
+            self._versions.move_to_end(key)
+            while len(self._versions) > RESPONSE_CACHE_MAX_ENTRIES:
+                self._entries.pop(self._versions.popitem(last=False)[0], None)
+        client = get_redis()
+        if client is not None:
+            try:
+                pipe = client.pipeline()
+                pipe.incr(f'rcache:v:{key}')
+                # Outlives any body stored under an older version
+                pipe.expire(f'rcache:v:{key}', RESPONSE_CACHE_SECONDS * 2)
+                pipe.execute()
+            except Exception as e:
+                logger.error(f"Response cache invalidation error: {e}")
+                self.stats['errors'] += 1
+
+    def _hit(self, key: str, body: str):
+        self.stats['hits'] += 1
+        return app.response_class(body, mimetype=app.json.mimetype)
+
+    def _store(self, key: str, version: str, body: str, expires_at: float):
+        with self._lock:
+            self._entries[key] = (version, expires_at, body)
+            self._entries.move_to_end(key)
+            while len(self._entries) > RESPONSE_CACHE_MAX_ENTRIES:
+                self._entries.popitem(last=False)
+
+    def metrics(self) -> Dict:
+        return {'enabled': RESPONSE_CACHE_ENABLED, 'entries': len(self._entries), **self.stats}
+
+
+response_cache = ResponseCache()
+
+
 # ============================================================================
 # API ROUTES
 # ============================================================================
@@ -614,17 +1895,51 @@ def health_check():
     })
 
 
+@app.route('/api/ready', methods=['GET'])
+@limiter.exempt
+def readiness_check():
+    """Readiness probe, flipped once the worker warm-up has finished"""
+    if not _ready.is_set():
+        return jsonify({'status': 'starting'}), 503
+
+    return jsonify({
+        'status': 'ready',
+        'timestamp': datetime.utcnow().isoformat()
+    })
+
+
+@app.route('/api/metrics', methods=['GET'])
+@limiter.exempt
+def metrics():
+    """Operational metrics for this worker"""
+    try:
+        llm_metrics = get_llm_client().metrics()
+    except Exception as e:
+        # No usable backend (e.g. GEMINI_API_KEY unset): report it, don't fail
+        logger.warning(f"LLM client metrics error: {e}")
+        llm_metrics = {'available': False, 'backend': None, 'hedging': None, 'circuit': None}
+    return jsonify({
+        'pid': os.getpid(),
+        'llm': llm_metrics,
+        'admission': admission.metrics(),
+        'replica': {'enabled': REPLICA_ENABLED, 'available': replica_available()},
+        'response_cache': response_cache.metrics(),
+        'timestamp': datetime.utcnow().isoformat()
+    })
+
+
 @app.route('/api/config', methods=['GET'])
 def get_config():
     """Get restaurant configuration"""
+    config = current_tenant().config
     return jsonify({
         'restaurant': {
-            'name': RESTAURANT_CONFIG['name'],
-            'location': RESTAURANT_CONFIG['location'],
-            'phone': RESTAURANT_CONFIG['phone'],
-            'email': RESTAURANT_CONFIG['email'],
-            'website': RESTAURANT_CONFIG['website'],
-            'hours': RESTAURANT_CONFIG['hours']
+            'name': config['name'],
+            'location': config['location'],
+            'phone': config['phone'],
+            'email': config['email'],
+            'website': config['website'],
+            'hours': config['hours']
         }
     })
 
@@ -635,7 +1950,7 @@ def get_menu():
     """Get full restaurant menu"""
     return jsonify({
         'success': True,
-        'menu': RESTAURANT_CONFIG['menu']
+        'menu': current_tenant().config['menu']
     })
 
 
@@ -643,123 +1958,145 @@ def get_menu():
 @limiter.limit("30 per minute")
 def get_menu_category(category: str):
     """Get specific menu category"""
-    if category not in RESTAURANT_CONFIG['menu']:
+    menu = current_tenant().config['menu']
+    if category not in menu:
         return jsonify({'error': f'Category "{category}" not found'}), 404
     
     return jsonify({
         'success': True,
         'category': category,
-        'items': RESTAURANT_CONFIG['menu'][category]
+        'items': menu[category]
     })
 
 
 @app.route('/api/chat', methods=['POST'])
-@limiter.limit("30 per minute")
+@chat_limit
+@session_limit
 def chat():
     """Main chat endpoint for AI conversations, also handles order/reservation intent flows."""
     try:
-        data = request.get_json()
-        if not data:
-            return jsonify({'error': 'No JSON data provided'}), 400
+        body, status, pending = start_chat_turn(request.get_json())
+        if pending is None:
+            return api_response(body, status)
 
-        user_message = data.get('message', '').strip()
-        session_id = data.get('session_id', 'anonymous')
+        try:
+            response = get_llm_client().generate(pending['prompt'], **CHAT_GENERATION_CONFIG)
+        except CircuitOpenError as e:
+            return api_response(*degraded_chat_turn(pending, e.retry_after))
+        except Exception as e:
+            logger.error(f"Chat model error: {e}")
+            return api_response(*degraded_chat_turn(pending, LLM_ERROR_RETRY_AFTER))
+        return jsonify(finish_chat_turn(pending, response.text, response))
 
-        if not user_message:
-            return jsonify({'error': 'Message cannot be empty'}), 400
+    except Exception as e:
+        logger.error(f"Chat error: {e}")
+        return jsonify({
+            'success': False,
+            'error': 'Failed to process message'
+        }), 500
 
-        if len(user_message) > 1000:
-            return jsonify({'error': 'Message too long (max 1000 characters)'}), 400
+# Kept within CHAT_RATE_LIMIT, which a batch is charged per message against
+CHAT_BATCH_MAX_ITEMS = int(os.getenv('CHAT_BATCH_MAX_ITEMS', 30))
+# Model calls a batch runs at once
+CHAT_BATCH_CONCURRENCY = int(os.getenv('CHAT_BATCH_CONCURRENCY', 8))
+_chat_batch_pool = None
 
-        # Track session
-        track_session(session_id)
 
-        # If client provided explicit step/collected_data for an intent flow, prefer that
-        step = data.get('step', None)
-        collected_data = data.get('collected_data', None)
-
-        # If this message indicates ordering/reserving intent (or client is continuing a step), handle here
-        if step is not None:
-            # client explicitly continuing a flow: check type param if provided, default to order if both match
-            intent_type = data.get('intent_type', None)  # 'order' or 'reservation'
-            if intent_type == 'reservation':
-                result = process_reservation_intent_step(user_message, session_id=session_id, step=step, collected_data=collected_data)
-                return jsonify(result)
-            else:
-                # default to order processing
-                result = process_order_intent_step(user_message, session_id=session_id, step=step, collected_data=collected_data)
-                return jsonify(result)
-
-        # Automatic intent detection from the message
-        if detect_order_intent(user_message):
-            # start order flow (step 0)
-            result = process_order_intent_step(user_message, session_id=session_id, step=0, collected_data={})
-            return jsonify(result)
-
-        if detect_reservation_intent(user_message):
-            # start reservation flow (step 0)
-            result = process_reservation_intent_step(user_message, session_id=session_id, step=0, collected_data={})
-            return jsonify(result)
-
-        # Otherwise, proceed with Gemini as before (regular chat)
-        history = Conversation.query.filter_by(session_id=session_id).order_by(
-            Conversation.timestamp.desc()
-        ).limit(5).all()
+def chat_batch_size() -> int:
+    """Messages in a /api/chat/batch body, what the batch costs against the chat limit"""
+    data = request.get_json(silent=True)
+    items = data.get('messages') if isinstance(data, dict) else None
+    return min(len(items), CHAT_BATCH_MAX_ITEMS) if isinstance(items, list) and items else 1
 
-        context = "\n".join([
-            f"User: {c.user_message}\nAssistant: {c.bot_response}"
-            for c in reversed(history)
-        ]) if history else ""
-
-        full_prompt = f"{SYSTEM_PROMPT}\n"
-        if context:
-            full_prompt += f"\nPrevious conversation context:\n{context}\n"
-        full_prompt += f"\nUser: {user_message}"
-
-        response = model.generate_content(
-            full_prompt,
-            generation_config=genai.types.GenerationConfig(
-                temperature=0.8,
-                top_k=40,
-                top_p=0.9,
-                max_output_tokens=300
-            ),
-            safety_settings=[
-                {
-                    "category": "HARM_CATEGORY_HARASSMENT",
-                    "threshold": "BLOCK_MEDIUM_AND_ABOVE"
-                }
-            ]
-        )
 
-        bot_message = response.text.strip()
+def _generate_chat_reply(prompt: str):
+    """Model call for a batch item; returns the LLMResponse or the exception"""
+    try:
+        return get_llm_client().generate(prompt, **CHAT_GENERATION_CONFIG)
+    except Exception as e:
+        return e
 
-        # Store conversation
-        conversation = Conversation(
-            session_id=session_id,
-            user_message=user_message,
-            bot_response=bot_message,
-            message_type='text'
-        )
-        db.session.add(conversation)
+
+@app.route('/api/chat/batch', methods=['POST'])
+@limiter.limit("10 per minute")
+@chat_batch_limit
+def chat_batch():
+    """Process many {session_id, message} pairs in one call.
+
+    Sessions run side by side while each session's messages keep their
+    order: the batch advances in rounds, one message per session, and each
+    round's model calls run concurrently. Each message counts against the
+    chat limit and its session's limit like an /api/chat call; messages over
+    their session's limit get a 429 result. Conversation rows and session
+    tracking for the whole batch are written in one commit at the end.
+    """
+    global _chat_batch_pool
+    try:
+        data = request.get_json() or {}
+        items = data.get('messages')
+        if not isinstance(items, list) or not items:
+            return jsonify({'error': 'messages must be a non-empty list'}), 400
+        if len(items) > CHAT_BATCH_MAX_ITEMS:
+            return jsonify({'error': f'At most {CHAT_BATCH_MAX_ITEMS} messages per batch'}), 400
+
+        queues: Dict[str, List[int]] = {}
+        for index, item in enumerate(items):
+            session_id = item.get('session_id', 'anonymous') if isinstance(item, dict) else 'anonymous'
+            queues.setdefault(session_id, []).append(index)
+
+        if _chat_batch_pool is None:
+            _chat_batch_pool = ThreadPoolExecutor(max_workers=CHAT_BATCH_CONCURRENCY, thread_name_prefix='chat-batch')
+
+        results: List[Optional[Dict]] = [None] * len(items)
+        batch_rows: List[Conversation] = []
+        message_counts: Dict[str, int] = {}
+        while any(queues.values()):
+            waiting = []
+            for session_id, indexes in queues.items():
+                if not indexes:
+                    continue
+                index = indexes.pop(0)
+                item = items[index] if isinstance(items[index], dict) else None
+                if item and item.get('session_id') and not hit_session_limit(str(item['session_id'])):
+                    results[index] = {'status': 429, 'error': 'Rate limit exceeded'}
+                    continue
+                body, status, pending = start_chat_turn(item, batch_rows=batch_rows)
+                if status == 200:
+                    message_counts[session_id] = message_counts.get(session_id, 0) + 1
+                if pending is None:
+                    results[index] = {'status': status, **body}
+                else:
+                    waiting.append((index, pending))
+
+            replies = _chat_batch_pool.map(_generate_chat_reply, [pending['prompt'] for _, pending in waiting])
+            for (index, pending), reply in zip(waiting, replies):
+                if isinstance(reply, CircuitOpenError):
+                    body, status = degraded_chat_turn(pending, reply.retry_after, batch_rows)
+                elif isinstance(reply, Exception):
+                    logger.error(f"Chat batch model error: {reply}")
+                    body, status = degraded_chat_turn(pending, LLM_ERROR_RETRY_AFTER, batch_rows)
+                else:
+                    body, status = finish_chat_turn(pending, reply.text, reply, batch_rows), 200
+                results[index] = {'status': status, **body}
+
+        track_sessions(message_counts)
+        db.session.add_all(batch_rows)
         db.session.commit()
 
-        return jsonify({
-            'success': True,
-            'response': bot_message,
-            'session_id': session_id,
-            'timestamp': datetime.utcnow().isoformat()
-        })
+        return jsonify({'success': True, 'results': results})
 
     except Exception as e:
-        logger.error(f"Chat error: {e}")
+        logger.error(f"Chat batch error: {e}")
+        db.session.rollback()
         return jsonify({
             'success': False,
-            'error': 'Failed to process message'
+            'error': 'Failed to process batch'
         }), 500
 
 @app.route('/api/orders', methods=['POST'])
 @limiter.limit("10 per minute")
+@session_limit
+@idempotent
 def create_order():
     """Create a new order"""
     try:
@@ -787,11 +2124,12 @@ def create_order():
         if customer_phone and not validate_phone(customer_phone):
             return jsonify({'error': 'Invalid phone format'}), 400
         
-        # Calculate total
-        total_price = sum(
-            item.get('price', 0) * item.get('quantity', 1)
-            for item in items
-        )
+        # Price the cart from the menu; client-sent prices are ignored
+        quote = quote_cart(items)
+        if not quote['success']:
+            return jsonify({'error': 'Some items could not be priced', 'details': quote['errors']}), 400
+        items = quote['lines']
+        total_price = quote['total']
         
         if total_price <= 0:
             return jsonify({'error': 'Order total must be greater than 0'}), 400
@@ -821,6 +2159,9 @@ def create_order():
         db.session.add(conversation)
         db.session.commit()
         
+        refresh_analytics_rollups()
+        publish_order_event('order.created', order)
+        
         return jsonify({
             'success': True,
             'order_id': order.id,
@@ -838,19 +2179,25 @@ def create_order():
         }), 500
 
 
+def _order_payload(order_id: int) -> Optional[Dict]:
+    order = Order.query.filter_by(id=order_id, tenant_id=current_tenant_id()).first()
+    return {'success': True, 'order': order.to_dict()} if order else None
+
+
 @app.route('/api/orders/<int:order_id>', methods=['GET'])
 def get_order(order_id: int):
     """Get order details"""
     try:
-        order = Order.query.get(order_id)
-        
-        if not order:
+        if RESPONSE_CACHE_ENABLED:
+            # Misses read the primary, so a lagging replica can't be cached under a newer version
+            response = response_cache.get('order', order_id, lambda: _order_payload(order_id))
+        else:
+            payload = read_from_replica(lambda: _order_payload(order_id))
+            response = jsonify(payload) if payload else None
+
+        if response is None:
             return jsonify({'error': 'Order not found'}), 404
-        
-        return jsonify({
-            'success': True,
-            'order': order.to_dict()
-        })
+        return response
     
     except Exception as e:
         logger.error(f"Order retrieval error: {e}")
@@ -859,6 +2206,8 @@ def get_order(order_id: int):
 
 @app.route('/api/reservations', methods=['POST'])
 @limiter.limit("10 per minute")
+@session_limit
+@idempotent
 def create_reservation():
     """Create a table reservation"""
     try:
@@ -927,78 +2276,111 @@ def create_reservation():
         }), 500
 
 
+def _reservation_payload(reservation_id: int) -> Optional[Dict]:
+    reservation = Reservation.query.filter_by(id=reservation_id, tenant_id=current_tenant_id()).first()
+    return {'success': True, 'reservation': reservation.to_dict()} if reservation else None
+
+
 @app.route('/api/reservations/<int:reservation_id>', methods=['GET'])
 def get_reservation(reservation_id: int):
     """Get reservation details"""
     try:
-        reservation = Reservation.query.get(reservation_id)
-        
-        if not reservation:
+        if RESPONSE_CACHE_ENABLED:
+            response = response_cache.get('reservation', reservation_id, lambda: _reservation_payload(reservation_id))
+        else:
+            payload = read_from_replica(lambda: _reservation_payload(reservation_id))
+            response = jsonify(payload) if payload else None
+
+        if response is None:
             return jsonify({'error': 'Reservation not found'}), 404
-        
-        return jsonify({
-            'success': True,
-            'reservation': reservation.to_dict()
-        })
+        return response
     
     except Exception as e:
         logger.error(f"Reservation retrieval error: {e}")
         return jsonify({'error': 'Failed to retrieve reservation'}), 500
 
 
-@app.route('/api/recommendations', methods=['POST'])
-@limiter.limit("20 per minute")
-def get_recommendations():
-    """Get personalized menu recommendations using Gemini"""
-    try:
-        data = request.get_json()
-        
-        preferences = data.get('preferences', '').strip()
-        dietary_restrictions = data.get('dietary_restrictions', [])
-        budget = data.get('budget', 'no limit')
-        session_id = data.get('session_id', 'anonymous')
-        
-        if not preferences:
-            return jsonify({'error': 'Preferences are required'}), 400
-        
-        # Build recommendation prompt
-        restrictions_text = ', '.join(dietary_restrictions) if dietary_restrictions else 'None'
-        prompt = f"""Based on a customer's preferences and restrictions, recommend 3 dishes from our menu.
+RECOMMENDATION_GENERATION_CONFIG = {
+    'temperature': 0.7,
+    'top_k': 40,
+    'top_p': 0.9,
+    'max_output_tokens': 400
+}
+
+
+def start_recommendation(data: Optional[Dict]) -> Tuple[Dict, int, Optional[Dict]]:
+    """Validate a recommendation request and build its prompt.
+
+    Returns (body, status, pending) like start_chat_turn(): when `pending` is
+    set the caller sends `pending['prompt']` to the model and passes the reply
+    to finish_recommendation(). The sync view and asgi.py share both halves.
+    """
+    data = data or {}
+    preferences = data.get('preferences', '').strip()
+    dietary_restrictions = data.get('dietary_restrictions', [])
+    budget = data.get('budget', 'no limit')
+    session_id = data.get('session_id', 'anonymous')
+
+    if not preferences:
+        return {'error': 'Preferences are required'}, 400, None
+
+    retry_after = check_token_budget(session_id, get_client_ip())
+    if retry_after:
+        return (*over_budget_response(retry_after), None)
+
+    # Build recommendation prompt
+    restrictions_text = ', '.join(dietary_restrictions) if dietary_restrictions else 'None'
+    prompt = f"""Based on a customer's preferences and restrictions, recommend 3 dishes from our menu.
 
 Customer Preferences: {preferences}
 Dietary Restrictions: {restrictions_text}
 Budget: {budget}
 
 Provide your recommendations with brief reasons why they match the customer's preferences. Be warm and encouraging."""
-        
+
+    return {}, 200, {
+        'prompt': f"{current_tenant().system_prompt}\n\n{prompt}",
+        'session_id': session_id,
+        'user_message': f"Preferences: {preferences}, Restrictions: {restrictions_text}"
+    }
+
+
+def finish_recommendation(pending: Dict, response) -> Dict:
+    """Record the model's recommendations and return the response body"""
+    record_token_usage(pending['session_id'], get_client_ip(), response.prompt_tokens, response.completion_tokens)
+
+    # Store in conversation history
+    conversation = Conversation(
+        session_id=pending['session_id'],
+        user_message=pending['user_message'],
+        bot_response=response.text,
+        message_type='recommendation'
+    )
+    db.session.add(conversation)
+    db.session.commit()
+
+    return {
+        'success': True,
+        'recommendations': response.text
+    }
+
+
+@app.route('/api/recommendations', methods=['POST'])
+@limiter.limit("20 per minute")
+@session_limit
+def get_recommendations():
+    """Get personalized menu recommendations using Gemini"""
+    try:
+        payload, status, pending = start_recommendation(request.get_json())
+        if pending is None:
+            return api_response(payload, status)
+
         # Generate recommendations
-        response = model.generate_content(
-            f"{SYSTEM_PROMPT}\n\n{prompt}",
-            generation_config=genai.types.GenerationConfig(
-                temperature=0.7,
-                top_k=40,
-                top_p=0.9,
-                max_output_tokens=400
-            )
-        )
-        
-        recommendations = response.text.strip()
-        
-        # Store in conversation history
-        conversation = Conversation(
-            session_id=session_id,
-            user_message=f"Preferences: {preferences}, Restrictions: {restrictions_text}",
-            bot_response=recommendations,
-            message_type='recommendation'
-        )
-        db.session.add(conversation)
-        db.session.commit()
-        
-        return jsonify({
-            'success': True,
-            'recommendations': recommendations
-        })
-    
+        response = get_llm_client().generate(pending['prompt'], **RECOMMENDATION_GENERATION_CONFIG)
+        return jsonify(finish_recommendation(pending, response))
+
+    except CircuitOpenError as e:
+        return api_response(*model_unavailable_response(e.retry_after))
     except Exception as e:
         logger.error(f"Recommendation error: {e}")
         return jsonify({
@@ -1013,18 +2395,27 @@ def get_conversation(session_id: str):
     """Get conversation history"""
     try:
         limit = request.args.get('limit', default=10, type=int)
+        include_archived = request.args.get('include_archived', 'false').lower() == 'true'
         
         if limit < 1 or limit > 100:
             limit = 10
         
-        conversations = Conversation.query.filter_by(session_id=session_id).order_by(
-            Conversation.timestamp.desc()
-        ).limit(limit).all()
+        conversations = read_from_replica(
+            lambda: Conversation.query.filter_by(tenant_id=current_tenant_id(), session_id=session_id).order_by(
+                Conversation.timestamp.desc()
+            ).limit(limit).all()
+        )
+        messages = [c.to_dict() for c in reversed(conversations)]
+        
+        # Older messages may have been moved to the archive by the retention job
+        if include_archived and len(messages) < limit:
+            archived = lookup_archived_conversation(session_id)
+            messages = archived[-(limit - len(messages)):] + messages
         
         return jsonify({
             'success': True,
             'session_id': session_id,
-            'messages': [c.to_dict() for c in reversed(conversations)]
+            'messages': messages
         })
     
     except Exception as e:
@@ -1034,6 +2425,8 @@ def get_conversation(session_id: str):
 
 @app.route('/api/orders/confirm', methods=['POST'])
 @limiter.limit("10 per minute")
+@session_limit
+@idempotent
 def confirm_order_from_chat():
     """Confirm and create an order from chat conversation"""
     try:
@@ -1068,11 +2461,12 @@ def confirm_order_from_chat():
         if not items or not isinstance(items, list):
             return jsonify({'error': 'Items must be a non-empty list'}), 400
         
-        # Calculate total
-        total_price = sum(
-            item.get('price', 0) * item.get('quantity', 1)
-            for item in items
-        )
+        # Price the cart from the menu; client-sent prices are ignored
+        quote = quote_cart(items)
+        if not quote['success']:
+            return jsonify({'error': 'Some items could not be priced', 'details': quote['errors']}), 400
+        items = quote['lines']
+        total_price = quote['total']
         
         if total_price <= 0:
             return jsonify({'error': 'Order total must be greater than 0'}), 400
@@ -1103,6 +2497,9 @@ def confirm_order_from_chat():
         db.session.add(conversation)
         db.session.commit()
         
+        refresh_analytics_rollups()
+        publish_order_event('order.created', order)
+        
         return jsonify({
             'success': True,
             'order_id': order.id,
@@ -1127,6 +2524,7 @@ def confirm_order_from_chat():
 
 @app.route('/api/chat/order-intent', methods=['POST'])
 @limiter.limit("20 per minute")
+@session_limit
 def handle_order_intent():
     """Handle order collection through multi-step chat"""
     data = request.get_json()
@@ -1143,6 +2541,7 @@ def handle_order_intent():
 
 @app.route('/api/chat/reservation-intent', methods=['POST'])
 @limiter.limit("20 per minute")
+@session_limit
 def handle_reservation_intent():
     """Handle reservation collection through multi-step chat"""
     data = request.get_json()
@@ -1157,6 +2556,2017 @@ def handle_reservation_intent():
     return jsonify(process_reservation_intent_step(message, session_id=session_id, step=step, collected_data=collected_data))
 
 
+# ============================================================================
+# PRICING
+# ============================================================================
+
+# Menu items may list "modifiers" ({id, name, price}) and carry a "tax_rate".
+# A tenant config may add {"tax": {"rate": 0.08, "categories": {"beverages": 0.2}}}
+# and a "currency". Amounts are priced in integer cents.
+CART_MAX_QUANTITY = int(os.getenv('CART_MAX_QUANTITY', 99))
+CART_MAX_LINES = int(os.getenv('CART_MAX_LINES', 100))
+CART_QUOTE_MAX_CARTS = int(os.getenv('CART_QUOTE_MAX_CARTS', 50))
+
+
+def _cents(amount) -> int:
+    return int(round(float(amount) * 100))
+
+
+def build_price_index(config: Dict) -> Dict:
+    """id -> (name, unit cents, tax rate, {modifier id: (name, cents)}) for a menu snapshot"""
+    tax = config.get('tax', {})
+    default_rate = float(tax.get('rate', 0))
+    category_rates = tax.get('categories', {})
+    items = {}
+    for category, category_items in config['menu'].items():
+        rate = float(category_rates.get(category, default_rate))
+        for item in category_items:
+            modifiers = {
+                modifier['id']: (modifier['name'], _cents(modifier.get('price', 0)))
+                for modifier in item.get('modifiers', [])
+            }
+            items[item['id']] = (item['name'], _cents(item['price']), float(item.get('tax_rate', rate)), modifiers)
+    return {'items': items, 'currency': config.get('currency', 'USD')}
+
+
+def quote_cart(items, price_index: Optional[Dict] = None) -> Dict:
+    """Price cart lines ({id, quantity, modifiers: [ids]}) from the menu in one pass.
+
+    Client-sent names and prices are ignored. The quote has one priced line
+    per input line, the subtotal, tax and total, and an `errors` list that is
+    non-empty when a line can't be priced.
+    """
+    price_index = price_index or current_tenant().price_index
+    if not isinstance(items, list) or not items:
+        return {'success': False, 'errors': [{'error': 'Items must be a non-empty list'}]}
+    if len(items) > CART_MAX_LINES:
+        return {'success': False, 'errors': [{'error': f'At most {CART_MAX_LINES} lines per cart'}]}
+
+    menu = price_index['items']
+    lines, errors = [], []
+    subtotal = 0
+    taxable: Dict[float, int] = {}
+    for index, line in enumerate(items):
+        # Menu and modifier ids are strings; anything else can't be looked up (or hashed)
+        if not isinstance(line, dict) or not isinstance(line.get('id'), str):
+            errors.append({'index': index, 'error': 'Line must be an object with a string id'})
+            continue
+        line_modifiers = line.get('modifiers') or []
+        if not isinstance(line_modifiers, list) or not all(isinstance(m, str) for m in line_modifiers):
+            errors.append({'index': index, 'error': 'Modifiers must be a list of string ids'})
+            continue
+        entry = menu.get(line['id'])
+        if entry is None:
+            errors.append({'index': index, 'error': 'Unknown menu item'})
+            continue
+        name, unit, rate, modifiers = entry
+
+        quantity = line.get('quantity', 1)
+        if isinstance(quantity, bool) or not isinstance(quantity, int) or not 1 <= quantity <= CART_MAX_QUANTITY:
+            errors.append({'index': index, 'error': f'Quantity must be a whole number from 1 to {CART_MAX_QUANTITY}'})
+            continue
+
+        modifier_names = []
+        for modifier_id in line_modifiers:
+            modifier = modifiers.get(modifier_id)
+            if modifier is None:
+                errors.append({'index': index, 'error': f"Unknown modifier '{modifier_id}' for {name}"})
+                break
+            modifier_names.append(modifier[0])
+            unit += modifier[1]
+        else:
+            line_total = unit * quantity
+            subtotal += line_total
+            taxable[rate] = taxable.get(rate, 0) + line_total
+            priced = {'id': line['id'], 'name': name, 'price': unit / 100, 'quantity': quantity,
+                      'line_total': line_total / 100}
+            if modifier_names:
+                priced['modifiers'] = modifier_names
+            lines.append(priced)
+
+    if errors:
+        return {'success': False, 'errors': errors}
+
+    tax = sum(int(round(amount * rate)) for rate, amount in taxable.items())
+    return {
+        'success': True,
+        'currency': price_index['currency'],
+        'lines': lines,
+        'subtotal': subtotal / 100,
+        'tax': tax / 100,
+        'total': (subtotal + tax) / 100,
+        'errors': []
+    }
+
+
+@app.route('/api/cart/quote', methods=['POST'])
+@limiter.limit("60 per minute")
+def cart_quote():
+    """Price a cart ({"items": [...]}) or several ({"carts": [{"items": [...]}, ...]})"""
+    data = request.get_json() or {}
+    if 'carts' in data:
+        carts = data['carts']
+        if not isinstance(carts, list) or not carts:
+            return jsonify({'error': 'carts must be a non-empty list'}), 400
+        if len(carts) > CART_QUOTE_MAX_CARTS:
+            return jsonify({'error': f'At most {CART_QUOTE_MAX_CARTS} carts per request'}), 400
+        price_index = current_tenant().price_index
+        return jsonify({
+            'success': True,
+            'quotes': [quote_cart(cart.get('items') if isinstance(cart, dict) else None, price_index)
+                       for cart in carts]
+        })
+
+    quote = quote_cart(data.get('items'))
+    return jsonify(quote), 200 if quote['success'] else 400
+
+
+# ============================================================================
+# ORDER STATUS & EVENTS
+# ============================================================================
+
+# Allowed moves between Order.status values
+ORDER_STATUS_TRANSITIONS = {
+    'pending': {'confirmed', 'cancelled'},
+    'confirmed': {'preparing', 'cancelled'},
+    'preparing': {'ready'},
+    'ready': {'delivered'},
+    'delivered': set(),
+    'cancelled': set(),
+}
+# Set to require `Authorization: Bearer <key>` for status changes and the kitchen feed
+KITCHEN_API_KEY = os.getenv('KITCHEN_API_KEY')
+SSE_HEARTBEAT_SECONDS = int(os.getenv('SSE_HEARTBEAT_SECONDS', 15))
+# Sync workers end a stream before the gunicorn timeout; EventSource reconnects
+SSE_MAX_SECONDS = int(os.getenv('SSE_MAX_SECONDS', 25))
+# Per client IP; a stream reconnects about every SSE_MAX_SECONDS under sync workers
+SSE_RATE_LIMIT = os.getenv('SSE_RATE_LIMIT', '30 per minute')
+SSE_QUEUE_SIZE = 100
+
+
+class OrderEventBroker:
+    """Fans order events out to stream subscribers.
+
+    Without Redis, events reach the subscribers of the worker that published
+    them. With REDIS_URL they go through a pub/sub channel, and each worker
+    with subscribers listens on it, so every worker sees every event.
+    """
+
+    CHANNEL = 'order-events'
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._subscribers: Dict[int, Tuple[Dict, object]] = {}
+        self._next_token = 0
+        self._listener = None
+
+    def subscribe(self, callback, tenant_id: str, order_id: Optional[int] = None,
+                  session_id: Optional[str] = None) -> int:
+        """Call `callback(event)` for the tenant's matching events until unsubscribe(token)"""
+        with self._lock:
+            self._next_token += 1
+            token = self._next_token
+            filters = {'tenant_id': tenant_id, 'order_id': order_id, 'session_id': session_id}
+            self._subscribers[token] = (filters, callback)
+            if self._listener is None and get_redis() is not None:
+                self._listener = threading.Thread(target=self._listen, name='order-events', daemon=True)
+                self._listener.start()
+        return token
+
+    def unsubscribe(self, token: int):
+        with self._lock:
+            self._subscribers.pop(token, None)
+
+    def publish(self, event: Dict):
+        client = get_redis()
+        if client is not None:
+            try:
+                client.publish(self.CHANNEL, json.dumps(event))
+                return
+            except Exception as e:
+                logger.error(f"Order event publish error: {e}")
+        self._dispatch(event)
+
+    def _dispatch(self, event: Dict):
+        with self._lock:
+            subscribers = list(self._subscribers.values())
+        for filters, callback in subscribers:
+            if filters['tenant_id'] != event.get('tenant_id', DEFAULT_TENANT):
+                continue
+            if filters['order_id'] is not None and filters['order_id'] != event['order_id']:
+                continue
+            if filters['session_id'] is not None and filters['session_id'] != event['session_id']:
+                continue
+            try:
+                callback(event)
+            except Exception as e:
+                logger.error(f"Order event delivery error: {e}")
+
+    def _listen(self):
+        import redis
+
+        while True:
+            try:
+                # A dedicated connection without the shared client's short socket timeout
+                pubsub = redis.Redis.from_url(os.getenv('REDIS_URL')).pubsub(ignore_subscribe_messages=True)
+                pubsub.subscribe(self.CHANNEL)
+                for message in pubsub.listen():
+                    self._dispatch(json.loads(message['data']))
+            except Exception as e:
+                logger.error(f"Order event listener error: {e}")
+                time.sleep(1)
+
+
+order_events = OrderEventBroker()
+
+
+def order_event(event_type: str, order: Order, previous_status: Optional[str] = None) -> Dict:
+    return {
+        'type': event_type,
+        'tenant_id': order.tenant_id,
+        'order_id': order.id,
+        'session_id': order.session_id,
+        'status': order.status,
+        'previous_status': previous_status,
+        'total_price': order.total_price,
+        'timestamp': datetime.utcnow().isoformat()
+    }
+
+
+def publish_order_event(event_type: str, order: Order, previous_status: Optional[str] = None):
+    try:
+        order_events.publish(order_event(event_type, order, previous_status))
+    except Exception as e:
+        logger.error(f"Order event error: {e}")
+
+
+def format_sse(event: Dict) -> str:
+    return f"event: {event['type']}\ndata: {json.dumps(event)}\n\n"
+
+
+def kitchen_authorized() -> bool:
+    if not KITCHEN_API_KEY:
+        return True
+    return bearer_token_matches(KITCHEN_API_KEY)
+
+
+def require_kitchen_key(view):
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        if not kitchen_authorized():
+            return jsonify({'success': False, 'error': 'Kitchen authorization required'}), 401
+        return view(*args, **kwargs)
+    return wrapper
+
+
+def open_order_event_stream():
+    """Validate a stream request; returns (error response, filters, opening SSE text)"""
+    order_id = request.args.get('order_id', type=int)
+    session_id = request.args.get('session_id') or None
+    if order_id is None and session_id is None and not kitchen_authorized():
+        return (jsonify({'success': False, 'error': 'Kitchen authorization required'}), 401), None, None
+
+    opening = "retry: 1000\n\n"
+    if order_id is not None:
+        order = Order.query.filter_by(id=order_id, tenant_id=current_tenant_id()).first()
+        if order is None:
+            return (jsonify({'error': 'Order not found'}), 404), None, None
+        opening += format_sse(order_event('order.snapshot', order))
+    db.session.remove()  # don't hold a pooled connection for the life of the stream
+    return None, {'tenant_id': current_tenant_id(), 'order_id': order_id, 'session_id': session_id}, opening
+
+
+@app.route('/api/orders/<int:order_id>/status', methods=['POST'])
+@require_kitchen_key
+def update_order_status(order_id: int):
+    """Move an order to its next status (kitchen)"""
+    try:
+        data = request.get_json() or {}
+        new_status = (data.get('status') or '').strip().lower()
+        if new_status not in ORDER_STATUS_TRANSITIONS:
+            return jsonify({'error': f"Unknown status '{new_status}'"}), 400
+
+        order = Order.query.filter_by(id=order_id, tenant_id=current_tenant_id()).first()
+        if not order:
+            return jsonify({'error': 'Order not found'}), 404
+
+        previous_status = order.status
+        allowed = ORDER_STATUS_TRANSITIONS.get(previous_status, set())
+        if new_status not in allowed:
+            return jsonify({
+                'success': False,
+                'error': f"Cannot move order from {previous_status} to {new_status}",
+                'allowed': sorted(allowed)
+            }), 409
+
+        # Compare-and-set so two kitchen screens can't both move the same order
+        result = db.session.execute(
+            update(Order)
+            .where(Order.id == order_id, Order.status == previous_status)
+            .values(status=new_status, updated_at=datetime.utcnow())
+        )
+        db.session.commit()
+        if result.rowcount != 1:
+            return jsonify({'success': False, 'error': 'Order status changed concurrently, please retry'}), 409
+
+        response_cache.invalidate('order', order_id)
+        db.session.refresh(order)
+        publish_order_event('order.status', order, previous_status)
+        return jsonify({'success': True, 'order': order.to_dict()})
+
+    except Exception as e:
+        logger.error(f"Order status error: {e}")
+        db.session.rollback()
+        return jsonify({'success': False, 'error': 'Failed to update order status'}), 500
+
+
+@app.route('/api/orders/events', methods=['GET'])
+@limiter.limit(SSE_RATE_LIMIT)
+def stream_order_events():
+    """Server-sent events for one order (?order_id=), a session (?session_id=) or the kitchen (no filter).
+
+    Each stream holds a request thread, so it takes a 'stream' admission
+    slot for its whole life; those slots always leave some threads free. The
+    ASGI app serves this route natively without that cap.
+    """
+    error, filters, opening = open_order_event_stream()
+    if error is not None:
+        return error
+    ticket = None
+    if ADMISSION_ENABLED:
+        try:
+            ticket = admission.admit('stream')
+        except RequestShed as e:
+            return shed_response(e)
+
+    events = queue.Queue(maxsize=SSE_QUEUE_SIZE)
+
+    def offer(event):
+        try:
+            events.put_nowait(event)
+        except queue.Full:
+            pass  # slow client; it resyncs from the snapshot on reconnect
+
+    token = order_events.subscribe(offer, **filters)
+
+    def stream():
+        try:
+            yield opening
+            deadline = time.monotonic() + SSE_MAX_SECONDS
+            while True:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return
+                try:
+                    event = events.get(timeout=min(SSE_HEARTBEAT_SECONDS, remaining))
+                except queue.Empty:
+                    yield ': keep-alive\n\n'
+                    continue
+                yield format_sse(event)
+        finally:
+            order_events.unsubscribe(token)
+
+    response = app.response_class(stream(), mimetype='text/event-stream',
+                                  headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+    if ticket is not None:
+        response.call_on_close(lambda: admission.release(ticket))
+    return response
+
+
+# ============================================================================
+# ANALYTICS ROLLUPS
+# ============================================================================
+
+ROLLUP_BATCH_SIZE = int(os.getenv('ROLLUP_BATCH_SIZE', 500))
+ROLLUP_INTERVAL_SECONDS = int(os.getenv('ROLLUP_INTERVAL_SECONDS', 60))  # 0 disables the catch-up job
+# Orders rolled up inside an order write request; the scheduler does the rest
+ROLLUP_INLINE_BATCH_SIZE = int(os.getenv('ROLLUP_INLINE_BATCH_SIZE', 20))
+# Rows younger than this are left for the next run. Set a few seconds on
+# Postgres so ids committed out of order aren't skipped by the high-water mark.
+ROLLUP_LAG_SECONDS = int(os.getenv('ROLLUP_LAG_SECONDS', 0))
+# The /api/analytics endpoints are disabled unless ANALYTICS_API_KEY is set and sent as a Bearer token
+ANALYTICS_API_KEY = os.getenv('ANALYTICS_API_KEY')
+
+
+def _rollup_row(model, **key):
+    """Fetch a rollup row by primary key, creating it with zeroed counters"""
+    row = db.session.get(model, key)
+    if row is None:
+        counters = {
+            column.name: column.default.arg for column in model.__table__.columns
+            if column.default is not None and not column.primary_key
+        }
+        row = model(**key, **counters)
+        db.session.add(row)
+    return row
+
+
+def _session_rollup(tenant_id: str, session_id: str, seen: datetime) -> SessionRollup:
+    row = db.session.get(SessionRollup, {'tenant_id': tenant_id, 'session_id': session_id})
+    if row is None:
+        row = SessionRollup(tenant_id=tenant_id, session_id=session_id, first_seen=seen.date(),
+                            message_count=0, order_count=0)
+        db.session.add(row)
+        _rollup_row(ConversionDaily, tenant_id=tenant_id, day=row.first_seen).sessions_started += 1
+    return row
+
+
+def _apply_order_rollups(orders: List[Order]):
+    for order in orders:
+        hour = _rollup_row(HourlyRevenue, tenant_id=order.tenant_id,
+                           hour=order.created_at.replace(minute=0, second=0, microsecond=0))
+        hour.order_count += 1
+        hour.revenue += order.total_price
+
+        try:
+            items = json.loads(order.items)
+        except ValueError:
+            items = []
+        for item in items:
+            quantity = item.get('quantity', 1)
+            name = str(item.get('name', 'item'))[:100]
+            entry = _rollup_row(ItemDailyCount, tenant_id=order.tenant_id, day=order.created_at.date(),
+                                item_key=str(item.get('id') or name)[:100])
+            entry.item_name = name
+            entry.quantity += quantity
+            entry.revenue += item.get('price', 0) * quantity
+
+        if order.session_id:
+            session_row = _session_rollup(order.tenant_id, order.session_id, order.created_at)
+            if session_row.order_count == 0:
+                _rollup_row(ConversionDaily, tenant_id=order.tenant_id, day=session_row.first_seen).sessions_converted += 1
+            session_row.order_count += 1
+
+
+def _apply_conversation_rollups(conversations: List[Conversation]):
+    for conversation in conversations:
+        _session_rollup(conversation.tenant_id, conversation.session_id, conversation.timestamp).message_count += 1
+
+
+def _rollup_batch(name: str, model, time_column, apply, batch_size: int) -> int:
+    """Roll up the next batch of source rows past the high-water mark.
+
+    The mark is advanced with a compare-and-set in the same transaction as the
+    increments, so concurrent workers never count a row twice: the loser's
+    update matches nothing and it rolls back.
+    """
+    high_water_mark = db.session.query(RollupState.high_water_mark).filter_by(name=name).scalar()
+    if high_water_mark is None:
+        db.session.add(RollupState(name=name, high_water_mark=0))
+        db.session.commit()
+        high_water_mark = 0
+
+    query = model.query.filter(model.id > high_water_mark)
+    if ROLLUP_LAG_SECONDS:
+        query = query.filter(time_column < datetime.utcnow() - timedelta(seconds=ROLLUP_LAG_SECONDS))
+    rows = query.order_by(model.id).limit(batch_size).all()
+    if not rows:
+        db.session.rollback()
+        return 0
+
+    claimed = db.session.execute(
+        update(RollupState)
+        .where(RollupState.name == name, RollupState.high_water_mark == high_water_mark)
+        .values(high_water_mark=rows[-1].id)
+    ).rowcount
+    if not claimed:
+        db.session.rollback()
+        return 0
+
+    apply(rows)
+    db.session.commit()
+    return len(rows)
+
+
+def update_analytics_rollups(batch_size: Optional[int] = None) -> Dict[str, int]:
+    """Catch the rollup tables up with new orders and conversations"""
+    batch_size = batch_size or ROLLUP_BATCH_SIZE
+    processed = {}
+    for name, model, time_column, apply in (
+        ('orders', Order, Order.created_at, _apply_order_rollups),
+        ('conversations', Conversation, Conversation.timestamp, _apply_conversation_rollups),
+    ):
+        processed[name] = 0
+        while True:
+            count = _rollup_batch(name, model, time_column, apply, batch_size)
+            if not count:
+                break
+            processed[name] += count
+    return processed
+
+
+def refresh_analytics_rollups():
+    """Incremental update after an order write; never fails the caller.
+
+    Rolls up at most one small batch of orders, so the request never pays for
+    a backlog; conversations and anything further behind are left to
+    start_rollup_scheduler.
+    """
+    try:
+        _rollup_batch('orders', Order, Order.created_at, _apply_order_rollups, ROLLUP_INLINE_BATCH_SIZE)
+    except Exception as e:
+        logger.error(f"Analytics rollup error: {e}")
+        db.session.rollback()
+
+
+def start_rollup_scheduler():
+    """Run the rollup catch-up every ROLLUP_INTERVAL_SECONDS in a daemon thread"""
+    if ROLLUP_INTERVAL_SECONDS <= 0:
+        return
+
+    def run():
+        while True:
+            time.sleep(ROLLUP_INTERVAL_SECONDS)
+            try:
+                with app.app_context():
+                    update_analytics_rollups()
+            except Exception as e:
+                logger.error(f"Rollup job error: {e}")
+
+    threading.Thread(target=run, name='rollup-scheduler', daemon=True).start()
+
+
+def require_analytics_key(view):
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        if not bearer_token_matches(ANALYTICS_API_KEY):
+            return jsonify({'success': False, 'error': 'Analytics authorization required'}), 401
+        return view(*args, **kwargs)
+    return wrapper
+
+
+def _parse_analytics_range() -> Tuple[datetime, datetime]:
+    """Read ?from=YYYY-MM-DD&to=YYYY-MM-DD (inclusive), defaulting to the last 7 days"""
+    today = datetime.utcnow().date()
+    start = datetime.strptime(request.args.get('from', (today - timedelta(days=6)).isoformat()), '%Y-%m-%d')
+    end = datetime.strptime(request.args.get('to', today.isoformat()), '%Y-%m-%d') + timedelta(days=1)
+    return start, end
+
+
+@app.route('/api/analytics/revenue', methods=['GET'])
+@limiter.limit("30 per minute")
+@require_analytics_key
+def analytics_revenue():
+    """Revenue and order counts per hour (or per day with ?granularity=day)"""
+    try:
+        start, end = _parse_analytics_range()
+    except ValueError:
+        return jsonify({'error': 'Invalid date format (use YYYY-MM-DD)'}), 400
+
+    granularity = request.args.get('granularity', 'hour')
+    if granularity not in ('hour', 'day'):
+        return jsonify({'error': 'Granularity must be "hour" or "day"'}), 400
+
+    rows = read_from_replica(lambda: HourlyRevenue.query.filter(
+        HourlyRevenue.tenant_id == current_tenant_id(), HourlyRevenue.hour >= start, HourlyRevenue.hour < end
+    ).order_by(HourlyRevenue.hour).all())
+
+    if granularity == 'hour':
+        buckets = [row.to_dict() for row in rows]
+    else:
+        days: Dict[str, Dict] = {}
+        for row in rows:
+            bucket = days.setdefault(row.hour.date().isoformat(), {'day': row.hour.date().isoformat(), 'order_count': 0, 'revenue': 0.0})
+            bucket['order_count'] += row.order_count
+            bucket['revenue'] = round(bucket['revenue'] + row.revenue, 2)
+        buckets = list(days.values())
+
+    return jsonify({
+        'success': True,
+        'granularity': granularity,
+        'total_revenue': round(sum(row.revenue for row in rows), 2),
+        'total_orders': sum(row.order_count for row in rows),
+        'buckets': buckets
+    })
+
+
+@app.route('/api/analytics/top-items', methods=['GET'])
+@limiter.limit("30 per minute")
+@require_analytics_key
+def analytics_top_items():
+    """Most ordered items over a date range"""
+    try:
+        start, end = _parse_analytics_range()
+    except ValueError:
+        return jsonify({'error': 'Invalid date format (use YYYY-MM-DD)'}), 400
+
+    limit = request.args.get('limit', default=10, type=int)
+    if limit < 1 or limit > 100:
+        limit = 10
+
+    rows = read_from_replica(lambda: db.session.query(
+        ItemDailyCount.item_key,
+        func.max(ItemDailyCount.item_name),
+        func.sum(ItemDailyCount.quantity).label('quantity'),
+        func.sum(ItemDailyCount.revenue)
+    ).filter(
+        ItemDailyCount.tenant_id == current_tenant_id(),
+        ItemDailyCount.day >= start.date(), ItemDailyCount.day < end.date()
+    ).group_by(ItemDailyCount.tenant_id, ItemDailyCount.item_key).order_by(text('quantity DESC')).limit(limit).all())
+
+    return jsonify({
+        'success': True,
+        'items': [
+            {'item_key': key, 'name': name, 'quantity': quantity, 'revenue': round(revenue, 2)}
+            for key, name, quantity, revenue in rows
+        ]
+    })
+
+
+@app.route('/api/analytics/conversion', methods=['GET'])
+@limiter.limit("30 per minute")
+@require_analytics_key
+def analytics_conversion():
+    """Share of chat sessions (by start day) that placed at least one order"""
+    try:
+        start, end = _parse_analytics_range()
+    except ValueError:
+        return jsonify({'error': 'Invalid date format (use YYYY-MM-DD)'}), 400
+
+    rows = read_from_replica(lambda: ConversionDaily.query.filter(
+        ConversionDaily.tenant_id == current_tenant_id(),
+        ConversionDaily.day >= start.date(), ConversionDaily.day < end.date()
+    ).order_by(ConversionDaily.day).all())
+
+    started = sum(row.sessions_started for row in rows)
+    converted = sum(row.sessions_converted for row in rows)
+    return jsonify({
+        'success': True,
+        'sessions_started': started,
+        'sessions_converted': converted,
+        'conversion_rate': round(converted / started, 4) if started else 0.0,
+        'days': [row.to_dict() for row in rows]
+    })
+
+
+@app.cli.command('rollup-analytics')
+@click.option('--batch-size', type=int, default=None, help='Source rows per rollup transaction')
+def rollup_analytics_command(batch_size):
+    """Catch the analytics rollup tables up with new orders and conversations"""
+    click.echo(json.dumps(update_analytics_rollups(batch_size), indent=2))
+
+
+# ============================================================================
+# PRECOMPUTED ANSWERS
+# ============================================================================
+
+PRECOMPUTE_TOP_N = int(os.getenv('PRECOMPUTE_TOP_N', 50))
+PRECOMPUTE_MIN_OCCURRENCES = int(os.getenv('PRECOMPUTE_MIN_OCCURRENCES', 3))
+PRECOMPUTE_LOOKBACK_DAYS = int(os.getenv('PRECOMPUTE_LOOKBACK_DAYS', 30))
+PRECOMPUTED_CACHE_SECONDS = int(os.getenv('PRECOMPUTED_CACHE_SECONDS', 300))
+PRECOMPUTED_ANSWERS_ENABLED = os.getenv('PRECOMPUTED_ANSWERS_ENABLED', 'true').lower() == 'true'
+
+QUESTION_STOPWORDS = {
+    'a', 'an', 'the', 'is', 'are', 'do', 'does', 'you', 'your', 'i', 'me', 'my', 'we', 'to', 'of',
+    'please', 'hi', 'hello', 'hey', 'can', 'could', 'would', 'tell', 'what', 'whats', 'there', 'any',
+    'about', 'for', 'thanks', 'thank', 'pls', 'plz', 'u', 'ur'
+}
+
+_answer_cache: 'OrderedDict[str, Tuple[float, Dict[str, str]]]' = OrderedDict()  # version -> (loaded_at, answers)
+_answer_cache_lock = threading.Lock()
+
+
+def answer_content_version() -> str:
+    """Version of everything a precomputed answer depends on (prompt, menu, hours)"""
+    return current_tenant().content_version
+
+
+def normalize_question(message: str) -> str:
+    """Cluster key for a user message: lowercase content words, deduplicated and sorted,
+    so "What time do you close?" and "when do you close" land close together"""
+    words = re.findall(r"[a-z0-9]+", message.lower().replace("'", ''))
+    return ' '.join(sorted({word for word in words if word not in QUESTION_STOPWORDS}))[:300]
+
+
+def find_frequent_questions(top_n: int, min_occurrences: int, days: int) -> List[Tuple[str, str, int]]:
+    """Cluster recent free-form messages; returns (key, representative phrasing, count)"""
+    cutoff = datetime.utcnow() - timedelta(days=days)
+    counts: Dict[str, int] = {}
+    phrasings: Dict[str, Dict[str, int]] = {}
+
+    query = db.session.query(Conversation.user_message).filter(
+        Conversation.tenant_id == current_tenant_id(),
+        Conversation.message_type == 'text',
+        Conversation.timestamp >= cutoff
+    )
+    for (message,) in query.yield_per(1000):
+        key = normalize_question(message)
+        if not key:
+            continue
+        counts[key] = counts.get(key, 0) + 1
+        variants = phrasings.setdefault(key, {})
+        phrase = message.strip()
+        variants[phrase] = variants.get(phrase, 0) + 1
+
+    ranked = sorted(counts.items(), key=lambda pair: pair[1], reverse=True)
+    return [
+        (key, max(phrasings[key].items(), key=lambda pair: pair[1])[0], count)
+        for key, count in ranked[:top_n] if count >= min_occurrences
+    ]
+
+
+def _generate_answer(question: str) -> str:
+    return get_llm_client().generate(f"{current_tenant().system_prompt}\n\nUser: {question}",
+                                     **CHAT_GENERATION_CONFIG).text
+
+
+def precompute_answers(top_n: Optional[int] = None, min_occurrences: Optional[int] = None,
+                       days: Optional[int] = None) -> Dict:
+    """Generate answers for the current tenant's most frequent questions under its content version.
+
+    Questions already answered for this version are skipped. The tenant's
+    answers from older versions are deleted once the new set is stored.
+    """
+    top_n = top_n or PRECOMPUTE_TOP_N
+    min_occurrences = PRECOMPUTE_MIN_OCCURRENCES if min_occurrences is None else min_occurrences
+    days = days or PRECOMPUTE_LOOKBACK_DAYS
+    version = answer_content_version()
+    stats = {'content_version': version, 'generated': 0, 'kept': 0, 'failed': 0}
+
+    tenant_answers = PrecomputedAnswer.query.filter_by(tenant_id=current_tenant_id())
+
+    with ProcessLock('precompute-answers') as acquired:
+        if not acquired:
+            stats['skipped'] = 'another precompute run holds the lock'
+            return stats
+
+        clusters = find_frequent_questions(top_n, min_occurrences, days)
+        if not clusters:
+            # No fresh traffic to mine: carry forward the questions answered under older versions
+            clusters = [
+                (row.question_key, row.question, row.occurrences)
+                for row in tenant_answers.order_by(PrecomputedAnswer.occurrences.desc()).limit(top_n)
+            ]
+
+        existing = {
+            row.question_key: row
+            for row in tenant_answers.filter_by(content_version=version)
+        }
+        for key, question, occurrences in clusters:
+            if key in existing:
+                existing[key].occurrences = occurrences
+                stats['kept'] += 1
+                continue
+            try:
+                answer = _generate_answer(question)
+            except Exception as e:
+                logger.error(f"Precompute answer error for '{question}': {e}")
+                stats['failed'] += 1
+                continue
+            db.session.add(PrecomputedAnswer(
+                content_version=version,
+                question_key=key,
+                question=question,
+                answer=answer,
+                occurrences=occurrences
+            ))
+            db.session.commit()
+            existing[key] = True
+            stats['generated'] += 1
+
+        tenant_answers.filter(PrecomputedAnswer.content_version != version).delete(synchronize_session=False)
+        db.session.commit()
+
+    invalidate_precomputed_answers()
+    logger.info(f"Precomputed answers for version {version}: {stats}")
+    return stats
+
+
+def invalidate_precomputed_answers():
+    with _answer_cache_lock:
+        _answer_cache.clear()
+
+
+def _load_precomputed_answers() -> Dict[str, str]:
+    """Per-process copy of the current tenant's answers, refreshed periodically"""
+    version = answer_content_version()
+    now = time.time()
+    cached = _answer_cache.get(version)
+    if cached and now - cached[0] < PRECOMPUTED_CACHE_SECONDS:
+        return cached[1]
+
+    with _answer_cache_lock:
+        cached = _answer_cache.get(version)
+        if not cached or now - cached[0] >= PRECOMPUTED_CACHE_SECONDS:
+            rows = db.session.query(PrecomputedAnswer.question_key, PrecomputedAnswer.answer).filter_by(
+                tenant_id=current_tenant_id(), content_version=version
+            ).all()
+            cached = _answer_cache[version] = (now, dict(rows))
+            _answer_cache.move_to_end(version)
+            while len(_answer_cache) > TENANT_CACHE_SIZE:
+                _answer_cache.popitem(last=False)
+    return cached[1]
+
+
+def lookup_precomputed_answer(message: str) -> Optional[str]:
+    """Return a precomputed answer for the message's cluster, if there is one"""
+    if not PRECOMPUTED_ANSWERS_ENABLED:
+        return None
+    try:
+        return _load_precomputed_answers().get(normalize_question(message))
+    except Exception as e:
+        logger.error(f"Precomputed answer lookup error: {e}")
+        return None
+
+
+def refresh_stale_precomputed_answers():
+    """Regenerate the default tenant's answers in the background when its prompt or menu changed"""
+    if not PRECOMPUTED_ANSWERS_ENABLED:
+        return
+
+    def run():
+        try:
+            with app.app_context():
+                versions = {v for (v,) in db.session.query(PrecomputedAnswer.content_version).filter_by(
+                    tenant_id=DEFAULT_TENANT
+                ).distinct()}
+                if versions and answer_content_version() not in versions:
+                    precompute_answers()
+        except Exception as e:
+            logger.error(f"Precomputed answer refresh error: {e}")
+
+    threading.Thread(target=run, name='precompute-answers', daemon=True).start()
+
+
+@app.cli.command('precompute-answers')
+@click.option('--top', 'top_n', type=int, default=None, help='Number of question clusters to answer')
+@click.option('--min-count', type=int, default=None, help='Minimum occurrences for a cluster')
+@click.option('--days', type=int, default=None, help='How far back to mine conversations')
+@click.option('--tenant', 'tenant_id', default=DEFAULT_TENANT, help='Restaurant to answer for')
+def precompute_answers_command(top_n, min_count, days, tenant_id):
+    """Answer the most frequent chat questions ahead of time"""
+    g.tenant = tenants.get(tenant_id)
+    if g.tenant is None:
+        raise click.BadParameter(f"unknown tenant '{tenant_id}'", param_hint='--tenant')
+    click.echo(json.dumps(precompute_answers(top_n, min_count, days), indent=2))
+
+
+# ============================================================================
+# TOKEN METERING & FALLBACK ANSWERS
+# ============================================================================
+
+# Retry-After for chat turns whose model call failed outright
+LLM_ERROR_RETRY_AFTER = int(os.getenv('LLM_ERROR_RETRY_AFTER', 5))
+# Daily token budgets (prompt + completion); 0 disables the check
+TOKEN_BUDGET_SESSION_DAILY = int(os.getenv('TOKEN_BUDGET_SESSION_DAILY', 20000))
+TOKEN_BUDGET_IP_DAILY = int(os.getenv('TOKEN_BUDGET_IP_DAILY', 200000))
+# How long a worker trusts its local copy of a Redis counter
+TOKEN_BUDGET_CACHE_SECONDS = float(os.getenv('TOKEN_BUDGET_CACHE_SECONDS', 2))
+# Local copies of Redis counters kept per worker, least recently used dropped first
+TOKEN_BUDGET_CACHE_MAX_KEYS = int(os.getenv('TOKEN_BUDGET_CACHE_MAX_KEYS', 10000))
+
+_token_counters: 'OrderedDict[str, List[float]]' = OrderedDict()  # key -> [tokens, fetched_at]
+_token_counters_day = ''
+_token_counters_lock = threading.Lock()
+
+
+def _token_counter_keys(session_id: str, ip_address: Optional[str]) -> List[Tuple[str, int]]:
+    day = datetime.utcnow().strftime('%Y%m%d')
+    tenant_id = current_tenant_id()
+    keys = []
+    if TOKEN_BUDGET_SESSION_DAILY:
+        keys.append((f'tokens:{day}:{tenant_id}:session:{session_id}', TOKEN_BUDGET_SESSION_DAILY))
+    if TOKEN_BUDGET_IP_DAILY and ip_address:
+        keys.append((f'tokens:{day}:{tenant_id}:ip:{ip_address}', TOKEN_BUDGET_IP_DAILY))
+    return keys
+
+
+def _seconds_until_utc_midnight() -> int:
+    now = datetime.utcnow()
+    midnight = datetime(now.year, now.month, now.day) + timedelta(days=1)
+    return max(1, int((midnight - now).total_seconds()))
+
+
+def _store_token_count(key: str, count: int, from_redis: bool):
+    """Keep a counter locally and prune the others. Call with _token_counters_lock held."""
+    global _token_counters_day
+    today = datetime.utcnow().strftime('%Y%m%d')
+    if today != _token_counters_day:
+        # Drop yesterday's counters as a new day starts
+        for stale in [k for k in _token_counters if k.split(':')[1] != today]:
+            del _token_counters[stale]
+        _token_counters_day = today
+    _token_counters[key] = [count, time.time()]
+    _token_counters.move_to_end(key)
+    # Without Redis the local counters are the only count, so only copies are evicted
+    while from_redis and len(_token_counters) > TOKEN_BUDGET_CACHE_MAX_KEYS:
+        _token_counters.popitem(last=False)
+
+
+def _token_count(key: str) -> int:
+    """Current count for a budget key, from the local copy while it is fresh"""
+    now = time.time()
+    cached = _token_counters.get(key)
+    if cached and now - cached[1] < TOKEN_BUDGET_CACHE_SECONDS:
+        return int(cached[0])
+
+    redis_client = get_redis()
+    if redis_client is None:
+        return int(cached[0]) if cached else 0  # per-process counters are authoritative
+
+    try:
+        count = int(redis_client.get(key) or 0)
+    except Exception as e:
+        logger.error(f"Token budget lookup error: {e}")
+        return int(cached[0]) if cached else 0
+    with _token_counters_lock:
+        _store_token_count(key, count, from_redis=True)
+    return count
+
+
+def check_token_budget(session_id: str, ip_address: Optional[str]) -> Optional[int]:
+    """Return Retry-After seconds if the session or IP has used up today's budget"""
+    for key, budget in _token_counter_keys(session_id, ip_address):
+        if _token_count(key) >= budget:
+            return _seconds_until_utc_midnight()
+    return None
+
+
+def record_token_usage(session_id: str, ip_address: Optional[str], prompt_tokens: int, completion_tokens: int):
+    """Count a model call against the budgets and the daily usage table"""
+    tokens = prompt_tokens + completion_tokens
+    keys = [key for key, _ in _token_counter_keys(session_id, ip_address)]
+
+    redis_client = get_redis()
+    if redis_client is not None and keys:
+        try:
+            pipe = redis_client.pipeline()
+            for key in keys:
+                pipe.incrby(key, tokens)
+                pipe.expire(key, 2 * 24 * 3600)
+            results = pipe.execute()
+            with _token_counters_lock:
+                for key, count in zip(keys, results[::2]):
+                    _store_token_count(key, count, from_redis=True)
+        except Exception as e:
+            logger.error(f"Token budget update error: {e}")
+    else:
+        with _token_counters_lock:
+            for key in keys:
+                cached = _token_counters.get(key)
+                _store_token_count(key, int(cached[0] if cached else 0) + tokens, from_redis=False)
+
+    try:
+        key = {'day': datetime.utcnow().date(), 'tenant_id': current_tenant_id(), 'session_id': session_id}
+        usage = db.session.get(TokenUsage, key)
+        if usage is None:
+            usage = TokenUsage(**key, ip_address=ip_address, calls=0, prompt_tokens=0, completion_tokens=0)
+            db.session.add(usage)
+        usage.calls += 1
+        usage.prompt_tokens += prompt_tokens
+        usage.completion_tokens += completion_tokens
+        db.session.commit()
+    except Exception as e:
+        logger.error(f"Token usage recording error: {e}")
+        db.session.rollback()
+
+
+def templated_answer(message: str) -> Optional[str]:
+    """Answer common questions straight from the restaurant config, without the model"""
+    text_lower = message.lower()
+    config = current_tenant().config
+    name = config['name']
+    hours = config['hours']
+
+    if any(word in text_lower for word in ('hour', 'open', 'close', 'closing', 'when')):
+        return (f"{name} is open Monday to Thursday {hours['monday_thursday']}, "
+                f"Friday and Saturday {hours['friday_saturday']}, and Sunday {hours['sunday']}.")
+    if any(word in text_lower for word in ('where', 'address', 'location', 'located', 'directions')):
+        return f"You'll find {name} at {config['location']}."
+    if any(word in text_lower for word in ('phone', 'call', 'contact', 'email')):
+        return f"You can reach us at {config['phone']} or {config['email']}."
+    if 'vegan' in text_lower or 'vegetarian' in text_lower:
+        key = 'vegan' if 'vegan' in text_lower else 'vegetarian'
+        dishes = [item['name'] for item in get_menu_index()['items'] if item.get(key)]
+        return f"Our {key} options include {', '.join(dishes)}."
+    if any(word in text_lower for word in ('menu', 'dish', 'food', 'recommend', 'eat')):
+        categories = ', '.join(category.replace('_', ' ') for category in config['menu'])
+        return f"Our menu has {categories}. You can browse the full menu with prices in the Menu tab."
+    return None
+
+
+def over_budget_response(retry_after: int) -> Tuple[Dict, int]:
+    return {
+        'success': False,
+        'error': 'Token budget exceeded, please try again later',
+        'retry_after': retry_after
+    }, 429
+
+
+def model_unavailable_response(retry_after: float) -> Tuple[Dict, int]:
+    return {
+        'success': False,
+        'error': 'The assistant is temporarily unavailable, please try again shortly',
+        'retry_after': max(1, math.ceil(retry_after))
+    }, 503
+
+
+def degraded_chat_turn(pending: Dict, retry_after: float, batch_rows: Optional[List] = None) -> Tuple[Dict, int]:
+    """Reply to a chat turn without the model, e.g. while its circuit is open"""
+    answer = templated_answer(pending['user_message'])
+    if answer is None:
+        return model_unavailable_response(retry_after)
+    body = finish_chat_turn(pending, answer, batch_rows=batch_rows)
+    body['degraded'] = True
+    return body, 200
+
+
+def api_response(body: Dict, status: int = 200):
+    """JSON response that carries a Retry-After header when the body asks for one"""
+    response = jsonify(body)
+    response.status_code = status
+    if 'retry_after' in body:
+        response.headers['Retry-After'] = str(body['retry_after'])
+    return response
+
+
+# ============================================================================
+# ADMISSION CONTROL
+# ============================================================================
+
+# Priority classes, most important first. Requests outside these classes
+# (health, metrics, analytics) are never shed.
+ADMISSION_CLASSES = {
+    'transactional': {'create_order', 'confirm_order_from_chat', 'create_reservation',
+                      'handle_order_intent', 'handle_reservation_intent', 'update_order_status'},
+    'menu': {'get_menu', 'get_menu_category', 'get_config', 'get_order', 'get_reservation', 'cart_quote'},
+    'chat': {'chat', 'chat_batch', 'get_recommendations'},
+    # Admitted by stream_order_events itself, for the life of the stream
+    'stream': set(),
+}
+ADMISSION_ENABLED = os.getenv('ADMISSION_ENABLED', 'true').lower() == 'true'
+# Requests one process serves at once. 0 takes it from the server (gunicorn threads,
+# set in post_worker_init); when the server doesn't say, classes are not capped
+ADMISSION_CAPACITY = int(os.getenv('ADMISSION_CAPACITY', 0))
+# Share of the pool each class may occupy; transactional writes may use all of it
+ADMISSION_SHARES = {
+    'transactional': 1.0,
+    'menu': float(os.getenv('ADMISSION_MENU_SHARE', 0.8)),
+    'chat': float(os.getenv('ADMISSION_CHAT_SHARE', 0.5)),
+    'stream': float(os.getenv('ADMISSION_STREAM_SHARE', 0.5)),
+}
+# How long a request may wait for a slot before it is shed
+ADMISSION_MAX_WAIT_MS = {
+    'menu': int(os.getenv('ADMISSION_MENU_MAX_WAIT_MS', 250)),
+    'chat': int(os.getenv('ADMISSION_CHAT_MAX_WAIT_MS', 0)),
+}
+# Transactional p95 latency above this sheds chat; above twice this, menu reads too
+ADMISSION_TARGET_MS = int(os.getenv('ADMISSION_TRANSACTIONAL_TARGET_MS', 1000))
+ADMISSION_WINDOW_SECONDS = int(os.getenv('ADMISSION_WINDOW_SECONDS', 10))
+ADMISSION_RETRY_AFTER = int(os.getenv('ADMISSION_RETRY_AFTER', 2))
+
+
+class RequestShed(Exception):
+    """Raised when the admission controller turns a request away"""
+
+    def __init__(self, request_class: str, retry_after: int):
+        super().__init__(f"Shed {request_class} request")
+        self.request_class = request_class
+        self.retry_after = retry_after
+
+
+class AdmissionController:
+    """Priority admission for the requests this process serves.
+
+    Capped classes hold one of their share of the process's capacity (its
+    request threads) while they run, counted in memory. Latency and queue
+    depth are tracked per class; when transactional latency drifts past its
+    target the lowest class is shed first.
+    """
+
+    def __init__(self, capacity: int = 0):
+        self.capacity = capacity
+        self._lock = threading.Lock()
+        self._slot_freed = threading.Condition(self._lock)
+        self._held = {name: 0 for name in ADMISSION_CLASSES}
+        self._latencies = {name: deque() for name in ADMISSION_CLASSES}
+        self.stats = {
+            name: {'in_flight': 0, 'queued': 0, 'admitted': 0, 'shed': 0}
+            for name in ADMISSION_CLASSES
+        }
+
+    @staticmethod
+    def classify(endpoint: Optional[str]) -> Optional[str]:
+        for name, endpoints in ADMISSION_CLASSES.items():
+            if endpoint in endpoints:
+                return name
+        return None
+
+    def configure(self, threads: int):
+        """Take the capacity from the server unless ADMISSION_CAPACITY sets it"""
+        if not ADMISSION_CAPACITY:
+            self.capacity = max(1, int(threads))
+
+    def slots(self, request_class: str) -> int:
+        """Slots the class may hold right now; 0 means uncapped, -1 shed"""
+        if request_class == 'transactional':
+            return 0
+        p95 = self.latency_p95('transactional')
+        if p95 is not None:
+            overload = p95 * 1000 / ADMISSION_TARGET_MS
+            if (request_class in ('chat', 'stream') and overload > 1) or overload > 2:
+                return -1
+        if not self.capacity:
+            return 0
+        slots = max(1, int(self.capacity * ADMISSION_SHARES[request_class]))
+        if request_class == 'stream':
+            # Streams hold their thread, so at least one is always left for everything else
+            slots = min(slots, self.capacity - 1)
+            if slots <= 0:
+                return -1
+        return slots
+
+    def admit(self, request_class: str, bounded: bool = False) -> Dict:
+        """Admit a request or raise RequestShed; pass the ticket to release().
+
+        `bounded` is for callers that cap their own concurrency (the ASGI chat
+        path): no slot is taken, so this never blocks, and only latency-based
+        shedding applies.
+        """
+        stats = self.stats[request_class]
+        slots = self.slots(request_class)
+        if slots < 0:
+            raise self.shed(request_class)
+        held = bool(slots) and not bounded
+        with self._lock:
+            if held and self._held[request_class] >= slots:
+                deadline = time.monotonic() + ADMISSION_MAX_WAIT_MS.get(request_class, 0) / 1000
+                stats['queued'] += 1
+                try:
+                    while self._held[request_class] >= slots:
+                        remaining = deadline - time.monotonic()
+                        if remaining <= 0:
+                            break
+                        self._slot_freed.wait(remaining)
+                finally:
+                    stats['queued'] -= 1
+                if self._held[request_class] >= slots:
+                    stats['shed'] += 1
+                    raise RequestShed(request_class, ADMISSION_RETRY_AFTER)
+            if held:
+                self._held[request_class] += 1
+            stats['in_flight'] += 1
+            stats['admitted'] += 1
+        return {'class': request_class, 'held': held, 'started': time.perf_counter()}
+
+    def shed(self, request_class: str) -> RequestShed:
+        """Count a shed request; returns the exception to raise"""
+        with self._lock:
+            self.stats[request_class]['shed'] += 1
+        return RequestShed(request_class, ADMISSION_RETRY_AFTER)
+
+    def release(self, ticket: Dict):
+        now = time.time()
+        latencies = self._latencies[ticket['class']]
+        with self._lock:
+            if ticket['held']:
+                self._held[ticket['class']] -= 1
+                self._slot_freed.notify_all()
+            self.stats[ticket['class']]['in_flight'] -= 1
+            latencies.append((now, time.perf_counter() - ticket['started']))
+            while latencies and latencies[0][0] < now - ADMISSION_WINDOW_SECONDS:
+                latencies.popleft()
+
+    def latency_p95(self, request_class: str) -> Optional[float]:
+        now = time.time()
+        with self._lock:
+            recent = sorted(latency for at, latency in self._latencies[request_class]
+                            if at >= now - ADMISSION_WINDOW_SECONDS)
+        if len(recent) < 5:
+            return None
+        return recent[min(len(recent) - 1, int(0.95 * len(recent)))]
+
+    def metrics(self) -> Dict:
+        result = {}
+        for name in ADMISSION_CLASSES:
+            p95 = self.latency_p95(name)
+            result[name] = {
+                **self.stats[name],
+                'slots': self.slots(name),
+                'p95_latency_ms': round(p95 * 1000, 1) if p95 is not None else None
+            }
+        return result
+
+
+admission = AdmissionController(ADMISSION_CAPACITY)
+
+
+def shed_response(e: RequestShed):
+    return api_response({
+        'success': False,
+        'error': 'The restaurant assistant is busy, please try again shortly',
+        'retry_after': e.retry_after
+    }, 503)
+
+
+@app.before_request
+def admit_request():
+    """Admit or shed the request according to its priority class"""
+    request_class = admission.classify(request.endpoint)
+    if not ADMISSION_ENABLED or request_class is None:
+        return None
+    try:
+        g.admission_ticket = admission.admit(request_class)
+    except RequestShed as e:
+        return shed_response(e)
+    return None
+
+
+@app.teardown_request
+def release_admission(exc):
+    ticket = g.pop('admission_ticket', None)
+    if ticket is not None:
+        admission.release(ticket)
+
+
+# ============================================================================
+# DATA RETENTION & ARCHIVAL
+# ============================================================================
+
+RETENTION_DAYS = int(os.getenv('RETENTION_DAYS', 90))
+RETENTION_BATCH_SIZE = int(os.getenv('RETENTION_BATCH_SIZE', 1000))
+RETENTION_DELETE_CHUNK = int(os.getenv('RETENTION_DELETE_CHUNK', 200))
+RETENTION_SCHEDULE_MINUTES = int(os.getenv('RETENTION_SCHEDULE_MINUTES', 0))  # 0 disables the job
+ARCHIVE_DIR = os.getenv('ARCHIVE_DIR', os.path.join(app.instance_path, 'archive'))
+ARCHIVE_COMPRESSION = os.getenv('ARCHIVE_COMPRESSION', 'gzip')  # gzip or zstd (needs zstandard)
+
+
+def _archive_extension() -> str:
+    return '.jsonl.zst' if ARCHIVE_COMPRESSION == 'zstd' else '.jsonl.gz'
+
+
+def _open_archive(path: str, mode: str):
+    """Open a compressed JSONL partition in text mode"""
+    if path.endswith('.zst'):
+        import zstandard
+        return zstandard.open(path, mode, encoding='utf-8')
+    return gzip.open(path, mode, encoding='utf-8')
+
+
+def _row_to_record(row) -> Dict:
+    """Serialize every column of a model instance"""
+    record = {}
+    for column in row.__table__.columns:
+        value = getattr(row, column.name)
+        record[column.name] = value.isoformat() if isinstance(value, datetime) else value
+    return record
+
+
+def _session_shard(session_id: str) -> str:
+    """Hash prefix that spreads sessions over index shards (2 hex digits) and partitions (the first)"""
+    return hashlib.sha1(session_id.encode('utf-8')).hexdigest()[:2]
+
+
+def _index_shard_path(shard: str) -> str:
+    return os.path.join(ARCHIVE_DIR, 'index', f'{shard}.jsonl')
+
+
+def _read_archive_index(session_id: str) -> List[str]:
+    """Partition files holding a session, from its index shard only"""
+    partitions = []
+    path = _index_shard_path(_session_shard(session_id))
+    if os.path.exists(path):
+        with open(path, encoding='utf-8') as f:
+            for line in f:
+                entry_session, relative_path = json.loads(line)
+                if entry_session == session_id and relative_path not in partitions:
+                    partitions.append(relative_path)
+    # index.json from before the index was sharded, until the next archival run converts it
+    legacy_path = os.path.join(ARCHIVE_DIR, 'index.json')
+    if os.path.exists(legacy_path):
+        with open(legacy_path, encoding='utf-8') as f:
+            partitions.extend(p for p in json.load(f).get(session_id, []) if p not in partitions)
+    return partitions
+
+
+def _write_archive_index(entries: Dict[str, List[Tuple[str, str]]]):
+    """Append (session_id, partition) entries to their shards; nothing already written is rewritten"""
+    os.makedirs(os.path.join(ARCHIVE_DIR, 'index'), exist_ok=True)
+    for shard, shard_entries in entries.items():
+        with open(_index_shard_path(shard), 'a', encoding='utf-8') as f:
+            f.writelines(json.dumps(entry, ensure_ascii=False) + '\n' for entry in shard_entries)
+
+
+def _convert_legacy_archive_index():
+    """Split a single index.json into shards (call with the retention lock held)"""
+    legacy_path = os.path.join(ARCHIVE_DIR, 'index.json')
+    if not os.path.exists(legacy_path):
+        return
+    with open(legacy_path, encoding='utf-8') as f:
+        legacy = json.load(f)
+    entries: Dict[str, List[Tuple[str, str]]] = {}
+    for session_id, partitions in legacy.items():
+        for relative_path in partitions:
+            entries.setdefault(_session_shard(session_id), []).append((session_id, relative_path))
+    _write_archive_index(entries)
+    os.remove(legacy_path)
+    logger.info(f"Split the archive index of {len(legacy)} sessions into {len(entries)} shards")
+
+
+def _append_to_archive(kind: str, records: List[Dict], time_field: str, indexed: set):
+    """Append records to per-month, per-shard partitions (appended gzip/zstd frames stay readable).
+
+    New (session, partition) pairs are indexed before the caller deletes the
+    rows; `indexed` holds the pairs this run has already written.
+    """
+    by_partition: Dict[str, List[Dict]] = {}
+    for record in records:
+        relative_path = f"{kind}/{record[time_field][:7]}/{_session_shard(record['session_id'])[0]}{_archive_extension()}"
+        by_partition.setdefault(relative_path, []).append(record)
+
+    new_entries: Dict[str, List[Tuple[str, str]]] = {}
+    for relative_path, partition_records in by_partition.items():
+        path = os.path.join(ARCHIVE_DIR, relative_path)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with _open_archive(path, 'at') as f:
+            for record in partition_records:
+                f.write(json.dumps(record, ensure_ascii=False) + '\n')
+
+        for record in partition_records:
+            if (record['session_id'], relative_path) not in indexed:
+                indexed.add((record['session_id'], relative_path))
+                new_entries.setdefault(_session_shard(record['session_id']), []).append(
+                    (record['session_id'], relative_path)
+                )
+    _write_archive_index(new_entries)
+
+
+def _delete_in_chunks(model, ids: List[int]):
+    """Delete rows by id in short transactions so no lock is held for long"""
+    for start in range(0, len(ids), RETENTION_DELETE_CHUNK):
+        chunk = ids[start:start + RETENTION_DELETE_CHUNK]
+        model.query.filter(model.id.in_(chunk)).delete(synchronize_session=False)
+        db.session.commit()
+
+
+def archive_old_data(older_than_days: Optional[int] = None, batch_size: Optional[int] = None,
+                     dry_run: bool = False) -> Dict:
+    """Move conversations and sessions past the retention window into the archive.
+
+    Rows are read in id order, batch by batch; each batch is appended to its
+    monthly partitions (16 per month, by session id hash) and indexed before
+    it is deleted. A crash between those two steps
+    can archive a batch twice, which lookups tolerate by de-duplicating on id.
+    """
+    days = RETENTION_DAYS if older_than_days is None else older_than_days
+    batch_size = batch_size or RETENTION_BATCH_SIZE
+    cutoff = datetime.utcnow() - timedelta(days=days)
+    stats = {'cutoff': cutoff.isoformat(), 'conversations': 0, 'sessions': 0, 'dry_run': dry_run}
+
+    if dry_run:
+        stats['conversations'] = Conversation.query.filter(Conversation.timestamp < cutoff).count()
+        stats['sessions'] = UserSession.query.filter(UserSession.last_activity < cutoff).count()
+        return stats
+
+    with ProcessLock('retention') as acquired:
+        if not acquired:
+            stats['skipped'] = 'another archival run holds the lock'
+            return stats
+
+        _convert_legacy_archive_index()
+        indexed = set()
+        for model, kind, time_column, stat_key in (
+            (Conversation, 'conversations', Conversation.timestamp, 'conversations'),
+            (UserSession, 'user_sessions', UserSession.last_activity, 'sessions'),
+        ):
+            last_id = 0
+            while True:
+                rows = model.query.filter(
+                    time_column < cutoff, model.id > last_id
+                ).order_by(model.id).limit(batch_size).all()
+                if not rows:
+                    break
+
+                last_id = rows[-1].id
+                records = [_row_to_record(row) for row in rows]
+                ids = [row.id for row in rows]
+                db.session.expunge_all()
+
+                _append_to_archive(kind, records, time_column.key, indexed)
+                _delete_in_chunks(model, ids)
+                stats[stat_key] += len(ids)
+
+    logger.info(f"Archived {stats['conversations']} conversations and {stats['sessions']} sessions older than {days} days")
+    return stats
+
+
+def lookup_archived_conversation(session_id: str) -> List[Dict]:
+    """Return archived messages for a session, oldest first"""
+    records = {}
+    for relative_path in _read_archive_index(session_id):
+        if not relative_path.startswith('conversations/'):
+            continue
+        path = os.path.join(ARCHIVE_DIR, relative_path)
+        if not os.path.exists(path):
+            continue
+        with _open_archive(path, 'rt') as f:
+            for line in f:
+                record = json.loads(line)
+                if record['session_id'] == session_id and record.get('tenant_id', DEFAULT_TENANT) == current_tenant_id():
+                    records[record['id']] = record
+
+    return sorted(records.values(), key=lambda r: (r['timestamp'], r['id']))
+
+
+def start_retention_scheduler():
+    """Run archive_old_data every RETENTION_SCHEDULE_MINUTES in a daemon thread"""
+    if RETENTION_SCHEDULE_MINUTES <= 0:
+        return
+
+    def run():
+        while True:
+            time.sleep(RETENTION_SCHEDULE_MINUTES * 60)
+            try:
+                with app.app_context():
+                    archive_old_data()
+            except Exception as e:
+                logger.error(f"Retention job error: {e}")
+
+    threading.Thread(target=run, name='retention-scheduler', daemon=True).start()
+
+
+@app.cli.command('archive-old-data')
+@click.option('--days', type=int, default=None, help='Retention window in days (default RETENTION_DAYS)')
+@click.option('--batch-size', type=int, default=None, help='Rows per archive batch')
+@click.option('--dry-run', is_flag=True, help='Only count the rows that would be archived')
+def archive_old_data_command(days, batch_size, dry_run):
+    """Archive and delete conversations and sessions past the retention window"""
+    click.echo(json.dumps(archive_old_data(days, batch_size, dry_run), indent=2))
+
+
+@app.cli.command('archive-lookup')
+@click.argument('session_id')
+def archive_lookup_command(session_id):
+    """Print archived messages for a session as JSONL"""
+    for record in lookup_archived_conversation(session_id):
+        click.echo(json.dumps(record, ensure_ascii=False))
+
+
+# ============================================================================
+# COLUMN COMPRESSION
+# ============================================================================
+
+# CompressedText columns (see DATABASE MODELS). On SQLite, existing rows are
+# rewritten by recompress_columns() after COLUMN_COMPRESSION or the dictionary
+# changes. Workers pick up a newly trained dictionary when they restart; frames
+# written with older dictionaries stay readable. On Postgres the same job moves
+# pglz-compressed values to lz4.
+COMPRESSED_COLUMNS = {
+    'conversations': (Conversation, ('user_message', 'bot_response')),
+    'orders': (Order, ('special_requests',)),
+}
+COMPRESSION_DICT_SIZE = int(os.getenv('COMPRESSION_DICT_SIZE', 112640))
+COMPRESSION_TRAINING_SAMPLES = int(os.getenv('COMPRESSION_TRAINING_SAMPLES', 20000))
+RECOMPRESS_BATCH_SIZE = int(os.getenv('RECOMPRESS_BATCH_SIZE', 500))
+RECOMPRESS_PAUSE_SECONDS = float(os.getenv('RECOMPRESS_PAUSE_SECONDS', 0.05))
+RECOMPRESS_ON_START = os.getenv('RECOMPRESS_ON_START', 'false').lower() == 'true'
+
+
+def configure_column_compression():
+    """Use lz4 TOAST compression for the CompressedText columns on Postgres 14+"""
+    if COLUMN_COMPRESSION != 'zstd' or db.engine.dialect.name != 'postgresql':
+        return
+    try:
+        with db.engine.begin() as conn:
+            for model, names in COMPRESSED_COLUMNS.values():
+                for name in names:
+                    # ALTER takes an exclusive lock, so only run it when the setting differs ('l' is lz4)
+                    current = conn.execute(text(
+                        "SELECT attcompression FROM pg_attribute WHERE attrelid = to_regclass(:table) AND attname = :column"
+                    ), {'table': model.__tablename__, 'column': name}).scalar()
+                    if current != 'l':
+                        conn.execute(text(f"ALTER TABLE {model.__tablename__} ALTER COLUMN {name} SET COMPRESSION lz4"))
+    except DatabaseError as e:
+        logger.info(f"Skipped lz4 column compression: {e}")
+
+
+def train_compression_dictionary(samples: Optional[int] = None, dict_size: Optional[int] = None) -> Dict:
+    """Train a zstd dictionary on the newest stored text and make it the one new values use"""
+    import zstandard
+
+    samples = samples or COMPRESSION_TRAINING_SAMPLES
+    texts = []
+    for model, names in COMPRESSED_COLUMNS.values():
+        for name in names:
+            column = getattr(model, name)
+            query = db.session.query(column).filter(column.isnot(None)).order_by(model.id.desc()).limit(samples)
+            texts.extend(value.encode('utf-8') for (value,) in query if value)
+
+    dictionary = zstandard.train_dictionary(dict_size or COMPRESSION_DICT_SIZE, texts, level=COMPRESSION_LEVEL)
+    dict_id = dictionary.dict_id()
+    os.makedirs(COMPRESSION_DIR, exist_ok=True)
+    with open(os.path.join(COMPRESSION_DIR, f'{dict_id}.zdict'), 'wb') as f:
+        f.write(dictionary.as_bytes())
+    current_path = os.path.join(COMPRESSION_DIR, 'current')
+    with open(f'{current_path}.tmp', 'w') as f:
+        f.write(str(dict_id))
+    os.replace(f'{current_path}.tmp', current_path)
+    text_codec.reload()
+
+    logger.info(f"Trained compression dictionary {dict_id} on {len(texts)} samples")
+    return {'dict_id': dict_id, 'samples': len(texts), 'dict_bytes': len(dictionary.as_bytes())}
+
+
+def _needs_recompression(value) -> bool:
+    """Whether a raw SQLite value differs from how CompressedText would store it now"""
+    if value is None:
+        return False
+    if COLUMN_COMPRESSION != 'zstd':
+        return not isinstance(value, str)
+    dict_id = text_codec.frame_dictionary_id(value)
+    if dict_id is not None:
+        return dict_id != text_codec.current_dictionary_id()
+    return len(value.encode('utf-8') if isinstance(value, str) else value) >= COMPRESSION_MIN_BYTES
+
+
+def _recompress_sqlite_batch(table, names, last_id: int, batch_size: int) -> Tuple[Optional[int], int]:
+    """Rewrite one id-ordered batch; returns (last id seen, rows rewritten)"""
+    rows = db.session.execute(
+        select(table.c.id, *[literal_column(f'{table.name}.{name}') for name in names])
+        .where(table.c.id > last_id).order_by(table.c.id).limit(batch_size)
+    ).all()
+    if not rows:
+        return None, 0
+
+    # Raw values come back undecoded; the typed UPDATE re-encodes the text
+    params = [
+        {'row_id': row[0], **{name: text_codec.decode(value) if value is not None else None
+                              for name, value in zip(names, row[1:])}}
+        for row in rows if any(_needs_recompression(value) for value in row[1:])
+    ]
+    if params:
+        db.session.execute(
+            update(table).where(table.c.id == bindparam('row_id'))
+            .values({name: bindparam(name, type_=table.c[name].type) for name in names}),
+            params
+        )
+    db.session.commit()
+    return rows[-1][0], len(params)
+
+
+def _recompress_postgres_batch(table, names, last_id: int, batch_size: int) -> Tuple[Optional[int], int]:
+    """Rewrite pglz-compressed values in one id range so Postgres stores them as lz4"""
+    upper = db.session.execute(
+        select(func.max(literal_column('id'))).select_from(
+            select(table.c.id).where(table.c.id > last_id).order_by(table.c.id).limit(batch_size).subquery()
+        )
+    ).scalar()
+    if upper is None:
+        return None, 0
+
+    rewritten = 0
+    for name in names:
+        rewritten += db.session.execute(text(
+            f"UPDATE {table.name} SET {name} = {name} || '' "
+            f"WHERE id > :last_id AND id <= :upper AND pg_column_compression({name}) = 'pglz'"
+        ), {'last_id': last_id, 'upper': upper}).rowcount
+    db.session.commit()
+    return upper, rewritten
+
+
+def recompress_columns(batch_size: Optional[int] = None, pause: Optional[float] = None) -> Dict[str, int]:
+    """Rewrite stored CompressedText values with the current codec, in short batches"""
+    batch_size = batch_size or RECOMPRESS_BATCH_SIZE
+    pause = RECOMPRESS_PAUSE_SECONDS if pause is None else pause
+    dialect = db.engine.dialect.name
+    if dialect == 'sqlite':
+        recompress_batch = _recompress_sqlite_batch
+    elif dialect == 'postgresql':
+        recompress_batch = _recompress_postgres_batch
+    else:
+        return {'skipped': f'no column compression on {dialect}'}
+
+    stats = {}
+    with ProcessLock('recompress') as acquired:
+        if not acquired:
+            return {'skipped': 'another recompression run holds the lock'}
+
+        for kind, (model, names) in COMPRESSED_COLUMNS.items():
+            stats[kind] = 0
+            last_id = 0
+            while True:
+                last_id, rewritten = recompress_batch(model.__table__, names, last_id, batch_size)
+                if last_id is None:
+                    break
+                stats[kind] += rewritten
+                if rewritten and pause:
+                    time.sleep(pause)
+
+    logger.info(f"Recompressed {stats}")
+    return stats
+
+
+def start_recompression():
+    """With RECOMPRESS_ON_START, run recompress_columns once in a daemon thread"""
+    if not RECOMPRESS_ON_START:
+        return
+
+    def run():
+        try:
+            with app.app_context():
+                recompress_columns()
+        except Exception as e:
+            logger.error(f"Recompression job error: {e}")
+
+    threading.Thread(target=run, name='recompression', daemon=True).start()
+
+
+@app.cli.command('train-compression-dictionary')
+@click.option('--samples', type=int, default=None, help='Newest values to sample from each column')
+@click.option('--dict-size', type=int, default=None, help='Dictionary size in bytes')
+def train_compression_dictionary_command(samples, dict_size):
+    """Train the shared zstd dictionary for compressed text columns"""
+    click.echo(json.dumps(train_compression_dictionary(samples, dict_size), indent=2))
+
+
+@app.cli.command('recompress-columns')
+@click.option('--batch-size', type=int, default=None, help='Rows per transaction')
+@click.option('--pause', type=float, default=None, help='Seconds to sleep between batches')
+def recompress_columns_command(batch_size, pause):
+    """Rewrite existing rows with the current column compression"""
+    click.echo(json.dumps(recompress_columns(batch_size, pause), indent=2))
+
+
+# ============================================================================
+# EXPORTS
+# ============================================================================
+
+# Exports read rows through a server-side cursor (yield_per) and write NDJSON
+# or CSV in chunks of about EXPORT_CHUNK_BYTES, gzipped on the fly if asked,
+# so memory stays flat however many rows there are. The HTTP endpoint is
+# disabled unless EXPORT_API_KEY is set and sent as a Bearer token.
+EXPORT_API_KEY = os.getenv('EXPORT_API_KEY')
+EXPORT_BATCH_SIZE = int(os.getenv('EXPORT_BATCH_SIZE', 1000))
+EXPORT_CHUNK_BYTES = int(os.getenv('EXPORT_CHUNK_BYTES', 64 * 1024))
+EXPORT_FORMATS = {'ndjson': 'application/x-ndjson', 'csv': 'text/csv'}
+EXPORT_SOURCES = {
+    'orders': (Order, Order.created_at),
+    'reservations': (Reservation, Reservation.created_at),
+    'conversations': (Conversation, Conversation.timestamp),
+}
+
+
+def _parse_day_bounds(since: Optional[str], until: Optional[str]) -> Tuple[Optional[datetime], Optional[datetime]]:
+    """Read optional YYYY-MM-DD bounds, both inclusive"""
+    start = datetime.strptime(since, '%Y-%m-%d') if since else None
+    end = datetime.strptime(until, '%Y-%m-%d') + timedelta(days=1) if until else None
+    return start, end
+
+
+def _export_value(value):
+    return value.isoformat() if isinstance(value, date) else value
+
+
+def export_rows(kind: str, tenant_id: str, start: Optional[datetime] = None, end: Optional[datetime] = None):
+    """Yield a tenant's rows in id order as column -> value mappings"""
+    model, time_column = EXPORT_SOURCES[kind]
+    table = model.__table__
+    query = select(table).where(table.c.tenant_id == tenant_id)
+    if start is not None:
+        query = query.where(time_column >= start)
+    if end is not None:
+        query = query.where(time_column < end)
+    query = query.order_by(table.c.id)
+
+    result = read_from_replica(
+        lambda: db.session.execute(query, execution_options={'yield_per': EXPORT_BATCH_SIZE})
+    )
+    try:
+        for row in result:
+            yield row._mapping
+    finally:
+        result.close()
+
+
+def iter_export(kind: str, fmt: str, tenant_id: str, start: Optional[datetime] = None,
+                end: Optional[datetime] = None):
+    """Yield the export as NDJSON or CSV text chunks"""
+    columns = [column.name for column in EXPORT_SOURCES[kind][0].__table__.columns]
+    buffer = io.StringIO()
+    writer = csv.writer(buffer) if fmt == 'csv' else None
+    if writer is not None:
+        writer.writerow(columns)
+
+    for row in export_rows(kind, tenant_id, start, end):
+        if writer is not None:
+            writer.writerow([_export_value(row[name]) for name in columns])
+        else:
+            buffer.write(json.dumps({name: _export_value(row[name]) for name in columns}, ensure_ascii=False) + '\n')
+        if buffer.tell() >= EXPORT_CHUNK_BYTES:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+
+    if buffer.tell():
+        yield buffer.getvalue()
+
+
+def gzip_chunks(chunks):
+    """Gzip a stream of text chunks without holding more than one chunk"""
+    compressor = zlib.compressobj(wbits=31)
+    for chunk in chunks:
+        data = compressor.compress(chunk.encode('utf-8'))
+        if data:
+            yield data
+    yield compressor.flush()
+
+
+@app.route('/api/export/<kind>', methods=['GET'])
+@limiter.limit("10 per hour")
+def export_data(kind: str):
+    """Stream the tenant's orders, reservations or conversations (?format=ndjson|csv&since=&until=&gzip=true)"""
+    if not bearer_token_matches(EXPORT_API_KEY):
+        return jsonify({'success': False, 'error': 'Export authorization required'}), 401
+    if kind not in EXPORT_SOURCES:
+        return jsonify({'error': f"Unknown export '{kind}'", 'available': sorted(EXPORT_SOURCES)}), 404
+
+    fmt = request.args.get('format', 'ndjson')
+    if fmt not in EXPORT_FORMATS:
+        return jsonify({'error': f"Format must be one of: {', '.join(EXPORT_FORMATS)}"}), 400
+    try:
+        start, end = _parse_day_bounds(request.args.get('since'), request.args.get('until'))
+    except ValueError:
+        return jsonify({'error': 'Invalid date format (use YYYY-MM-DD)'}), 400
+
+    chunks = iter_export(kind, fmt, current_tenant_id(), start, end)
+    filename, mimetype = f"{current_tenant_id()}-{kind}.{fmt}", EXPORT_FORMATS[fmt]
+    if request.args.get('gzip', 'false').lower() == 'true':
+        chunks, filename, mimetype = gzip_chunks(chunks), f"{filename}.gz", 'application/gzip'
+
+    return app.response_class(stream_with_context(chunks), mimetype=mimetype, headers={
+        'Content-Disposition': f'attachment; filename="{filename}"',
+        'X-Accel-Buffering': 'no'
+    })
+
+
+@app.cli.command('export-data')
+@click.argument('kind', type=click.Choice(sorted(EXPORT_SOURCES)))
+@click.option('--format', 'fmt', type=click.Choice(sorted(EXPORT_FORMATS)), default='ndjson')
+@click.option('--since', default=None, help='First day to include (YYYY-MM-DD)')
+@click.option('--until', default=None, help='Last day to include (YYYY-MM-DD)')
+@click.option('--tenant', 'tenant_id', default=DEFAULT_TENANT, help='Restaurant to export')
+@click.option('--gzip', 'compress', is_flag=True, help='Gzip the output')
+@click.option('--out', default='-', type=click.Path(dir_okay=False, allow_dash=True), help='Output file (default stdout)')
+def export_data_command(kind, fmt, since, until, tenant_id, compress, out):
+    """Stream orders, reservations or conversations to a file"""
+    if tenants.get(tenant_id) is None:
+        raise click.BadParameter(f"unknown tenant '{tenant_id}'", param_hint='--tenant')
+    try:
+        start, end = _parse_day_bounds(since, until)
+    except ValueError:
+        raise click.BadParameter('use YYYY-MM-DD', param_hint='--since/--until')
+
+    chunks = iter_export(kind, fmt, tenant_id, start, end)
+    chunks = gzip_chunks(chunks) if compress else (chunk.encode('utf-8') for chunk in chunks)
+    with click.open_file(out, 'wb') as f:
+        for chunk in chunks:
+            f.write(chunk)
+
+
+# ============================================================================
+# CONVERSATION SEARCH
+# ============================================================================
+
+# Full-text index over user_message and bot_response. SQLite uses an FTS5
+# table kept in sync by triggers, with tenant_id indexed too so the tenant
+# filter runs inside the index. Postgres uses a generated tsvector column
+# with a GIN index. Other databases fall back to a LIKE scan. The endpoint is
+# for support staff and is disabled unless SUPPORT_API_KEY is set and sent
+# as a Bearer token.
+SUPPORT_API_KEY = os.getenv('SUPPORT_API_KEY')
+SEARCH_LANGUAGE = os.getenv('SEARCH_LANGUAGE', 'english')  # Postgres text search configuration
+SEARCH_MAX_PER_PAGE = 100
+SEARCH_MAX_CANDIDATES = int(os.getenv('SEARCH_MAX_CANDIDATES', 500))
+SEARCH_BM25_K1 = 1.2
+SEARCH_BM25_B = 0.75
+SEARCH_TERM_RE = re.compile(r'\w+', re.UNICODE)
+
+# Message text may be stored compressed (CompressedText), so FTS5 reads it
+# through a view that decodes it with text_value(). Connections outside the
+# app (e.g. the sqlite3 shell) lack that function and can't write conversations.
+SQLITE_SEARCH_DDL = [
+    "CREATE VIEW IF NOT EXISTS conversations_search_content AS SELECT id, tenant_id, "
+    "text_value(user_message) AS user_message, text_value(bot_response) AS bot_response FROM conversations",
+    "CREATE VIRTUAL TABLE IF NOT EXISTS conversations_fts USING fts5(tenant_id, user_message, bot_response, "
+    "content='conversations_search_content', content_rowid='id', tokenize='porter unicode61')",
+    "CREATE TRIGGER IF NOT EXISTS conversations_fts_insert AFTER INSERT ON conversations BEGIN "
+    "INSERT INTO conversations_fts(rowid, tenant_id, user_message, bot_response) "
+    "VALUES (new.id, new.tenant_id, text_value(new.user_message), text_value(new.bot_response)); END",
+    "CREATE TRIGGER IF NOT EXISTS conversations_fts_delete AFTER DELETE ON conversations BEGIN "
+    "INSERT INTO conversations_fts(conversations_fts, rowid, tenant_id, user_message, bot_response) "
+    "VALUES ('delete', old.id, old.tenant_id, text_value(old.user_message), text_value(old.bot_response)); END",
+    # Recompressing a row changes its bytes but not its text; that needs no reindexing
+    "CREATE TRIGGER IF NOT EXISTS conversations_fts_update AFTER UPDATE OF tenant_id, user_message, bot_response "
+    "ON conversations WHEN old.tenant_id IS NOT new.tenant_id "
+    "OR text_value(old.user_message) IS NOT text_value(new.user_message) "
+    "OR text_value(old.bot_response) IS NOT text_value(new.bot_response) BEGIN "
+    "INSERT INTO conversations_fts(conversations_fts, rowid, tenant_id, user_message, bot_response) "
+    "VALUES ('delete', old.id, old.tenant_id, text_value(old.user_message), text_value(old.bot_response)); "
+    "INSERT INTO conversations_fts(rowid, tenant_id, user_message, bot_response) "
+    "VALUES (new.id, new.tenant_id, text_value(new.user_message), text_value(new.bot_response)); END",
+]
+# An index that reads the table directly (plain text only) is replaced on startup
+SQLITE_SEARCH_DROP = [
+    "DROP TRIGGER IF EXISTS conversations_fts_insert",
+    "DROP TRIGGER IF EXISTS conversations_fts_delete",
+    "DROP TRIGGER IF EXISTS conversations_fts_update",
+    "DROP TABLE IF EXISTS conversations_fts",
+]
+
+
+def create_search_index():
+    """Create the conversation full-text index if missing, indexing existing rows once"""
+    dialect = db.engine.dialect.name
+    inspector = sqlalchemy_inspect(db.engine)
+    try:
+        if dialect == 'sqlite':
+            if 'conversations_search_content' in inspector.get_view_names():
+                return
+            started = time.perf_counter()
+            with db.engine.begin() as conn:
+                for statement in SQLITE_SEARCH_DROP + SQLITE_SEARCH_DDL:
+                    conn.execute(text(statement))
+                conn.execute(text("INSERT INTO conversations_fts(conversations_fts) VALUES ('rebuild')"))
+        elif dialect == 'postgresql':
+            if 'search_vector' in {column['name'] for column in inspector.get_columns('conversations')}:
+                return
+            started = time.perf_counter()
+            with db.engine.begin() as conn:
+                conn.execute(text(
+                    "ALTER TABLE conversations ADD COLUMN IF NOT EXISTS search_vector tsvector GENERATED ALWAYS AS ("
+                    f"setweight(to_tsvector('{SEARCH_LANGUAGE}', coalesce(user_message, '')), 'A') || "
+                    f"setweight(to_tsvector('{SEARCH_LANGUAGE}', coalesce(bot_response, '')), 'B')) STORED"
+                ))
+                conn.execute(text(
+                    "CREATE INDEX IF NOT EXISTS ix_conversations_search ON conversations USING GIN (search_vector)"
+                ))
+        else:
+            return
+        logger.info(f"Built the conversation search index in {time.perf_counter() - started:.1f}s")
+    except DatabaseError as e:
+        # Another worker built it first
+        logger.info(f"Skipped conversation search index: {e}")
+
+
+def _fts5_phrase(value: str) -> str:
+    return '"' + value.replace('"', '""') + '"'
+
+
+def _fts5_query(query: str, tenant_id: str) -> str:
+    """FTS5 MATCH expression: every search term (ANDed) in the messages, within the tenant.
+
+    Terms are quoted so user input can't use FTS5 query syntax.
+    """
+    terms = ' '.join(_fts5_phrase(term) for term in SEARCH_TERM_RE.findall(query))
+    return f"tenant_id : {_fts5_phrase(tenant_id)} AND {{user_message bot_response}} : ({terms})"
+
+
+def _first_conversation_id_at(moment: datetime) -> Optional[int]:
+    """Smallest id written at or after `moment`; ids follow insertion time"""
+    return db.session.query(Conversation.id).filter(
+        Conversation.timestamp >= moment
+    ).order_by(Conversation.timestamp).limit(1).scalar()
+
+
+def _rank_fts5_matches(query: str, tenant_id: str, start: Optional[datetime], end: Optional[datetime],
+                       session_id: Optional[str], candidates: int) -> List[Tuple[int, float]]:
+    """(id, rank) for the newest `candidates` SQLite matches, best first.
+
+    FTS5's bm25() counts every phrase over the whole index, which is slow for
+    common words. Instead each candidate gets a BM25-style score from its own
+    hits (counted with highlight()); all terms are required, so IDF is left out.
+    """
+    clauses = ["conversations_fts MATCH :match", "c.tenant_id = :tenant_id"]
+    params = {'match': _fts5_query(query, tenant_id), 'tenant_id': tenant_id, 'limit': candidates}
+    if start is not None:
+        # Date bounds also become rowid bounds, which FTS5 applies while scanning
+        first_id = _first_conversation_id_at(start)
+        if first_id is None:
+            return []
+        clauses += ["conversations_fts.rowid >= :first_id", "c.timestamp >= :start"]
+        params.update(first_id=first_id, start=start)
+    if end is not None:
+        end_id = _first_conversation_id_at(end)
+        if end_id is not None:
+            clauses.append("conversations_fts.rowid < :end_id")
+            params['end_id'] = end_id
+        clauses.append("c.timestamp < :end")
+        params['end'] = end
+    if session_id:
+        clauses.append("c.session_id = :session_id")
+        params['session_id'] = session_id
+
+    # A session has few rows, so walk its index and probe FTS5 for each;
+    # otherwise scan FTS5 matches newest first
+    if session_id:
+        source, newest_first = "conversations c CROSS JOIN conversations_fts ON conversations_fts.rowid = c.id", "c.id"
+    else:
+        source, newest_first = "conversations_fts JOIN conversations c ON c.id = conversations_fts.rowid", \
+            "conversations_fts.rowid"
+    statement = text(
+        "SELECT c.id, highlight(conversations_fts, 1, char(2), ''), highlight(conversations_fts, 2, char(2), '') "
+        f"FROM {source} WHERE {' AND '.join(clauses)} ORDER BY {newest_first} DESC LIMIT :limit"
+    ).bindparams(*[bindparam(name, type_=db.DateTime) for name in ('start', 'end') if name in params])
+    rows = db.session.execute(statement, params).all()
+    if not rows:
+        return []
+
+    columns = [(2.0, [row[1] or '' for row in rows]), (1.0, [row[2] or '' for row in rows])]
+    scores = [0.0] * len(rows)
+    for weight, texts in columns:
+        lengths = [value.count(' ') + 1 for value in texts]
+        average = sum(lengths) / len(lengths)
+        for i, value in enumerate(texts):
+            hits = value.count('\x02')
+            if hits:
+                norm = SEARCH_BM25_K1 * (1 - SEARCH_BM25_B + SEARCH_BM25_B * lengths[i] / average)
+                scores[i] += weight * hits * (SEARCH_BM25_K1 + 1) / (hits + norm)
+    return sorted(zip((row[0] for row in rows), scores), key=lambda item: (-item[1], -item[0]))
+
+
+def search_conversations(query: str, tenant_id: str, start: Optional[datetime] = None,
+                         end: Optional[datetime] = None, session_id: Optional[str] = None,
+                         limit: int = 20, offset: int = 0) -> List[Tuple[Conversation, float]]:
+    """Best matches first, as (conversation, rank) pairs; higher rank is better.
+
+    Only the SEARCH_MAX_CANDIDATES most recent matches are ranked, so a word
+    found in millions of messages costs about the same as a rare one. Pages
+    past that many widen the window to offset + limit, so they aren't cut off.
+    """
+    window = max(SEARCH_MAX_CANDIDATES, offset + limit)
+    dialect = db.engine.dialect.name
+    if dialect == 'sqlite':
+        ranked = _rank_fts5_matches(query, tenant_id, start, end, session_id, window)[offset:offset + limit]
+    else:
+        if dialect == 'postgresql':
+            tsquery = func.websearch_to_tsquery(SEARCH_LANGUAGE, query)
+            vector = literal_column('conversations.search_vector')
+            matches = vector.op('@@')(tsquery)
+        else:
+            pattern = f"%{query}%"
+            matches = or_(Conversation.user_message.ilike(pattern), Conversation.bot_response.ilike(pattern))
+        candidates = select(Conversation.id).where(matches, Conversation.tenant_id == tenant_id)
+        if start is not None:
+            candidates = candidates.where(Conversation.timestamp >= start)
+        if end is not None:
+            candidates = candidates.where(Conversation.timestamp < end)
+        if session_id:
+            candidates = candidates.where(Conversation.session_id == session_id)
+        candidates = candidates.order_by(Conversation.id.desc()).limit(window).subquery()
+
+        # Ranked after the limit, so only the candidates pay for ts_rank_cd
+        rank = func.ts_rank_cd(vector, tsquery) if dialect == 'postgresql' else literal_column('0.0')
+        ranked = db.session.execute(
+            select(candidates.c.id, rank.label('rank')).join_from(candidates, Conversation, Conversation.id == candidates.c.id)
+            .order_by(rank.desc(), candidates.c.id.desc()).limit(limit).offset(offset)
+        ).all()
+
+    conversations = {c.id: c for c in Conversation.query.filter(Conversation.id.in_([id_ for id_, _ in ranked]))}
+    return [(conversations[id_], float(rank)) for id_, rank in ranked if id_ in conversations]
+
+
+@app.route('/api/conversation/search', methods=['GET'])
+@limiter.limit("60 per minute")
+def search_conversation():
+    """Ranked full-text search over conversations (?q=&since=&until=&session_id=&page=&per_page=)"""
+    if not bearer_token_matches(SUPPORT_API_KEY):
+        return jsonify({'success': False, 'error': 'Support authorization required'}), 401
+
+    query = request.args.get('q', '').strip()
+    if not SEARCH_TERM_RE.search(query):
+        return jsonify({'error': 'Search query (q) cannot be empty'}), 400
+    if len(query) > 200:
+        return jsonify({'error': 'Search query too long (max 200 characters)'}), 400
+    try:
+        start, end = _parse_day_bounds(request.args.get('since'), request.args.get('until'))
+    except ValueError:
+        return jsonify({'error': 'Invalid date format (use YYYY-MM-DD)'}), 400
+
+    page = max(1, request.args.get('page', default=1, type=int))
+    per_page = request.args.get('per_page', default=20, type=int)
+    if per_page < 1 or per_page > SEARCH_MAX_PER_PAGE:
+        per_page = 20
+
+    try:
+        # One extra row tells us whether there is a next page
+        matches = read_from_replica(lambda: search_conversations(
+            query, current_tenant_id(), start, end, request.args.get('session_id'),
+            limit=per_page + 1, offset=(page - 1) * per_page
+        ))
+    except Exception as e:
+        logger.error(f"Conversation search error: {e}")
+        return jsonify({'error': 'Failed to search conversations'}), 500
+
+    return jsonify({
+        'success': True,
+        'query': query,
+        'page': page,
+        'per_page': per_page,
+        'has_more': len(matches) > per_page,
+        'results': [{**conversation.to_dict(), 'rank': round(rank, 4)} for conversation, rank in matches[:per_page]]
+    })
+
+
 # ============================================================================
 # ERROR HANDLERS
 # ============================================================================
@@ -1178,18 +4588,87 @@ def internal_error(error):
 
 
 @app.before_request
-def before_request():
-    """Initialize database tables before first request"""
-    db.create_all()
+def ensure_warmed_up():
+    """Fallback for servers that skip the startup hooks (e.g. `flask run`)"""
+    if not _ready.is_set() and request.endpoint != 'readiness_check':
+        warm_up()
 
 
 # ============================================================================
-# MAIN
+# STARTUP
 # ============================================================================
 
-if __name__ == '__main__':
+_ready = threading.Event()
+_warm_up_lock = threading.Lock()
+
+
+def init_schema():
+    """Create or verify the database schema"""
     with app.app_context():
         db.create_all()
+        migrate_tenant_columns()
+        create_search_index()
+        configure_column_compression()
+
+
+def warm_up(create_schema: bool = True):
+    """Run the one-time startup phase for this process, then mark it ready.
+
+    Under gunicorn this runs from the `post_worker_init` hook in
+    gunicorn.conf.py, so each worker pays for schema checks, pool connects,
+    menu indexing and the LLM client once instead of on every request. With
+    `preload_app` the master creates the schema and workers pass
+    `create_schema=False`. An LLM client that can't be built (e.g. no API
+    key) doesn't stop warm-up; it is built again on first use.
+    """
+    with _warm_up_lock:
+        if _ready.is_set():
+            return
+
+        started = time.perf_counter()
+        with app.app_context():
+            if create_schema:
+                try:
+                    db.create_all()
+                except DatabaseError:
+                    # Another worker created the tables between our check and
+                    # CREATE TABLE; a second pass only verifies them
+                    db.session.rollback()
+                    db.create_all()
+                migrate_tenant_columns()
+                create_search_index()
+                configure_column_compression()
+
+            # Drop connections inherited from a preloading master, then
+            # open fresh ones so the first requests don't pay for connect
+            for engine in db.engines.values():
+                engine.dispose(close=False)
+            warm_connections = max(1, int(os.getenv('DB_POOL_WARM_CONNECTIONS', 1)))
+            connections = [db.engine.connect() for _ in range(warm_connections)]
+            for conn in connections:
+                conn.execute(text('SELECT 1'))
+                conn.close()
+
+        tenants.default.menu_index
+        try:
+            get_llm_client()
+        except Exception as e:
+            logger.error(f"LLM client warm-up error: {e}")
+        start_retention_scheduler()
+        start_rollup_scheduler()
+        start_recompression()
+        refresh_stale_precomputed_answers()
+
+        _ready.set()
+        logger.info(f"Warm-up finished in {(time.perf_counter() - started) * 1000:.1f}ms (pid {os.getpid()})")
+
+
+# ============================================================================
+# MAIN
+# ============================================================================
+
+if __name__ == '__main__':
+    warm_up()
     
     debug = os.getenv('FLASK_ENV') == 'development'
     app.run(
@@ -0,0 +1,320 @@
+"""
+ASGI serving mode for the Restaurant Assistant Bot.
+
+    uvicorn asgi:application --workers 2
+
+Free-form /api/chat messages are handled on the event loop. Validation,
+intent routing and DB writes reuse start_chat_turn()/finish_chat_turn() from
+app.py on a thread pool, and the model call is awaited. An in-flight chat
+then costs a coroutine instead of a worker. POST /api/recommendations is
+served the same way through start_recommendation()/finish_recommendation().
+Native model calls take an admission ticket, but their concurrency is
+bounded per process by ASGI_CHAT_CONCURRENCY in-flight coroutines rather
+than by the admission slots, which would hold a thread-sized slot across the
+model call.
+
+Every other route goes to the Flask app through a2wsgi's WSGI adapter,
+unchanged. It runs requests on a pool of ASGI_WSGI_THREADS threads, so a
+slow route or a long export doesn't hold up the others.
+
+GET /api/orders/events is also served natively, so an open order stream
+costs a coroutine rather than a thread and has no time limit.
+
+ASGI_DB_THREADS sets the size of the thread pool used for DB work.
+"""
+
+import os
+import json
+import asyncio
+import logging
+from concurrent.futures import ThreadPoolExecutor
+
+from a2wsgi import WSGIMiddleware
+from flask_limiter.errors import RateLimitExceeded
+
+from app import (
+    app as flask_app, limiter, warm_up, start_chat_turn, finish_chat_turn, degraded_chat_turn, api_response,
+    start_recommendation, finish_recommendation, model_unavailable_response, RECOMMENDATION_GENERATION_CONFIG,
+    admission, shed_response, RequestShed, CHAT_GENERATION_CONFIG, LLM_ERROR_RETRY_AFTER, ADMISSION_ENABLED,
+    ADMISSION_MAX_WAIT_MS, order_events, open_order_event_stream, format_sse, select_tenant, SSE_HEARTBEAT_SECONDS,
+    SSE_QUEUE_SIZE
+)
+from llm import get_llm_client, CircuitOpenError
+
+logger = logging.getLogger(__name__)
+
+db_executor = ThreadPoolExecutor(
+    max_workers=int(os.getenv('ASGI_DB_THREADS', 16)),
+    thread_name_prefix='asgi-db'
+)
+wsgi_application = WSGIMiddleware(flask_app, workers=int(os.getenv('ASGI_WSGI_THREADS', 32)))
+# Native chats this process runs at once; beyond that (after ADMISSION_CHAT_MAX_WAIT_MS) they are shed
+ASGI_CHAT_CONCURRENCY = int(os.getenv('ASGI_CHAT_CONCURRENCY', 64))
+_chat_slots = None
+
+
+async def _read_body(receive) -> bytes:
+    body = b''
+    while True:
+        message = await receive()
+        body += message.get('body', b'')
+        if not message.get('more_body'):
+            return body
+
+
+def _request_context(scope, body: bytes):
+    """A Flask request context matching the ASGI request, for limiter and session tracking.
+
+    before_request hooks don't run here, so callers select the tenant themselves.
+    """
+    headers = {key.decode('latin-1'): value.decode('latin-1') for key, value in scope['headers']}
+    client = scope.get('client') or ('127.0.0.1', 0)
+    return flask_app.test_request_context(
+        scope['path'],
+        method=scope['method'],
+        query_string=scope.get('query_string', b'').decode('latin-1'),
+        headers=headers,
+        data=body,
+        environ_base={'REMOTE_ADDR': client[0]}
+    )
+
+
+async def _run_db(func, *args):
+    return await asyncio.get_running_loop().run_in_executor(db_executor, func, *args)
+
+
+async def _admit_chat():
+    """Take one of this process's chat slots and an admission ticket; raises RequestShed"""
+    global _chat_slots
+    if _chat_slots is None:
+        _chat_slots = asyncio.Semaphore(ASGI_CHAT_CONCURRENCY)
+    wait = ADMISSION_MAX_WAIT_MS.get('chat', 0) / 1000
+    if _chat_slots.locked() and not wait:
+        raise admission.shed('chat')
+    try:
+        await asyncio.wait_for(_chat_slots.acquire(), wait or None)
+    except asyncio.TimeoutError:
+        raise admission.shed('chat')
+    try:
+        return admission.admit('chat', bounded=True)
+    except RequestShed:
+        _chat_slots.release()
+        raise
+
+
+def _release_chat(ticket):
+    admission.release(ticket)
+    _chat_slots.release()
+
+
+def _shed(scope, body: bytes, e: RequestShed):
+    with _request_context(scope, body):
+        select_tenant()
+        response = flask_app.process_response(shed_response(e))
+        return response.status_code, list(response.headers.items()), response.get_data()
+
+
+async def _send_response(send, result):
+    status, headers, response_body = result
+    await send({
+        'type': 'http.response.start',
+        'status': status,
+        'headers': [(key.lower().encode('latin-1'), value.encode('latin-1')) for key, value in headers]
+    })
+    await send({'type': 'http.response.body', 'body': response_body})
+
+
+async def chat(scope, receive, send):
+    """Async /api/chat: same behaviour as the Flask view, without blocking a worker on the LLM"""
+    body = await _read_body(receive)
+
+    def start():
+        with _request_context(scope, body):
+            error = select_tenant()
+            if error is not None:
+                return error[0], error[1], None
+            limiter.check()
+            return start_chat_turn(json.loads(body or b'null'))
+
+    def finish(payload, status, pending=None, reply=None, retry_after=None):
+        # Build the response through Flask so after_request hooks (CORS) still apply
+        with _request_context(scope, body):
+            select_tenant()
+            if pending is not None and reply is None:
+                payload, status = degraded_chat_turn(pending, retry_after)
+            elif pending is not None:
+                payload = finish_chat_turn(pending, reply.text, reply)
+            response = flask_app.process_response(api_response(payload, status))
+            return response.status_code, list(response.headers.items()), response.get_data()
+
+    ticket = None
+    try:
+        if ADMISSION_ENABLED:
+            ticket = await _admit_chat()
+        payload, status, pending = await _run_db(start)
+        if pending is not None:
+            try:
+                reply = await get_llm_client().generate_async(pending['prompt'], **CHAT_GENERATION_CONFIG)
+            except CircuitOpenError as e:
+                result = await _run_db(finish, None, 503, pending, None, e.retry_after)
+            except Exception as e:
+                logger.error(f"Chat model error: {e}")
+                result = await _run_db(finish, None, 503, pending, None, LLM_ERROR_RETRY_AFTER)
+            else:
+                result = await _run_db(finish, None, 200, pending, reply)
+        else:
+            result = await _run_db(finish, payload, status)
+    except RequestShed as e:
+        result = await _run_db(_shed, scope, body, e)
+    except RateLimitExceeded:
+        result = await _run_db(finish, {'error': 'Rate limit exceeded'}, 429)
+    except Exception as e:
+        logger.error(f"Chat error: {e}")
+        result = await _run_db(finish, {'success': False, 'error': 'Failed to process message'}, 500)
+    finally:
+        if ticket is not None:
+            _release_chat(ticket)
+
+    await _send_response(send, result)
+
+
+async def recommendations(scope, receive, send):
+    """Async /api/recommendations: the Flask view's behaviour with the model call awaited"""
+    body = await _read_body(receive)
+
+    def start():
+        with _request_context(scope, body):
+            error = select_tenant()
+            if error is not None:
+                return error[0], error[1], None
+            limiter.check()
+            return start_recommendation(json.loads(body or b'null'))
+
+    def finish(payload, status, pending=None, reply=None):
+        with _request_context(scope, body):
+            select_tenant()
+            if reply is not None:
+                payload = finish_recommendation(pending, reply)
+            response = flask_app.process_response(api_response(payload, status))
+            return response.status_code, list(response.headers.items()), response.get_data()
+
+    ticket = None
+    try:
+        if ADMISSION_ENABLED:
+            ticket = await _admit_chat()
+        payload, status, pending = await _run_db(start)
+        if pending is not None:
+            try:
+                reply = await get_llm_client().generate_async(pending['prompt'], **RECOMMENDATION_GENERATION_CONFIG)
+            except CircuitOpenError as e:
+                result = await _run_db(finish, *model_unavailable_response(e.retry_after))
+            else:
+                result = await _run_db(finish, None, 200, pending, reply)
+        else:
+            result = await _run_db(finish, payload, status)
+    except RequestShed as e:
+        result = await _run_db(_shed, scope, body, e)
+    except RateLimitExceeded:
+        result = await _run_db(finish, {'error': 'Rate limit exceeded'}, 429)
+    except Exception as e:
+        logger.error(f"Recommendation error: {e}")
+        result = await _run_db(finish, {'success': False, 'error': 'Failed to generate recommendations'}, 500)
+    finally:
+        if ticket is not None:
+            _release_chat(ticket)
+
+    await _send_response(send, result)
+
+
+async def _wait_for_disconnect(receive):
+    while (await receive())['type'] != 'http.disconnect':
+        pass
+
+
+async def order_event_stream(scope, receive, send):
+    """Async /api/orders/events: the same stream as the Flask view, held open indefinitely"""
+
+    def start():
+        with _request_context(scope, b''):
+            error = select_tenant()
+            if error is not None:
+                error, filters, opening = (flask_app.json.response(error[0]), error[1]), None, None
+            else:
+                try:
+                    limiter.check()
+                    error, filters, opening = open_order_event_stream()
+                except RateLimitExceeded:
+                    error, filters, opening = (flask_app.json.response({'error': 'Rate limit exceeded'}), 429), None, None
+            response = flask_app.make_response(error) if error is not None else flask_app.response_class(
+                mimetype='text/event-stream', headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+            response = flask_app.process_response(response)
+            body = response.get_data() if error is not None else None
+            return response.status_code, list(response.headers.items()), body, filters, opening
+
+    status, headers, error_body, filters, opening = await _run_db(start)
+    await send({
+        'type': 'http.response.start',
+        'status': status,
+        'headers': [(key.lower().encode('latin-1'), value.encode('latin-1')) for key, value in headers
+                    if key.lower() != 'content-length']
+    })
+    if error_body is not None:
+        await send({'type': 'http.response.body', 'body': error_body})
+        return
+
+    loop = asyncio.get_running_loop()
+    events = asyncio.Queue(maxsize=SSE_QUEUE_SIZE)
+
+    def offer(event):
+        if not events.full():
+            events.put_nowait(event)
+
+    token = order_events.subscribe(lambda event: loop.call_soon_threadsafe(offer, event), **filters)
+    disconnected = asyncio.ensure_future(_wait_for_disconnect(receive))
+    try:
+        await send({'type': 'http.response.body', 'body': opening.encode(), 'more_body': True})
+        while True:
+            next_event = asyncio.ensure_future(events.get())
+            done, _ = await asyncio.wait({next_event, disconnected}, timeout=SSE_HEARTBEAT_SECONDS,
+                                         return_when=asyncio.FIRST_COMPLETED)
+            if disconnected in done:
+                next_event.cancel()
+                return
+            if next_event in done:
+                chunk = format_sse(next_event.result())
+            else:
+                next_event.cancel()
+                chunk = ': keep-alive\n\n'
+            await send({'type': 'http.response.body', 'body': chunk.encode(), 'more_body': True})
+    finally:
+        order_events.unsubscribe(token)
+        disconnected.cancel()
+
+
+async def lifespan(scope, receive, send):
+    while True:
+        message = await receive()
+        if message['type'] == 'lifespan.startup':
+            try:
+                await _run_db(warm_up)
+            except Exception as e:
+                await send({'type': 'lifespan.startup.failed', 'message': str(e)})
+                return
+            await send({'type': 'lifespan.startup.complete'})
+        elif message['type'] == 'lifespan.shutdown':
+            db_executor.shutdown(wait=False)
+            await send({'type': 'lifespan.shutdown.complete'})
+            return
+
+
+async def application(scope, receive, send):
+    if scope['type'] == 'lifespan':
+        await lifespan(scope, receive, send)
+    elif scope['type'] == 'http' and scope['path'] == '/api/chat' and scope['method'] == 'POST':
+        await chat(scope, receive, send)
+    elif scope['type'] == 'http' and scope['path'] == '/api/recommendations' and scope['method'] == 'POST':
+        await recommendations(scope, receive, send)
+    elif scope['type'] == 'http' and scope['path'] == '/api/orders/events' and scope['method'] == 'GET':
+        await order_event_stream(scope, receive, send)
+    else:
+        await wsgi_application(scope, receive, send)
@@ -0,0 +1,250 @@
+"""
+Compressed text columns: storage and I/O saved against read and write cost.
+
+    python benchmarks/compression.py [--rows 20000] [--level 3] [--json out.json]
+
+Each variant runs in a fresh interpreter, because COLUMN_COMPRESSION is read
+at import, against its own SQLite database filled with synthetic
+conversations (multi-paragraph replies built from the menu):
+
+    plain      COLUMN_COMPRESSION=none
+    zstd       COLUMN_COMPRESSION=zstd without a dictionary
+    zstd+dict  COLUMN_COMPRESSION=zstd with a dictionary trained on --train-rows
+               rows first
+
+Each variant reports:
+- insert throughput through the ORM, including the search index triggers;
+- the cost of the chat-history lookup (newest 5 rows of a session);
+- a full decoded scan;
+- the database size after VACUUM, and the time to back it up with SQLite's
+  backup API.
+
+The plain run then times the migration: it trains a dictionary and runs
+recompress_columns over the existing rows.
+"""
+
+import os
+import sys
+import json
+import time
+import random
+import sqlite3
+import argparse
+import tempfile
+import subprocess
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+APP_DIR = os.path.dirname(BENCH_DIR)
+
+VARIANTS = {
+    'plain': {'COLUMN_COMPRESSION': 'none'},
+    'zstd': {'COLUMN_COMPRESSION': 'zstd'},
+    'zstd+dict': {'COLUMN_COMPRESSION': 'zstd'},
+}
+
+QUESTIONS = [
+    "What do you recommend for {name}?",
+    "Is the {name} gluten free?",
+    "Can I get the {name} without {ingredient}?",
+    "What goes well with the {name}? We are a party of {party}.",
+    "Do you have anything similar to {name} but vegetarian?",
+]
+OPENERS = [
+    "Great question! Here's what I'd suggest.",
+    "Absolutely, happy to help with that.",
+    "Thanks for asking! Let me walk you through a few options.",
+]
+CLOSERS = [
+    "Let me know if you'd like to place an order or book a table.",
+    "Would you like me to start an order for you?",
+    "If you have any allergies, please tell your server and the kitchen will adapt the dish.",
+]
+
+
+# ============================================================================
+# CHILD (one variant)
+# ============================================================================
+
+def make_corpus(menu: dict, rows: int, seed: int = 7) -> list:
+    rng = random.Random(seed)
+    items = [item for category in menu.values() for item in category]
+    corpus = []
+    for i in range(rows):
+        item = rng.choice(items)
+        others = rng.sample(items, 3)
+        question = rng.choice(QUESTIONS).format(
+            name=item['name'], ingredient=rng.choice(['garlic', 'onions', 'cheese', 'nuts']), party=rng.randint(2, 8)
+        )
+        paragraphs = [rng.choice(OPENERS)]
+        for other in others:
+            paragraphs.append(
+                f"**{other['name']}** (${other['price']:.2f}) - {other.get('description', '')}. "
+                f"It pairs nicely with the {item['name']} and is one of our most popular choices this season."
+            )
+        paragraphs.append(rng.choice(CLOSERS))
+        corpus.append({'session_id': f'bench-{i % max(1, rows // 10)}', 'user_message': question,
+                       'bot_response': '\n\n'.join(paragraphs), 'message_type': 'text'})
+    return corpus
+
+
+def insert_rows(restaurant_app, corpus: list) -> float:
+    started = time.perf_counter()
+    with restaurant_app.app.app_context():
+        for start in range(0, len(corpus), 500):
+            restaurant_app.db.session.add_all(
+                restaurant_app.Conversation(**row) for row in corpus[start:start + 500]
+            )
+            restaurant_app.db.session.commit()
+    return time.perf_counter() - started
+
+
+def measure_storage(db_path: str, workdir: str) -> dict:
+    con = sqlite3.connect(db_path)
+    column_bytes = con.execute(
+        "SELECT SUM(LENGTH(CAST(user_message AS BLOB)) + LENGTH(CAST(bot_response AS BLOB))) FROM conversations"
+    ).fetchone()[0]
+    con.execute('VACUUM')
+    con.close()
+
+    backup_path = os.path.join(workdir, 'backup.db')
+    source, target = sqlite3.connect(db_path), sqlite3.connect(backup_path)
+    started = time.perf_counter()
+    source.backup(target)
+    backup_s = time.perf_counter() - started
+    source.close()
+    target.close()
+    os.remove(backup_path)
+    return {'db_bytes': os.path.getsize(db_path), 'text_column_bytes': column_bytes, 'backup_ms': round(backup_s * 1000, 1)}
+
+
+def measure_reads(restaurant_app, rows: int) -> dict:
+    Conversation = restaurant_app.Conversation
+    rng = random.Random(11)
+    sessions = [f'bench-{rng.randrange(max(1, rows // 10))}' for _ in range(2000)]
+    with restaurant_app.app.app_context():
+        started = time.perf_counter()
+        for session_id in sessions:
+            Conversation.query.filter_by(tenant_id='default', session_id=session_id).order_by(
+                Conversation.timestamp.desc()
+            ).limit(5).all()
+            restaurant_app.db.session.expunge_all()
+        history_s = time.perf_counter() - started
+
+        started = time.perf_counter()
+        chars = 0
+        query = restaurant_app.db.session.query(Conversation.user_message, Conversation.bot_response)
+        for user_message, bot_response in query.yield_per(1000):
+            chars += len(user_message) + len(bot_response)
+        scan_s = time.perf_counter() - started
+    return {
+        'history_us_per_lookup': round(history_s / len(sessions) * 1e6, 1),
+        'scan_rows_per_s': round(rows / scan_s),
+        'decoded_chars': chars
+    }
+
+
+def run_child(variant: str, rows: int, train_rows: int, workdir: str) -> dict:
+    sys.path.insert(0, APP_DIR)
+    import app as restaurant_app
+
+    restaurant_app.warm_up()
+    corpus = make_corpus(restaurant_app.RESTAURANT_CONFIG['menu'], rows + train_rows)
+    result = {'variant': variant}
+
+    if variant == 'zstd+dict':
+        insert_rows(restaurant_app, corpus[rows:])
+        with restaurant_app.app.app_context():
+            result['dictionary'] = restaurant_app.train_compression_dictionary()
+            restaurant_app.Conversation.query.delete()
+            restaurant_app.db.session.commit()
+
+    write_s = insert_rows(restaurant_app, corpus[:rows])
+    result['insert_rows_per_s'] = round(rows / write_s)
+    result.update(measure_reads(restaurant_app, rows))
+    with restaurant_app.app.app_context():
+        db_path = restaurant_app.db.engine.url.database
+    result.update(measure_storage(db_path, workdir))
+
+    if variant == 'plain':
+        # Switch the running process to compression and migrate what's there
+        restaurant_app.COLUMN_COMPRESSION = 'zstd'
+        with restaurant_app.app.app_context():
+            started = time.perf_counter()
+            restaurant_app.train_compression_dictionary()
+            stats = restaurant_app.recompress_columns(pause=0)
+            migrate_s = time.perf_counter() - started
+        result['migration'] = {
+            'rows': stats.get('conversations', 0),
+            'rows_per_s': round(stats.get('conversations', 0) / migrate_s),
+            **measure_storage(db_path, workdir)
+        }
+    return result
+
+
+# ============================================================================
+# PARENT
+# ============================================================================
+
+def run_variant(variant: str, args) -> dict:
+    workdir = tempfile.mkdtemp(prefix=f'compression-{variant.replace("+", "-")}-')
+    env = dict(os.environ, **VARIANTS[variant],
+               LLM_BACKEND='stub',
+               ROLLUP_INTERVAL_SECONDS='0',
+               COMPRESSION_LEVEL=str(args.level),
+               COMPRESSION_DIR=os.path.join(workdir, 'compression'),
+               DATABASE_URL=f"sqlite:///{os.path.join(workdir, 'bench.db')}")
+    proc = subprocess.run(
+        [sys.executable, os.path.abspath(__file__), '--child', variant, '--rows', str(args.rows),
+         '--train-rows', str(args.train_rows), '--workdir', workdir],
+        cwd=APP_DIR, env=env, capture_output=True, text=True
+    )
+    if proc.returncode != 0:
+        raise RuntimeError(f"{variant} run failed:\n{proc.stderr[-2000:]}")
+    return json.loads(proc.stdout.strip().splitlines()[-1])
+
+
+def print_results(results: list):
+    plain = results[0]
+    print(f"{'variant':<10} {'db MB':>7} {'text MB':>8} {'backup ms':>10} {'insert/s':>9} "
+          f"{'history us':>11} {'scan rows/s':>12}")
+    for r in results:
+        print(f"{r['variant']:<10} {r['db_bytes'] / 1e6:>7.2f} {r['text_column_bytes'] / 1e6:>8.2f} "
+              f"{r['backup_ms']:>10.1f} {r['insert_rows_per_s']:>9} {r['history_us_per_lookup']:>11.1f} "
+              f"{r['scan_rows_per_s']:>12}")
+    for r in results[1:]:
+        print(f"  {r['variant']}: database {r['db_bytes'] / plain['db_bytes']:.0%} of plain, "
+              f"text columns {r['text_column_bytes'] / plain['text_column_bytes']:.0%}, "
+              f"insert {r['insert_rows_per_s'] / plain['insert_rows_per_s']:.2f}x, "
+              f"history lookup {r['history_us_per_lookup'] / plain['history_us_per_lookup']:.2f}x, "
+              f"scan {r['scan_rows_per_s'] / plain['scan_rows_per_s']:.2f}x")
+    migration = plain.get('migration')
+    if migration:
+        print(f"\nMigration of the plain database: {migration['rows']} rows at {migration['rows_per_s']} rows/s, "
+              f"{plain['db_bytes'] / 1e6:.2f} MB -> {migration['db_bytes'] / 1e6:.2f} MB")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rows', type=int, default=20000)
+    parser.add_argument('--train-rows', type=int, default=2000)
+    parser.add_argument('--level', type=int, default=3, help='zstd compression level')
+    parser.add_argument('--json', dest='json_path')
+    parser.add_argument('--child', choices=sorted(VARIANTS), help=argparse.SUPPRESS)
+    parser.add_argument('--workdir', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        print(json.dumps(run_child(args.child, args.rows, args.train_rows, args.workdir)))
+        return
+
+    results = [run_variant(variant, args) for variant in VARIANTS]
+    print(f"{args.rows} conversations, zstd level {args.level}\n")
+    print_results(results)
+    if args.json_path:
+        with open(args.json_path, 'w') as f:
+            json.dump({'rows': args.rows, 'level': args.level, 'results': results}, f, indent=2)
+        print(f"\nResults written to {args.json_path}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,126 @@
+"""
+Local stand-in for the Gemini REST API, for benchmarks.
+
+Answers `POST /v1beta/models/<model>:generateContent` with a canned reply
+after a configurable time-to-first-token plus a per-token generation delay,
+and reports token usage like the real API. Point the app at it with:
+
+    LLM_BACKEND=gemini GEMINI_API_KEY=fake GEMINI_API_ENDPOINT=http://127.0.0.1:8765
+
+Usage:
+    python benchmarks/fake_gemini.py [--port 8765] [--latency-ms 300]
+        [--tokens-per-second 80] [--output-tokens 60]
+"""
+
+import json
+import time
+import argparse
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+REPLY_WORDS = (
+    "Thanks for reaching out to Taste Haven! Our Grilled Salmon and Vegetable Risotto are "
+    "guest favourites tonight, and the Tiramisu is a lovely way to finish. Let me know if "
+    "you have any dietary needs and I'll point you to the right dishes."
+).split()
+
+
+class FakeGeminiHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    server_version = 'FakeGemini/1.0'
+
+    def do_POST(self):
+        length = int(self.headers.get('Content-Length', 0))
+        request = json.loads(self.rfile.read(length) or b'{}')
+        if not self.path.split('?')[0].endswith(':generateContent'):
+            self._send(404, {'error': {'code': 404, 'message': 'not found'}})
+            return
+
+        prompt = ''.join(
+            part.get('text', '')
+            for content in request.get('contents', [])
+            for part in content.get('parts', [])
+        )
+        config = self.server.config
+        max_tokens = request.get('generationConfig', {}).get('maxOutputTokens') or config['output_tokens']
+        output_tokens = min(config['output_tokens'], max_tokens)
+
+        delay = config['latency_ms'] / 1000
+        if config['tokens_per_second']:
+            delay += output_tokens / config['tokens_per_second']
+        time.sleep(delay)
+
+        words = (REPLY_WORDS * (output_tokens // len(REPLY_WORDS) + 1))[:output_tokens]
+        prompt_tokens = max(1, len(prompt) // 4)
+        self.server.count_request()
+        self._send(200, {
+            'candidates': [{
+                'content': {'parts': [{'text': ' '.join(words)}], 'role': 'model'},
+                'finishReason': 'STOP',
+                'index': 0
+            }],
+            'usageMetadata': {
+                'promptTokenCount': prompt_tokens,
+                'candidatesTokenCount': output_tokens,
+                'totalTokenCount': prompt_tokens + output_tokens
+            }
+        })
+
+    def _send(self, status: int, payload: dict):
+        body = json.dumps(payload).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class FakeGeminiServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, port: int, latency_ms: float = 300, tokens_per_second: float = 80,
+                 output_tokens: int = 60):
+        super().__init__(('127.0.0.1', port), FakeGeminiHandler)
+        self.config = {
+            'latency_ms': latency_ms,
+            'tokens_per_second': tokens_per_second,
+            'output_tokens': output_tokens
+        }
+        self.requests_served = 0
+        self._lock = threading.Lock()
+
+    @property
+    def endpoint(self) -> str:
+        return f'http://127.0.0.1:{self.server_address[1]}'
+
+    def count_request(self):
+        with self._lock:
+            self.requests_served += 1
+
+    def start_in_thread(self) -> threading.Thread:
+        thread = threading.Thread(target=self.serve_forever, name='fake-gemini', daemon=True)
+        thread.start()
+        return thread
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--latency-ms', type=float, default=300)
+    parser.add_argument('--tokens-per-second', type=float, default=80)
+    parser.add_argument('--output-tokens', type=int, default=60)
+    args = parser.parse_args()
+
+    server = FakeGeminiServer(args.port, args.latency_ms, args.tokens_per_second, args.output_tokens)
+    print(f'Fake Gemini listening on {server.endpoint}')
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == '__main__':
+    main()
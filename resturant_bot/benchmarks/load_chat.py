@@ -0,0 +1,182 @@
+"""
+Load test: sync (gunicorn) vs async (uvicorn + asgi.py) serving of /api/chat.
+
+Starts the app in each mode against the stub LLM backend with a fixed model
+latency, fires concurrent free-form chat messages, and reports throughput,
+latency percentiles, errors and the server's peak resident memory.
+
+Usage:
+    python benchmarks/load_chat.py [--modes wsgi,asgi] [--workers 2]
+        [--concurrency 200] [--requests 1000] [--llm-latency-ms 500]
+        [--json results.json]
+
+Needs gunicorn and uvicorn installed. Rate limiting is disabled for the run.
+"""
+
+import os
+import sys
+import json
+import time
+import shutil
+import signal
+import socket
+import argparse
+import tempfile
+import threading
+import subprocess
+import urllib.error
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+
+APP_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def percentile(values, pct):
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+def process_tree_rss_kb(pid: int) -> int:
+    """Resident memory of a process and its children, from /proc (Linux only)"""
+    total = 0
+    pids = [pid]
+    while pids:
+        current = pids.pop()
+        try:
+            with open(f'/proc/{current}/status') as f:
+                for line in f:
+                    if line.startswith('VmRSS:'):
+                        total += int(line.split()[1])
+            with open(f'/proc/{current}/task/{current}/children') as f:
+                pids.extend(int(child) for child in f.read().split())
+        except (FileNotFoundError, ProcessLookupError):
+            continue
+    return total
+
+
+def start_server(mode: str, port: int, workers: int, env: dict) -> subprocess.Popen:
+    # A stale server on the port would answer the readiness probe for us
+    with socket.socket() as probe:
+        if probe.connect_ex(('127.0.0.1', port)) == 0:
+            raise RuntimeError(f'port {port} is already in use')
+
+    if mode == 'wsgi':
+        cmd = ['gunicorn', '-w', str(workers), '-b', f'127.0.0.1:{port}', 'app:app']
+    else:
+        cmd = ['uvicorn', 'asgi:application', '--workers', str(workers),
+               '--host', '127.0.0.1', '--port', str(port), '--log-level', 'warning']
+    return subprocess.Popen(cmd, cwd=APP_DIR, env=env, stdout=subprocess.DEVNULL,
+                            stderr=subprocess.DEVNULL, start_new_session=True)
+
+
+def wait_ready(base_url: str, timeout: float = 30):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            with urllib.request.urlopen(f'{base_url}/api/ready', timeout=1) as resp:
+                if resp.status == 200:
+                    return
+        except (urllib.error.URLError, ConnectionError, OSError):
+            pass
+        time.sleep(0.2)
+    raise RuntimeError(f'server at {base_url} did not become ready')
+
+
+def post_chat(base_url: str, index: int) -> tuple:
+    payload = json.dumps({'message': f'What do you recommend tonight? #{index}',
+                          'session_id': f'load-{index % 500}'}).encode()
+    req = urllib.request.Request(f'{base_url}/api/chat', data=payload,
+                                 headers={'Content-Type': 'application/json'})
+    started = time.perf_counter()
+    try:
+        with urllib.request.urlopen(req, timeout=120) as resp:
+            resp.read()
+            ok = resp.status == 200
+    except (urllib.error.URLError, ConnectionError, OSError):
+        ok = False
+    return ok, time.perf_counter() - started
+
+
+def run_mode(mode: str, args) -> dict:
+    workdir = tempfile.mkdtemp(prefix=f'load-{mode}-')
+    env = dict(os.environ,
+               LLM_BACKEND='stub',
+               LLM_STUB_LATENCY_MS=str(args.llm_latency_ms),
+               RATELIMIT_ENABLED='false',
+               DATABASE_URL=f"sqlite:///{os.path.join(workdir, 'load.db')}",
+               ARCHIVE_DIR=os.path.join(workdir, 'archive'))
+    base_url = f'http://127.0.0.1:{args.port}'
+    server = start_server(mode, args.port, args.workers, env)
+
+    peak_rss = 0
+    stop = threading.Event()
+
+    def sample_memory():
+        nonlocal peak_rss
+        while not stop.is_set():
+            peak_rss = max(peak_rss, process_tree_rss_kb(server.pid))
+            time.sleep(0.1)
+
+    try:
+        wait_ready(base_url)
+        idle_rss = process_tree_rss_kb(server.pid)
+        sampler = threading.Thread(target=sample_memory, daemon=True)
+        sampler.start()
+
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=args.concurrency) as pool:
+            results = list(pool.map(lambda i: post_chat(base_url, i), range(args.requests)))
+        elapsed = time.perf_counter() - started
+        stop.set()
+        sampler.join()
+    finally:
+        os.killpg(server.pid, signal.SIGTERM)
+        server.wait(timeout=15)
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    latencies = [latency for ok, latency in results if ok]
+    return {
+        'mode': mode,
+        'workers': args.workers,
+        'requests': args.requests,
+        'concurrency': args.concurrency,
+        'errors': sum(1 for ok, _ in results if not ok),
+        'elapsed_s': round(elapsed, 3),
+        'rps': round(len(latencies) / elapsed, 1),
+        'p50_ms': round(percentile(latencies, 50) * 1000, 1),
+        'p95_ms': round(percentile(latencies, 95) * 1000, 1),
+        'p99_ms': round(percentile(latencies, 99) * 1000, 1),
+        'idle_rss_mb': round(idle_rss / 1024, 1),
+        'peak_rss_mb': round(peak_rss / 1024, 1),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--modes', default='wsgi,asgi')
+    parser.add_argument('--workers', type=int, default=2)
+    parser.add_argument('--concurrency', type=int, default=200)
+    parser.add_argument('--requests', type=int, default=1000)
+    parser.add_argument('--llm-latency-ms', type=float, default=500)
+    parser.add_argument('--port', type=int, default=5099)
+    parser.add_argument('--json', dest='json_path')
+    args = parser.parse_args()
+
+    results = []
+    for mode in args.modes.split(','):
+        result = run_mode(mode.strip(), args)
+        results.append(result)
+        print(f"{result['mode']:>5}: {result['rps']:8.1f} req/s  p50 {result['p50_ms']:7.1f}ms  "
+              f"p95 {result['p95_ms']:7.1f}ms  p99 {result['p99_ms']:7.1f}ms  errors {result['errors']}  "
+              f"rss {result['idle_rss_mb']}MB -> {result['peak_rss_mb']}MB")
+
+    if args.json_path:
+        with open(args.json_path, 'w') as f:
+            json.dump({'benchmark': 'load_chat', 'llm_latency_ms': args.llm_latency_ms, 'results': results}, f, indent=2)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
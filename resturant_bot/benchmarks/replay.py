@@ -0,0 +1,303 @@
+"""
+Record and replay real traffic from the Conversation log.
+
+    python benchmarks/replay.py export --out trace.jsonl [--database-url URL]
+                                       [--since YYYY-MM-DD] [--until YYYY-MM-DD] [--limit N]
+    python benchmarks/replay.py replay trace.jsonl [--speedup 10]
+                                       [--record cassette.json | --cassette cassette.json]
+                                       [--url http://host:port] [--out results.json]
+
+`export` turns Conversation rows into a sanitized trace. Each line is one
+event with its offset from the first message, a hashed session id, the
+message_type (intent), and the scrubbed user message. Emails, phone numbers
+and names are replaced. Reservation dates are moved into the future, keeping
+their distance from the original message.
+
+`replay` sends the trace to an instance at --speedup times real time. Each
+session runs its events in order, continuing the order and reservation flows
+from the server's responses. Unless --url is given, the harness starts a
+local instance on a fresh database. Its LLM is either recorded to a cassette
+(--record) or answered from one (--cassette), so later runs are
+deterministic. The report matches `suite.py load`.
+"""
+
+import os
+import re
+import sys
+import json
+import time
+import signal
+import shutil
+import hashlib
+import argparse
+import tempfile
+import threading
+from collections import defaultdict
+from datetime import datetime, timedelta
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+APP_DIR = os.path.dirname(BENCH_DIR)
+sys.path.insert(0, BENCH_DIR)
+
+from load_chat import start_server, wait_ready  # noqa: E402
+from suite import Recorder, VirtualUser, summarize, run_metadata, print_load  # noqa: E402
+
+EMAIL_RE = re.compile(r'[a-zA-Z0-9._%+-]+@[a-zA-Z0-9.-]+\.[a-zA-Z]{2,}')
+PHONE_RE = re.compile(r'(?<!\d)[\d\s\-\+\(\)]{10,}(?!\d)')
+DATE_RE = re.compile(r'\b(\d{4}-\d{2}-\d{2})\b')
+DIRECT_ORDER_PREFIXES = ('Placed order for ', 'Order confirmed: ')
+
+
+# ============================================================================
+# EXPORT
+# ============================================================================
+
+def scrub(text: str) -> str:
+    text = EMAIL_RE.sub('guest@example.com', text)
+    # Dates also match the phone pattern; real numbers have at least 10 digits
+    return PHONE_RE.sub(
+        lambda m: '555-010-0000' if sum(ch.isdigit() for ch in m.group(0)) >= 10 else m.group(0),
+        text
+    )
+
+
+def classify(row) -> str:
+    """Map a Conversation row to the replay action that reproduces it"""
+    if row.message_type == 'order':
+        if row.user_message.startswith(DIRECT_ORDER_PREFIXES):
+            return 'direct_order'
+        return 'order_step'
+    if row.message_type == 'reservation':
+        return 'reservation_step'
+    if row.message_type == 'recommendation':
+        return 'recommendation'
+    return 'chat'
+
+
+def sanitize_message(row, previous, kind: str) -> str:
+    message = scrub(row.user_message)
+
+    # The flows ask for the customer's name right before it is given
+    asked_for_name = previous is not None and "What's your name?" in previous.bot_response
+    starts_reservation = kind == 'reservation_step' and (previous is None or previous.message_type != 'reservation'
+                                                         or previous.bot_response.startswith('✅'))
+    if asked_for_name or starts_reservation:
+        return 'Guest'
+
+    if kind == 'reservation_step':
+        def shift(match):
+            try:
+                original = datetime.strptime(match.group(1), '%Y-%m-%d').date()
+            except ValueError:
+                return match.group(1)
+            lead = max(1, (original - row.timestamp.date()).days)
+            return (datetime.utcnow().date() + timedelta(days=lead)).isoformat()
+        message = DATE_RE.sub(shift, message)
+
+    return message
+
+
+def export_trace(args):
+    os.environ.setdefault('LLM_BACKEND', 'stub')
+    if args.database_url:
+        os.environ['DATABASE_URL'] = args.database_url
+    sys.path.insert(0, APP_DIR)
+    import app as restaurant_app
+
+    Conversation = restaurant_app.Conversation
+    with restaurant_app.app.app_context():
+        query = Conversation.query
+        if args.since:
+            query = query.filter(Conversation.timestamp >= datetime.strptime(args.since, '%Y-%m-%d'))
+        if args.until:
+            query = query.filter(Conversation.timestamp < datetime.strptime(args.until, '%Y-%m-%d') + timedelta(days=1))
+        query = query.order_by(Conversation.timestamp, Conversation.id)
+        if args.limit:
+            query = query.limit(args.limit)
+
+        first_timestamp = None
+        previous_by_session = {}
+        count = 0
+        with open(args.out, 'w', encoding='utf-8') as out:
+            for row in query.yield_per(1000):
+                if first_timestamp is None:
+                    first_timestamp = row.timestamp
+                previous = previous_by_session.get(row.session_id)
+                kind = classify(row)
+                out.write(json.dumps({
+                    'offset_s': round((row.timestamp - first_timestamp).total_seconds(), 3),
+                    'session': hashlib.sha256(row.session_id.encode('utf-8')).hexdigest()[:16],
+                    'intent': row.message_type or 'text',
+                    'kind': kind,
+                    'message': sanitize_message(row, previous, kind)
+                }, ensure_ascii=False) + '\n')
+                previous_by_session[row.session_id] = row
+                count += 1
+
+    print(f"Exported {count} events from {len(previous_by_session)} sessions to {args.out}")
+
+
+# ============================================================================
+# REPLAY
+# ============================================================================
+
+class ReplaySession(VirtualUser):
+    """Replays one session's events in order, carrying intent-flow state"""
+
+    def __init__(self, base_url: str, recorder: Recorder, session: str, menu_by_name: dict):
+        super().__init__(base_url, recorder, 0)
+        self.session_id = f'replay-{session}'
+        self.menu_by_name = menu_by_name
+        self.flow = {'order_step': (0, {}), 'reservation_step': (0, {})}
+
+    def play(self, event: dict):
+        kind, message = event['kind'], event['message']
+        if kind == 'chat':
+            self.call('POST /api/chat', 'POST', '/api/chat', {'message': message, 'session_id': self.session_id})
+        elif kind == 'recommendation':
+            preferences = message.split('Preferences: ', 1)[-1].split(', Restrictions: ', 1)[0]
+            self.call('POST /api/recommendations', 'POST', '/api/recommendations',
+                      {'preferences': preferences or 'anything', 'session_id': self.session_id})
+        elif kind in self.flow:
+            endpoint = '/api/chat/order-intent' if kind == 'order_step' else '/api/chat/reservation-intent'
+            step, collected = self.flow[kind]
+            result = self.call(f'POST {endpoint}', 'POST', endpoint, {
+                'message': message, 'session_id': self.session_id, 'step': step, 'collected_data': collected
+            })
+            if result and result.get('success'):
+                self.flow[kind] = (result['step'], result['collected_data'])
+        elif kind == 'direct_order':
+            self.call('POST /api/orders', 'POST', '/api/orders', {
+                'customer_name': 'Guest',
+                'items': self._items_from_summary(message),
+                'session_id': self.session_id
+            })
+
+    def _items_from_summary(self, message: str) -> list:
+        """Rebuild order items from 'Placed order for A, B' / 'Order confirmed: 2x A, 1x B'"""
+        summary = message
+        for prefix in DIRECT_ORDER_PREFIXES:
+            summary = summary.replace(prefix, '', 1)
+        items = []
+        for part in summary.split(', '):
+            quantity, _, name = part.partition('x ') if re.match(r'^\d+x ', part) else ('1', '', part)
+            menu_item = self.menu_by_name.get(name.strip().lower())
+            if menu_item:
+                items.append({'id': menu_item['id'], 'name': menu_item['name'],
+                              'price': menu_item['price'], 'quantity': int(quantity)})
+        return items or [{'id': 'bev_1', 'name': 'Soft Drinks', 'price': 3.50, 'quantity': 1}]
+
+
+def fetch_menu(base_url: str) -> dict:
+    import urllib.request
+    with urllib.request.urlopen(f'{base_url}/api/menu', timeout=10) as resp:
+        menu = json.loads(resp.read())['menu']
+    return {item['name'].lower(): item for items in menu.values() for item in items}
+
+
+def replay_trace(args):
+    events_by_session = defaultdict(list)
+    with open(args.trace, encoding='utf-8') as f:
+        for line in f:
+            event = json.loads(line)
+            events_by_session[event['session']].append(event)
+
+    server = workdir = None
+    base_url = args.url
+    if not base_url:
+        workdir = tempfile.mkdtemp(prefix='replay-')
+        env = dict(os.environ,
+                   RATELIMIT_ENABLED='false',
+                   ROLLUP_INTERVAL_SECONDS='0',
+                   DATABASE_URL=f"sqlite:///{os.path.join(workdir, 'replay.db')}",
+                   ARCHIVE_DIR=os.path.join(workdir, 'archive'))
+        if args.record:
+            env.update(LLM_BACKEND='replay', LLM_REPLAY_MODE='record', LLM_CASSETTE=os.path.abspath(args.record),
+                       LLM_RECORD_BACKEND=args.record_backend)
+        elif args.cassette:
+            env.update(LLM_BACKEND='replay', LLM_REPLAY_MODE='replay', LLM_CASSETTE=os.path.abspath(args.cassette))
+        base_url = f'http://127.0.0.1:{args.port}'
+        server = start_server(args.server, args.port, args.workers, env)
+
+    recorder = Recorder()
+    try:
+        wait_ready(base_url)
+        menu_by_name = fetch_menu(base_url)
+        started = time.perf_counter()
+
+        def run_session(session: str, events: list):
+            player = ReplaySession(base_url, recorder, session, menu_by_name)
+            for event in events:
+                delay = started + event['offset_s'] / args.speedup - time.perf_counter()
+                if delay > 0:
+                    time.sleep(delay)
+                player.play(event)
+
+        threads = [threading.Thread(target=run_session, args=item, daemon=True)
+                   for item in events_by_session.items()]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.perf_counter() - started
+    finally:
+        if server is not None:
+            os.killpg(server.pid, signal.SIGTERM)
+            server.wait(timeout=15)
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    endpoints = summarize(recorder, elapsed)
+    result = {
+        'benchmark': 'load',
+        'meta': run_metadata(),
+        'config': {
+            'trace': os.path.basename(args.trace), 'speedup': args.speedup,
+            'sessions': len(events_by_session), 'url': args.url,
+            'llm': 'record' if args.record else 'cassette' if args.cassette else 'server default'
+        },
+        'total_rps': round(sum(stats['count'] for stats in endpoints.values()) / elapsed, 2),
+        'llm_requests': endpoints.get('POST /api/chat', {}).get('count', 0),
+        'endpoints': endpoints
+    }
+    print_load(result)
+    if args.out:
+        with open(args.out, 'w') as f:
+            json.dump(result, f, indent=2)
+        print(f"\nResults written to {args.out}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    sub = parser.add_subparsers(dest='command', required=True)
+
+    export = sub.add_parser('export', help='export a sanitized trace from the Conversation table')
+    export.add_argument('--out', required=True)
+    export.add_argument('--database-url')
+    export.add_argument('--since')
+    export.add_argument('--until')
+    export.add_argument('--limit', type=int)
+
+    replay = sub.add_parser('replay', help='replay a trace against an instance')
+    replay.add_argument('trace')
+    replay.add_argument('--speedup', type=float, default=1.0)
+    replay.add_argument('--url', help='existing instance; by default a local one is started')
+    replay.add_argument('--server', choices=['wsgi', 'asgi'], default='wsgi')
+    replay.add_argument('--workers', type=int, default=2)
+    replay.add_argument('--port', type=int, default=5097)
+    llm = replay.add_mutually_exclusive_group()
+    llm.add_argument('--record', metavar='CASSETTE', help='record LLM responses to this cassette')
+    llm.add_argument('--cassette', help='answer LLM calls from this cassette')
+    replay.add_argument('--record-backend', default='gemini', help='backend used while recording')
+    replay.add_argument('--out')
+
+    args = parser.parse_args()
+    if args.command == 'export':
+        export_trace(args)
+    else:
+        if args.speedup <= 0:
+            parser.error('--speedup must be positive')
+        replay_trace(args)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,94 @@
+"""
+Startup benchmark: how long does `import app` take, and what pays for it?
+
+Runs `python -X importtime -c "import app"` in fresh interpreters and reports
+the wall-clock import time plus the slowest top-level packages. By default
+the app is imported with the stub LLM backend; `--with-gemini` additionally
+imports google.generativeai to show what the lazy import saves.
+
+Usage:
+    python benchmarks/startup.py [--runs 5] [--top 15] [--with-gemini] [--json out.json]
+"""
+
+import os
+import sys
+import json
+import argparse
+import statistics
+import subprocess
+from collections import defaultdict
+
+APP_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def run_import(with_gemini: bool) -> dict:
+    """Import the app once in a fresh interpreter and parse -X importtime output"""
+    code = "import app"
+    if with_gemini:
+        code = "import google.generativeai; " + code
+
+    env = dict(os.environ)
+    env.setdefault('LLM_BACKEND', 'stub')
+    env.setdefault('DATABASE_URL', 'sqlite://')
+
+    proc = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', code],
+        cwd=APP_DIR, env=env, capture_output=True, text=True
+    )
+    if proc.returncode != 0:
+        raise RuntimeError(f"import failed:\n{proc.stderr[-2000:]}")
+
+    # Lines look like: "import time:   self [us] | cumulative | imported package"
+    packages = defaultdict(int)
+    total_us = 0
+    for line in proc.stderr.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        self_us, _, name = line[len('import time:'):].split('|', 2)
+        top_level = name.strip().split('.')[0]
+        packages[top_level] += int(self_us)
+        total_us += int(self_us)
+
+    return {'total_ms': total_us / 1000, 'packages': packages}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--runs', type=int, default=5)
+    parser.add_argument('--top', type=int, default=15)
+    parser.add_argument('--with-gemini', action='store_true')
+    parser.add_argument('--json', dest='json_path')
+    args = parser.parse_args()
+
+    runs = [run_import(args.with_gemini) for _ in range(args.runs)]
+    totals = [r['total_ms'] for r in runs]
+
+    packages = defaultdict(list)
+    for r in runs:
+        for name, us in r['packages'].items():
+            packages[name].append(us / 1000)
+    slowest = sorted(
+        ((name, statistics.median(values)) for name, values in packages.items()),
+        key=lambda pair: pair[1], reverse=True
+    )[:args.top]
+
+    label = 'with google.generativeai' if args.with_gemini else 'lazy LLM import'
+    print(f"import app ({label}), {args.runs} runs")
+    print(f"  median {statistics.median(totals):.1f}ms  min {min(totals):.1f}ms  max {max(totals):.1f}ms")
+    print("\nSlowest top-level packages (median self time):")
+    for name, ms in slowest:
+        print(f"  {ms:8.1f}ms  {name}")
+
+    if args.json_path:
+        with open(args.json_path, 'w') as f:
+            json.dump({
+                'benchmark': 'startup',
+                'with_gemini': args.with_gemini,
+                'runs_ms': totals,
+                'median_ms': statistics.median(totals),
+                'slowest_packages_ms': dict(slowest)
+            }, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,386 @@
+"""
+Benchmark suite for the Restaurant Assistant Bot.
+
+    python benchmarks/suite.py load  [--server wsgi|asgi] [--users 20] [--duration 30]
+                                     [--llm-latency-ms 300] [--tokens-per-second 80]
+                                     [--chat-users 0] [--out results.json]
+    python benchmarks/suite.py micro [--out micro.json]
+    python benchmarks/suite.py compare old.json new.json
+
+`load` starts the fake Gemini server (benchmarks/fake_gemini.py) and the app
+against it (gunicorn or uvicorn). Virtual users then run a weighted mix of
+scenarios: free-form chat, menu browsing, the multi-step order and
+reservation flows and direct orders. --chat-users adds users that only chat,
+to check that orders hold up under a chat flood. It reports p50/p95/p99 and
+requests per second for each endpoint.
+
+`micro` times the hot helpers in-process: extract_order_items_from_message,
+validate_email/validate_phone and the models' to_dict().
+
+Every run writes machine-readable JSON, and `compare` diffs two runs.
+Rate limiting is disabled during load runs.
+"""
+
+import os
+import sys
+import json
+import time
+import random
+import shutil
+import signal
+import timeit
+import argparse
+import platform
+import tempfile
+import threading
+import subprocess
+import urllib.error
+import urllib.request
+from collections import defaultdict
+from datetime import datetime, timedelta
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+APP_DIR = os.path.dirname(BENCH_DIR)
+sys.path.insert(0, BENCH_DIR)
+
+from fake_gemini import FakeGeminiServer  # noqa: E402
+from load_chat import percentile, start_server, wait_ready  # noqa: E402
+
+
+def run_metadata() -> dict:
+    try:
+        commit = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=APP_DIR,
+                                capture_output=True, text=True).stdout.strip()
+    except OSError:
+        commit = ''
+    return {
+        'timestamp': datetime.utcnow().isoformat(),
+        'git_commit': commit,
+        'python': platform.python_version(),
+        'machine': platform.machine()
+    }
+
+
+# ============================================================================
+# LOAD SCENARIOS
+# ============================================================================
+
+class Recorder:
+    """Thread-safe per-endpoint latency recorder"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.latencies = defaultdict(list)
+        self.errors = defaultdict(int)
+
+    def record(self, endpoint: str, latency: float, ok: bool):
+        with self._lock:
+            if ok:
+                self.latencies[endpoint].append(latency)
+            else:
+                self.errors[endpoint] += 1
+
+
+class VirtualUser:
+    def __init__(self, base_url: str, recorder: Recorder, user_id: int):
+        self.base_url = base_url
+        self.recorder = recorder
+        self.session_id = f'bench-{user_id}-{random.randrange(1 << 30)}'
+
+    def call(self, endpoint: str, method: str, path: str, payload=None):
+        data = json.dumps(payload).encode() if payload is not None else None
+        req = urllib.request.Request(f'{self.base_url}{path}', data=data, method=method,
+                                     headers={'Content-Type': 'application/json'})
+        started = time.perf_counter()
+        body, ok = None, False
+        try:
+            with urllib.request.urlopen(req, timeout=60) as resp:
+                body = json.loads(resp.read() or b'null')
+                ok = 200 <= resp.status < 300
+        except (urllib.error.URLError, ConnectionError, OSError, ValueError):
+            pass
+        self.recorder.record(endpoint, time.perf_counter() - started, ok)
+        return body
+
+    def chat(self):
+        question = random.choice([
+            'What do you recommend for a first visit?',
+            'Do you have gluten free options?',
+            'What time do you close on Sunday?',
+            'Is the curry very spicy?',
+        ])
+        self.call('POST /api/chat', 'POST', '/api/chat', {'message': question, 'session_id': self.session_id})
+
+    def browse_menu(self):
+        self.call('GET /api/menu', 'GET', '/api/menu')
+        category = random.choice(['appetizers', 'main_courses', 'desserts', 'beverages'])
+        self.call('GET /api/menu/<category>', 'GET', f'/api/menu/{category}')
+
+    def order_flow(self):
+        messages = ['I would like the Grilled Salmon and a Tiramisu please', 'Jordan Bench',
+                    'jordan@example.com', '555-123-4567', 'no']
+        step, collected = 0, {}
+        for message in messages:
+            result = self.call('POST /api/chat/order-intent', 'POST', '/api/chat/order-intent', {
+                'message': message, 'session_id': self.session_id, 'step': step, 'collected_data': collected
+            })
+            if not result or not result.get('success'):
+                return
+            step, collected = result['step'], result['collected_data']
+
+    def reservation_flow(self):
+        date = (datetime.now() + timedelta(days=random.randint(1, 30))).strftime('%Y-%m-%d')
+        messages = ['Jordan Bench', 'jordan@example.com', '555-123-4567', str(random.randint(1, 8)),
+                    date, '19:30', 'window seat please']
+        step, collected = 0, {}
+        for message in messages:
+            result = self.call('POST /api/chat/reservation-intent', 'POST', '/api/chat/reservation-intent', {
+                'message': message, 'session_id': self.session_id, 'step': step, 'collected_data': collected
+            })
+            if not result or not result.get('success'):
+                return
+            step, collected = result['step'], result['collected_data']
+
+    def direct_order(self):
+        result = self.call('POST /api/orders', 'POST', '/api/orders', {
+            'customer_name': 'Jordan Bench',
+            'customer_email': 'jordan@example.com',
+            'items': [
+                {'id': 'main_1', 'name': 'Grilled Salmon', 'price': 24.99, 'quantity': 1},
+                {'id': 'bev_2', 'name': 'Coffee', 'price': 4.50, 'quantity': 2}
+            ],
+            'session_id': self.session_id
+        })
+        if result and result.get('order_id'):
+            self.call('GET /api/orders/<id>', 'GET', f"/api/orders/{result['order_id']}")
+
+
+SCENARIO_WEIGHTS = {
+    'chat': 40,
+    'browse_menu': 30,
+    'order_flow': 10,
+    'reservation_flow': 10,
+    'direct_order': 10,
+}
+
+
+def summarize(recorder: Recorder, elapsed: float) -> dict:
+    endpoints = {}
+    for endpoint in sorted(set(recorder.latencies) | set(recorder.errors)):
+        latencies = recorder.latencies.get(endpoint, [])
+        endpoints[endpoint] = {
+            'count': len(latencies),
+            'errors': recorder.errors.get(endpoint, 0),
+            'rps': round(len(latencies) / elapsed, 2),
+            'p50_ms': round(percentile(latencies, 50) * 1000, 2),
+            'p95_ms': round(percentile(latencies, 95) * 1000, 2),
+            'p99_ms': round(percentile(latencies, 99) * 1000, 2),
+        }
+    return endpoints
+
+
+def run_load(args) -> dict:
+    fake = FakeGeminiServer(0, args.llm_latency_ms, args.tokens_per_second, args.output_tokens)
+    fake.start_in_thread()
+
+    workdir = tempfile.mkdtemp(prefix='bench-')
+    env = dict(os.environ,
+               LLM_BACKEND='gemini',
+               GEMINI_API_KEY='fake-benchmark-key',
+               GEMINI_API_ENDPOINT=fake.endpoint,
+               RATELIMIT_ENABLED='false',
+               ROLLUP_INTERVAL_SECONDS='0',
+               DATABASE_URL=f"sqlite:///{os.path.join(workdir, 'bench.db')}",
+               ARCHIVE_DIR=os.path.join(workdir, 'archive'))
+    base_url = f'http://127.0.0.1:{args.port}'
+    server = start_server(args.server, args.port, args.workers, env)
+
+    recorder = Recorder()
+    scenarios = list(SCENARIO_WEIGHTS)
+    weights = [SCENARIO_WEIGHTS[name] for name in scenarios]
+    try:
+        wait_ready(base_url)
+        deadline = time.time() + args.duration
+
+        def user_loop(user_id: int):
+            user = VirtualUser(base_url, recorder, user_id)
+            while time.time() < deadline:
+                getattr(user, random.choices(scenarios, weights)[0])()
+
+        def chat_loop(user_id: int):
+            user = VirtualUser(base_url, recorder, user_id)
+            while time.time() < deadline:
+                user.chat()
+
+        started = time.perf_counter()
+        threads = [threading.Thread(target=user_loop, args=(i,), daemon=True) for i in range(args.users)]
+        threads += [threading.Thread(target=chat_loop, args=(args.users + i,), daemon=True)
+                    for i in range(args.chat_users)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.perf_counter() - started
+    finally:
+        os.killpg(server.pid, signal.SIGTERM)
+        server.wait(timeout=15)
+        fake.shutdown()
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    endpoints = summarize(recorder, elapsed)
+    total = sum(stats['count'] for stats in endpoints.values())
+    return {
+        'benchmark': 'load',
+        'meta': run_metadata(),
+        'config': {
+            'server': args.server, 'workers': args.workers, 'users': args.users, 'chat_users': args.chat_users,
+            'duration_s': args.duration, 'llm_latency_ms': args.llm_latency_ms,
+            'tokens_per_second': args.tokens_per_second, 'output_tokens': args.output_tokens,
+            'scenario_weights': SCENARIO_WEIGHTS
+        },
+        'total_rps': round(total / elapsed, 2),
+        'llm_requests': fake.requests_served,
+        'endpoints': endpoints
+    }
+
+
+def print_load(result: dict):
+    print(f"{'endpoint':<34} {'count':>7} {'err':>5} {'req/s':>8} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9}")
+    for endpoint, stats in result['endpoints'].items():
+        print(f"{endpoint:<34} {stats['count']:>7} {stats['errors']:>5} {stats['rps']:>8} "
+              f"{stats['p50_ms']:>9} {stats['p95_ms']:>9} {stats['p99_ms']:>9}")
+    print(f"\ntotal {result['total_rps']} req/s, {result['llm_requests']} LLM calls")
+
+
+# ============================================================================
+# MICROBENCHMARKS
+# ============================================================================
+
+def run_micro(args) -> dict:
+    os.environ.setdefault('LLM_BACKEND', 'stub')
+    os.environ.setdefault('DATABASE_URL', 'sqlite://')
+    sys.path.insert(0, APP_DIR)
+    import app as restaurant_app
+
+    now = datetime.utcnow()
+    order = restaurant_app.Order(
+        id=1, customer_name='Jordan Bench', customer_email='jordan@example.com',
+        customer_phone='555-123-4567', special_requests='',
+        items=json.dumps([{'id': 'main_1', 'name': 'Grilled Salmon', 'price': 24.99, 'quantity': 2}] * 3),
+        total_price=149.94, status='confirmed', session_id='s', created_at=now, updated_at=now
+    )
+    reservation = restaurant_app.Reservation(
+        id=1, customer_name='Jordan Bench', email='jordan@example.com', phone='555-123-4567',
+        party_size=4, reservation_date=now.date(), reservation_time='19:30',
+        special_requests='window seat', status='confirmed', created_at=now
+    )
+    conversation = restaurant_app.Conversation(
+        id=1, session_id='s', user_message='What do you recommend?',
+        bot_response='Try the Grilled Salmon! ' * 20, message_type='text', timestamp=now
+    )
+
+    price_index = restaurant_app.tenants.default.price_index
+    cart = [{'id': 'main_1', 'quantity': 2}, {'id': 'app_2', 'quantity': 1}, {'id': 'bev_1', 'quantity': 3}]
+    large_cart = cart * 7
+
+    cases = {
+        'extract_order_items_from_message (hit)':
+            lambda: restaurant_app.extract_order_items_from_message('I want the Grilled Salmon and two Tiramisu'),
+        'extract_order_items_from_message (miss)':
+            lambda: restaurant_app.extract_order_items_from_message('hello, what are your opening hours today?'),
+        'validate_email': lambda: restaurant_app.validate_email('jordan.bench@example.com'),
+        'validate_phone': lambda: restaurant_app.validate_phone('(555) 123-4567'),
+        'Order.to_dict': order.to_dict,
+        'Reservation.to_dict': reservation.to_dict,
+        'Conversation.to_dict': conversation.to_dict,
+        'quote_cart (3 lines)': lambda: restaurant_app.quote_cart(cart, price_index),
+        'quote_cart (21 lines)': lambda: restaurant_app.quote_cart(large_cart, price_index),
+    }
+
+    results = {}
+    for name, func in cases.items():
+        timer = timeit.Timer(func)
+        number, _ = timer.autorange()
+        best = min(timer.repeat(repeat=args.repeat, number=number)) / number
+        results[name] = {'ns_per_call': round(best * 1e9, 1), 'calls_per_repeat': number}
+        print(f"{name:<42} {best * 1e9:>10.1f} ns/call")
+
+    return {'benchmark': 'micro', 'meta': run_metadata(), 'results': results}
+
+
+# ============================================================================
+# COMPARE
+# ============================================================================
+
+def compare(old_path: str, new_path: str):
+    with open(old_path) as f:
+        old = json.load(f)
+    with open(new_path) as f:
+        new = json.load(f)
+    if old['benchmark'] != new['benchmark']:
+        raise SystemExit('Cannot compare different benchmark types')
+
+    def delta(a, b):
+        return f"{(b - a) / a * 100:+.1f}%" if a else 'n/a'
+
+    if new['benchmark'] == 'micro':
+        for name, stats in new['results'].items():
+            before = old['results'].get(name, {}).get('ns_per_call')
+            if before is not None:
+                print(f"{name:<42} {before:>10.1f} -> {stats['ns_per_call']:>10.1f} ns  {delta(before, stats['ns_per_call'])}")
+        return
+
+    for endpoint, stats in new['endpoints'].items():
+        before = old['endpoints'].get(endpoint)
+        if not before:
+            continue
+        print(f"{endpoint:<34} p50 {delta(before['p50_ms'], stats['p50_ms']):>8}  "
+              f"p95 {delta(before['p95_ms'], stats['p95_ms']):>8}  "
+              f"p99 {delta(before['p99_ms'], stats['p99_ms']):>8}  "
+              f"req/s {delta(before['rps'], stats['rps']):>8}")
+    print(f"{'total':<34} req/s {delta(old['total_rps'], new['total_rps'])}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    sub = parser.add_subparsers(dest='command', required=True)
+
+    load = sub.add_parser('load', help='mixed-traffic load test against a fake Gemini server')
+    load.add_argument('--server', choices=['wsgi', 'asgi'], default='wsgi')
+    load.add_argument('--workers', type=int, default=2)
+    load.add_argument('--users', type=int, default=20)
+    load.add_argument('--chat-users', type=int, default=0, help='extra users that only chat')
+    load.add_argument('--duration', type=float, default=30)
+    load.add_argument('--llm-latency-ms', type=float, default=300)
+    load.add_argument('--tokens-per-second', type=float, default=80)
+    load.add_argument('--output-tokens', type=int, default=60)
+    load.add_argument('--port', type=int, default=5098)
+    load.add_argument('--out')
+
+    micro = sub.add_parser('micro', help='in-process microbenchmarks')
+    micro.add_argument('--repeat', type=int, default=5)
+    micro.add_argument('--out')
+
+    cmp = sub.add_parser('compare', help='compare two result files')
+    cmp.add_argument('old')
+    cmp.add_argument('new')
+
+    args = parser.parse_args()
+    if args.command == 'compare':
+        compare(args.old, args.new)
+        return
+
+    if args.command == 'load':
+        result = run_load(args)
+        print_load(result)
+    else:
+        result = run_micro(args)
+
+    if args.out:
+        with open(args.out, 'w') as f:
+            json.dump(result, f, indent=2)
+        print(f"\nResults written to {args.out}")
+
+
+if __name__ == '__main__':
+    main()
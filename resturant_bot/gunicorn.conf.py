@@ -0,0 +1,33 @@
+"""
+Gunicorn configuration for the Restaurant Assistant Bot.
+
+Every worker runs the application warm-up (schema check, pool connect, menu
+index, Gemini client) after it loads the app, before it accepts traffic, and
+only then reports ready on /api/ready. With GUNICORN_PRELOAD=true the master
+imports the app and creates the schema once; workers skip that step.
+
+Each worker serves GUNICORN_THREADS requests at once, and admission control
+sizes its per-class limits from that.
+"""
+
+import os
+
+bind = f"0.0.0.0:{os.getenv('PORT', '5000')}"
+workers = int(os.getenv('WEB_CONCURRENCY', 2))
+threads = int(os.getenv('GUNICORN_THREADS', 4))
+timeout = int(os.getenv('GUNICORN_TIMEOUT', 60))
+preload_app = os.getenv('GUNICORN_PRELOAD', 'false').lower() == 'true'
+
+
+def when_ready(server):
+    """Create the schema once in the master when the app is preloaded"""
+    if server.cfg.preload_app:
+        from app import init_schema
+        init_schema()
+
+
+def post_worker_init(worker):
+    """Warm the worker after it loads the app, before it serves requests"""
+    from app import admission, warm_up
+    admission.configure(worker.cfg.threads)
+    warm_up(create_schema=not worker.cfg.preload_app)
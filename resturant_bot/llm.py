@@ -0,0 +1,617 @@
+"""
+LLM client abstraction for the Restaurant Assistant Bot.
+
+The Gemini SDK is heavy to import and needs an API key, so nothing here touches
+it until a Gemini backend is actually built. Backends are registered by name and
+selected with the LLM_BACKEND environment variable:
+
+    gemini   Google Gemini (default)
+    stub     local deterministic responses, no network or key required
+    replay   serves responses from a recorded cassette file
+
+The client wraps the backend in a circuit breaker (LLM_BREAKER_*) and can
+hedge slow calls with a second attempt (LLM_HEDGE_ENABLED).
+"""
+
+import os
+import re
+import json
+import time
+import asyncio
+import hashlib
+import logging
+import tempfile
+import threading
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor
+from concurrent.futures import TimeoutError as FutureTimeoutError, wait as futures_wait
+from dataclasses import dataclass
+from typing import Callable, Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_BACKEND = 'gemini'
+
+
+@dataclass
+class LLMResponse:
+    """Text generated by a backend plus its token usage"""
+    text: str
+    prompt_tokens: int = 0
+    completion_tokens: int = 0
+
+
+class LLMBackend:
+    """Base class for LLM backends"""
+    name = 'base'
+
+    def generate(self, prompt: str, **config) -> LLMResponse:
+        """Generate a completion for `prompt`.
+
+        Accepted config keys: temperature, top_k, top_p, max_output_tokens
+        and safety_settings. Backends ignore keys they don't support.
+        """
+        raise NotImplementedError
+
+    async def generate_async(self, prompt: str, **config) -> LLMResponse:
+        """Async variant; backends without native async I/O use a thread"""
+        return await asyncio.to_thread(self.generate, prompt, **config)
+
+
+_BACKENDS: Dict[str, Callable[[], LLMBackend]] = {}
+
+
+def register_backend(name: str):
+    """Register a backend factory under `name`"""
+    def decorator(factory):
+        _BACKENDS[name] = factory
+        return factory
+    return decorator
+
+
+def available_backends():
+    """Names of all registered backends"""
+    return sorted(_BACKENDS)
+
+
+def create_backend(name: str) -> LLMBackend:
+    """Build a backend by its registered name"""
+    if name not in _BACKENDS:
+        raise ValueError(f"Unknown LLM backend '{name}' (available: {', '.join(available_backends())})")
+    return _BACKENDS[name]()
+
+
+# ============================================================================
+# BACKENDS
+# ============================================================================
+
+@register_backend('gemini')
+class GeminiBackend(LLMBackend):
+    """Google Gemini via google-generativeai, imported on construction.
+
+    GEMINI_API_ENDPOINT points the SDK's REST transport at another server,
+    e.g. the fake Gemini server in benchmarks/fake_gemini.py. LLM_TIMEOUT_SECONDS
+    bounds each request instead of the SDK's much longer default.
+    """
+    name = 'gemini'
+
+    def __init__(self, model_name: str = 'gemini-2.0-flash'):
+        api_key = os.getenv('GEMINI_API_KEY')
+        if not api_key:
+            raise ValueError("GEMINI_API_KEY environment variable not set")
+
+        import google.generativeai as genai
+
+        self._endpoint = os.getenv('GEMINI_API_ENDPOINT')
+        if self._endpoint:
+            genai.configure(api_key=api_key, transport='rest', client_options={'api_endpoint': self._endpoint})
+        else:
+            genai.configure(api_key=api_key)
+        self._genai = genai
+        self._model = genai.GenerativeModel(model_name)
+        self._timeout = float(os.getenv('LLM_TIMEOUT_SECONDS', 20))
+
+    def _request_kwargs(self, config: Dict) -> Dict:
+        config = dict(config)
+        safety_settings = config.pop('safety_settings', None)
+        kwargs = {
+            'generation_config': self._genai.types.GenerationConfig(**config),
+            'request_options': {'timeout': self._timeout}
+        }
+        if safety_settings:
+            kwargs['safety_settings'] = safety_settings
+        return kwargs
+
+    def generate(self, prompt: str, **config) -> LLMResponse:
+        return self._to_response(self._model.generate_content(prompt, **self._request_kwargs(config)))
+
+    async def generate_async(self, prompt: str, **config) -> LLMResponse:
+        if self._endpoint:
+            # The SDK's async client is gRPC only; REST endpoints go through a thread
+            return await super().generate_async(prompt, **config)
+        response = await self._model.generate_content_async(prompt, **self._request_kwargs(config))
+        return self._to_response(response)
+
+    @staticmethod
+    def _to_response(response) -> LLMResponse:
+        usage = getattr(response, 'usage_metadata', None)
+        return LLMResponse(
+            text=response.text.strip(),
+            prompt_tokens=getattr(usage, 'prompt_token_count', 0) or 0,
+            completion_tokens=getattr(usage, 'candidates_token_count', 0) or 0
+        )
+
+
+def estimate_tokens(text: str) -> int:
+    """Rough token count (~4 characters per token) for backends without usage data"""
+    return max(1, len(text) // 4)
+
+
+@register_backend('stub')
+class StubBackend(LLMBackend):
+    """Deterministic offline backend for tests, benchmarks and CLI tasks.
+
+    LLM_STUB_LATENCY_MS adds a fixed delay per call to mimic a model round trip.
+    """
+    name = 'stub'
+
+    def __init__(self, latency_ms: Optional[float] = None):
+        if latency_ms is None:
+            latency_ms = float(os.getenv('LLM_STUB_LATENCY_MS', 0))
+        self.latency = latency_ms / 1000
+
+    def generate(self, prompt: str, **config) -> LLMResponse:
+        if self.latency:
+            time.sleep(self.latency)
+        return self._reply(prompt)
+
+    async def generate_async(self, prompt: str, **config) -> LLMResponse:
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        return self._reply(prompt)
+
+    @staticmethod
+    def _reply(prompt: str) -> LLMResponse:
+        user_line = prompt.rstrip().rsplit('\n', 1)[-1]
+        if user_line.startswith('User: '):
+            user_line = user_line[len('User: '):]
+        digest = hashlib.sha256(prompt.encode('utf-8')).hexdigest()[:8]
+        text = f"Thanks for your message! You said: {user_line[:200]} [stub {digest}]"
+        return LLMResponse(
+            text=text,
+            prompt_tokens=estimate_tokens(prompt),
+            completion_tokens=estimate_tokens(text)
+        )
+
+
+@register_backend('replay')
+class ReplayBackend(LLMBackend):
+    """Serves recorded responses from a JSON cassette.
+
+    LLM_CASSETTE names the cassette file. With LLM_REPLAY_MODE=record, misses
+    are forwarded to LLM_RECORD_BACKEND (default gemini) and written back to
+    the cassette; in the default replay mode a miss raises KeyError.
+    """
+    name = 'replay'
+
+    def __init__(self, path: Optional[str] = None, mode: Optional[str] = None,
+                 upstream: Optional[LLMBackend] = None):
+        self.path = path or os.getenv('LLM_CASSETTE', 'llm_cassette.json')
+        self.mode = mode or os.getenv('LLM_REPLAY_MODE', 'replay')
+        self._lock = threading.Lock()
+        self._entries: Dict[str, Dict] = {}
+
+        if os.path.exists(self.path):
+            with open(self.path, encoding='utf-8') as f:
+                self._entries = json.load(f).get('entries', {})
+
+        self._upstream = upstream
+        if self.mode == 'record' and self._upstream is None:
+            self._upstream = create_backend(os.getenv('LLM_RECORD_BACKEND', DEFAULT_BACKEND))
+
+    @staticmethod
+    def cassette_key(prompt: str, config: Dict) -> str:
+        """Stable key for a prompt and its generation settings.
+
+        Order and reservation numbers ("#42") in the conversation history
+        depend on how concurrent sessions interleave, so they are masked.
+        """
+        prompt = re.sub(r'#\d+', '#N', prompt)
+        payload = json.dumps({'prompt': prompt, 'config': config}, sort_keys=True, default=str)
+        return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+    def generate(self, prompt: str, **config) -> LLMResponse:
+        key = self.cassette_key(prompt, config)
+        entry = self._entries.get(key)
+        if entry is not None:
+            return LLMResponse(**entry)
+
+        if self.mode != 'record':
+            raise KeyError(f"No recorded LLM response for prompt key {key[:12]}")
+
+        response = self._upstream.generate(prompt, **config)
+        with self._lock:
+            self._entries[key] = {
+                'text': response.text,
+                'prompt_tokens': response.prompt_tokens,
+                'completion_tokens': response.completion_tokens
+            }
+            self.save()
+        return response
+
+    def save(self):
+        """Write the cassette to disk, merging entries recorded by other processes"""
+        import fcntl
+
+        with open(f"{self.path}.lock", 'w') as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            if os.path.exists(self.path):
+                with open(self.path, encoding='utf-8') as f:
+                    for key, entry in json.load(f).get('entries', {}).items():
+                        self._entries.setdefault(key, entry)
+
+            tmp_path = f"{self.path}.tmp"
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump({'version': 1, 'entries': self._entries}, f, indent=1, ensure_ascii=False)
+            os.replace(tmp_path, self.path)
+
+
+# ============================================================================
+# CIRCUIT BREAKER & HEDGING
+# ============================================================================
+
+class CircuitOpenError(RuntimeError):
+    """Raised instead of calling the backend while the circuit is open"""
+
+    def __init__(self, retry_after: float):
+        super().__init__(f"LLM circuit open, retry in {retry_after:.0f}s")
+        self.retry_after = retry_after
+
+
+class FileCircuitStore:
+    """Circuit state shared by the workers on one host through a small JSON file"""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._cached = (None, 0.0)  # (mtime, open_until)
+        self._probe_file = None
+
+    def get_open_until(self) -> float:
+        try:
+            mtime = os.stat(self.path).st_mtime_ns
+        except FileNotFoundError:
+            return 0.0
+        if mtime != self._cached[0]:
+            try:
+                with open(self.path, encoding='utf-8') as f:
+                    value = float(json.load(f).get('open_until', 0))
+            except (OSError, ValueError):
+                value = 0.0
+            self._cached = (mtime, value)
+        return self._cached[1]
+
+    def set_open_until(self, value: float):
+        tmp_path = f"{self.path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump({'open_until': value}, f)
+        os.replace(tmp_path, self.path)
+
+    def try_acquire_probe(self, ttl: float) -> bool:
+        # The lock dies with its process, so a crashed probe can't wedge the circuit
+        import fcntl
+
+        probe_file = open(f"{self.path}.probe", 'w')
+        try:
+            fcntl.flock(probe_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            probe_file.close()
+            return False
+        self._probe_file = probe_file
+        return True
+
+    def release_probe(self):
+        if self._probe_file is not None:
+            self._probe_file.close()
+            self._probe_file = None
+
+
+class RedisCircuitStore:
+    """Circuit state shared through Redis, for workers spread over several hosts"""
+
+    def __init__(self, url: str, name: str):
+        import redis
+
+        self._redis = redis.Redis.from_url(url, socket_timeout=0.5)
+        self._key = f"llm:circuit:{name}"
+
+    def get_open_until(self) -> float:
+        try:
+            return float(self._redis.get(self._key) or 0)
+        except Exception as e:
+            logger.error(f"Circuit state lookup error: {e}")
+            return 0.0
+
+    def set_open_until(self, value: float):
+        try:
+            self._redis.set(self._key, value, ex=max(60, int(value - time.time()) * 10))
+        except Exception as e:
+            logger.error(f"Circuit state update error: {e}")
+
+    def try_acquire_probe(self, ttl: float) -> bool:
+        try:
+            return bool(self._redis.set(f"{self._key}:probe", os.getpid(), nx=True, ex=max(1, int(ttl))))
+        except Exception as e:
+            logger.error(f"Circuit probe lock error: {e}")
+            return False
+
+    def release_probe(self):
+        try:
+            self._redis.delete(f"{self._key}:probe")
+        except Exception as e:
+            logger.error(f"Circuit probe release error: {e}")
+
+
+class CircuitBreaker:
+    """Trips when too many recent calls fail or run slow, then lets one probe through.
+
+    Each worker judges its own sliding window of calls; the open/half-open
+    state lives in a shared store so one worker tripping stops them all.
+    """
+
+    def __init__(self, store, window_seconds: float = 30, min_calls: int = 10,
+                 error_rate: float = 0.5, slow_call_seconds: float = 10, slow_call_rate: float = 0.8,
+                 open_seconds: float = 30):
+        self.store = store
+        self.window_seconds = window_seconds
+        self.min_calls = min_calls
+        self.error_rate = error_rate
+        self.slow_call_seconds = slow_call_seconds
+        self.slow_call_rate = slow_call_rate
+        self.open_seconds = open_seconds
+        self._lock = threading.Lock()
+        self._calls = deque()  # (finished_at, ok, slow)
+        self._latencies = deque(maxlen=200)  # recent successful call latencies
+        self.counters = {
+            'calls': 0, 'failures': 0, 'slow_calls': 0, 'rejected': 0,
+            'trips': 0, 'probes': 0, 'hedged': 0, 'hedge_wins': 0
+        }
+
+    def state(self) -> str:
+        open_until = self.store.get_open_until()
+        if not open_until:
+            return 'closed'
+        return 'open' if time.time() < open_until else 'half_open'
+
+    def before_call(self) -> bool:
+        """Raise CircuitOpenError if the call must not go out; True when it is the half-open probe"""
+        open_until = self.store.get_open_until()
+        if not open_until:
+            return False
+        now = time.time()
+        if now < open_until:
+            self.counters['rejected'] += 1
+            raise CircuitOpenError(open_until - now)
+        if self.store.try_acquire_probe(self.slow_call_seconds * 2):
+            self.counters['probes'] += 1
+            return True
+        self.counters['rejected'] += 1
+        raise CircuitOpenError(1)
+
+    def after_call(self, ok: bool, latency: float, probe: bool):
+        slow = latency >= self.slow_call_seconds
+        now = time.time()
+        with self._lock:
+            self.counters['calls'] += 1
+            self.counters['failures'] += not ok
+            self.counters['slow_calls'] += slow
+            if ok:
+                self._latencies.append(latency)
+
+            if probe:
+                self.store.release_probe()
+                if ok and not slow:
+                    self.store.set_open_until(0)
+                    self._calls.clear()
+                    logger.info("LLM circuit closed after a successful probe")
+                else:
+                    self._trip()
+                return
+
+            self._calls.append((now, ok, slow))
+            while self._calls and self._calls[0][0] < now - self.window_seconds:
+                self._calls.popleft()
+            total = len(self._calls)
+            if total < self.min_calls:
+                return
+            failures = sum(1 for _, call_ok, _ in self._calls if not call_ok)
+            slow_calls = sum(1 for _, _, call_slow in self._calls if call_slow)
+            if failures / total >= self.error_rate or slow_calls / total >= self.slow_call_rate:
+                self._trip()
+
+    def _trip(self):
+        self.store.set_open_until(time.time() + self.open_seconds)
+        self._calls.clear()
+        self.counters['trips'] += 1
+        logger.warning(f"LLM circuit opened for {self.open_seconds:.0f}s")
+
+    def latency_percentile(self, q: float, min_samples: int = 20) -> Optional[float]:
+        with self._lock:
+            latencies = sorted(self._latencies)
+        if len(latencies) < min_samples:
+            return None
+        return latencies[min(len(latencies) - 1, int(q * len(latencies)))]
+
+    def metrics(self) -> Dict:
+        p95 = self.latency_percentile(0.95, min_samples=1)
+        return {
+            'state': self.state(),
+            'p95_latency_ms': round(p95 * 1000, 1) if p95 is not None else None,
+            **self.counters
+        }
+
+
+def build_circuit_breaker(name: str) -> Optional[CircuitBreaker]:
+    """Breaker configured from LLM_BREAKER_* settings, or None when disabled"""
+    if os.getenv('LLM_BREAKER_ENABLED', 'true').lower() != 'true':
+        return None
+    if os.getenv('REDIS_URL'):
+        store = RedisCircuitStore(os.getenv('REDIS_URL'), name)
+    else:
+        default_path = os.path.join(tempfile.gettempdir(), f'restaurant-bot-llm-circuit-{name}.json')
+        store = FileCircuitStore(os.getenv('LLM_BREAKER_STATE_FILE', default_path))
+    return CircuitBreaker(
+        store,
+        window_seconds=float(os.getenv('LLM_BREAKER_WINDOW_SECONDS', 30)),
+        min_calls=int(os.getenv('LLM_BREAKER_MIN_CALLS', 10)),
+        error_rate=float(os.getenv('LLM_BREAKER_ERROR_RATE', 0.5)),
+        slow_call_seconds=float(os.getenv('LLM_BREAKER_SLOW_SECONDS', 10)),
+        slow_call_rate=float(os.getenv('LLM_BREAKER_SLOW_RATE', 0.8)),
+        open_seconds=float(os.getenv('LLM_BREAKER_OPEN_SECONDS', 30))
+    )
+
+
+# ============================================================================
+# CLIENT
+# ============================================================================
+
+class LLMClient:
+    """Thin facade over the configured backend.
+
+    With a breaker, calls are rejected with CircuitOpenError while the
+    circuit is open. With hedging on, a call still running after the recent
+    p95 latency gets a second attempt and the first answer wins.
+    """
+
+    def __init__(self, backend: LLMBackend, breaker: Optional[CircuitBreaker] = None,
+                 hedge: bool = False, hedge_min_samples: int = 20):
+        self.backend = backend
+        self.breaker = breaker
+        self.hedge = hedge and breaker is not None
+        self.hedge_min_samples = hedge_min_samples
+        self._hedge_pool = None
+
+    @property
+    def backend_name(self) -> str:
+        return self.backend.name
+
+    def _hedge_delay(self, probe: bool) -> Optional[float]:
+        if not self.hedge or probe:
+            return None
+        return self.breaker.latency_percentile(0.95, self.hedge_min_samples)
+
+    def generate(self, prompt: str, **config) -> LLMResponse:
+        if self.breaker is None:
+            return self.backend.generate(prompt, **config)
+
+        probe = self.breaker.before_call()
+        started = time.perf_counter()
+        try:
+            delay = self._hedge_delay(probe)
+            if delay is None:
+                response = self.backend.generate(prompt, **config)
+            else:
+                response = self._generate_hedged(prompt, config, delay)
+        except Exception:
+            self.breaker.after_call(False, time.perf_counter() - started, probe)
+            raise
+        self.breaker.after_call(True, time.perf_counter() - started, probe)
+        return response
+
+    async def generate_async(self, prompt: str, **config) -> LLMResponse:
+        if self.breaker is None:
+            return await self.backend.generate_async(prompt, **config)
+
+        probe = self.breaker.before_call()
+        started = time.perf_counter()
+        try:
+            delay = self._hedge_delay(probe)
+            if delay is None:
+                response = await self.backend.generate_async(prompt, **config)
+            else:
+                response = await self._generate_hedged_async(prompt, config, delay)
+        except Exception:
+            self.breaker.after_call(False, time.perf_counter() - started, probe)
+            raise
+        self.breaker.after_call(True, time.perf_counter() - started, probe)
+        return response
+
+    def _generate_hedged(self, prompt: str, config: Dict, delay: float) -> LLMResponse:
+        if self._hedge_pool is None:
+            self._hedge_pool = ThreadPoolExecutor(
+                max_workers=int(os.getenv('LLM_HEDGE_THREADS', 32)),
+                thread_name_prefix='llm-hedge'
+            )
+        first = self._hedge_pool.submit(self.backend.generate, prompt, **config)
+        try:
+            return first.result(timeout=delay)
+        except FutureTimeoutError:
+            pass
+
+        self.breaker.counters['hedged'] += 1
+        second = self._hedge_pool.submit(self.backend.generate, prompt, **config)
+        pending, error = {first, second}, None
+        while pending:
+            done, pending = futures_wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                if future.exception() is None:
+                    self.breaker.counters['hedge_wins'] += future is second
+                    return future.result()
+                error = future.exception()
+        raise error
+
+    async def _generate_hedged_async(self, prompt: str, config: Dict, delay: float) -> LLMResponse:
+        first = asyncio.ensure_future(self.backend.generate_async(prompt, **config))
+        done, _ = await asyncio.wait({first}, timeout=delay)
+        if done:
+            return first.result()
+
+        self.breaker.counters['hedged'] += 1
+        second = asyncio.ensure_future(self.backend.generate_async(prompt, **config))
+        pending, error = {first, second}, None
+        try:
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        self.breaker.counters['hedge_wins'] += task is second
+                        return task.result()
+                    error = task.exception()
+        finally:
+            for task in pending:
+                task.cancel()
+        raise error
+
+    def metrics(self) -> Dict:
+        return {
+            'backend': self.backend_name,
+            'hedging': self.hedge,
+            'circuit': self.breaker.metrics() if self.breaker is not None else None
+        }
+
+
+_client: Optional[LLMClient] = None
+_client_lock = threading.Lock()
+
+
+def get_llm_client() -> LLMClient:
+    """Return the process-wide client, building the backend on first use"""
+    global _client
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                name = os.getenv('LLM_BACKEND', DEFAULT_BACKEND)
+                _client = LLMClient(
+                    create_backend(name),
+                    breaker=build_circuit_breaker(name),
+                    hedge=os.getenv('LLM_HEDGE_ENABLED', 'false').lower() == 'true',
+                    hedge_min_samples=int(os.getenv('LLM_HEDGE_MIN_SAMPLES', 20))
+                )
+                logger.info(f"LLM backend '{name}' initialised")
+    return _client
+
+
+def set_llm_client(client: Optional[LLMClient]):
+    """Replace (or with None, reset) the process-wide client"""
+    global _client
+    with _client_lock:
+        _client = client
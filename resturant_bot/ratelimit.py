@@ -0,0 +1,232 @@
+"""
+Hybrid rate limit storage for the Restaurant Assistant Bot.
+
+    RATELIMIT_STORAGE_URI=hybrid+redis://localhost:6379/0
+
+Importing this module registers the hybrid+redis:// and hybrid+rediss://
+schemes with limits. The storage is meant for the sliding-window-counter
+strategy.
+
+Redis keeps one sliding window counter per limit key, and every worker shares
+it. A worker doesn't pay a round trip per request. It leases a batch of
+entries from the counter with one Lua script call and hands them out from a
+local bucket. Entries still unused when a lease lapses go back to Redis on
+the worker's next round trip, pipelined with that call. A denial is
+remembered locally for a short while, so a client that is over its limit
+doesn't reach Redis on every request either.
+
+Leases are granted only while the shared window has room. All workers
+together therefore never admit more than the limit. Entries held by idle
+leases can make a limit trip early, by at most one lease per other worker
+(lease_fraction of the limit). This lasts until that worker's next round
+trip, or until the window slides past them.
+"""
+
+import time
+import logging
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import List, Tuple
+
+from limits.storage import Storage
+from limits.storage.base import SlidingWindowCounterSupport
+
+logger = logging.getLogger(__name__)
+
+# KEYS[1] limit key. ARGV: limit, expiry (seconds), entries wanted, entries needed.
+# Grants between needed and wanted entries from the current window, or none.
+# Windows are numbered from the Redis clock so every worker agrees on them.
+LEASE_SCRIPT = """
+local now = redis.call('TIME')
+now = tonumber(now[1]) + tonumber(now[2]) / 1000000
+local limit, expiry = tonumber(ARGV[1]), tonumber(ARGV[2])
+local window = math.floor(now / expiry)
+local current_key = KEYS[1] .. '/' .. window
+local previous = tonumber(redis.call('GET', KEYS[1] .. '/' .. (window - 1)) or '0')
+local current = tonumber(redis.call('GET', current_key) or '0')
+local weight = 1 - (now - window * expiry) / expiry
+local room = math.floor(limit - previous * weight - current)
+local granted = math.min(tonumber(ARGV[3]), room)
+if granted < tonumber(ARGV[4]) then
+    return {0, window}
+end
+if redis.call('INCRBY', current_key, granted) == granted then
+    redis.call('EXPIRE', current_key, math.ceil(expiry * 2))
+end
+return {granted, window}
+"""
+
+# KEYS[1] the window key a lease was taken from. ARGV: entries to give back.
+REFUND_SCRIPT = """
+local current = tonumber(redis.call('GET', KEYS[1]) or '0')
+local refund = math.min(current, tonumber(ARGV[1]))
+if refund > 0 then
+    redis.call('DECRBY', KEYS[1], refund)
+end
+return refund
+"""
+
+# KEYS[1] key. ARGV: expiry (seconds), amount. Plain fixed window counter.
+INCR_SCRIPT = """
+local value = redis.call('INCRBY', KEYS[1], tonumber(ARGV[2]))
+if value == tonumber(ARGV[2]) then
+    redis.call('EXPIRE', KEYS[1], tonumber(ARGV[1]))
+end
+return value
+"""
+
+
+@dataclass
+class Lease:
+    tokens: int
+    window_key: str
+    expires_at: float
+    denied_until: float = 0.0
+
+
+class HybridRedisStorage(Storage, SlidingWindowCounterSupport):
+    """Sliding window counters in Redis, handed out through per-process leases"""
+
+    STORAGE_SCHEME = ['hybrid+redis', 'hybrid+rediss']
+
+    def __init__(self, uri: str, wrap_exceptions: bool = False, lease_size: int = 20,
+                 lease_fraction: float = 0.1, lease_seconds: float = 1.0, max_leases: int = 10000,
+                 **options):
+        """
+        :param lease_size: most entries a worker leases in one round trip
+        :param lease_fraction: most of any one limit a worker may hold at once
+        :param lease_seconds: how long unused entries stay with a worker
+        :param max_leases: limit keys tracked per worker, least recently used dropped first
+        """
+        import redis
+
+        super().__init__(uri, wrap_exceptions=wrap_exceptions)
+        self.redis = redis.Redis.from_url(uri.split('+', 1)[1], **options)
+        self.base_exception = redis.exceptions.RedisError
+        self.lease_size = int(lease_size)
+        self.lease_fraction = float(lease_fraction)
+        self.lease_seconds = float(lease_seconds)
+        self.max_leases = int(max_leases)
+        self._lease_script = self.redis.register_script(LEASE_SCRIPT)
+        self._refund_script = self.redis.register_script(REFUND_SCRIPT)
+        self._incr_script = self.redis.register_script(INCR_SCRIPT)
+        self._leases: 'OrderedDict[str, Lease]' = OrderedDict()
+        self._refunds: List[Tuple[str, int]] = []
+        self._lock = threading.Lock()
+
+    @property
+    def base_exceptions(self):
+        return self.base_exception
+
+    # Sliding window counter -------------------------------------------------
+
+    def acquire_sliding_window_entry(self, key: str, limit: int, expiry: int, amount: int = 1) -> bool:
+        now = time.monotonic()
+        with self._lock:
+            lease = self._leases.get(key)
+            if lease is not None:
+                self._leases.move_to_end(key)
+                if lease.expires_at <= now:
+                    self._return_unused(lease)
+                elif lease.tokens >= amount:
+                    lease.tokens -= amount
+                    return True
+                elif lease.denied_until > now:
+                    return False
+            self._expire_leases(now)
+            refunds, self._refunds = self._refunds, []
+
+        wanted = max(amount, min(self.lease_size, int(limit * self.lease_fraction)))
+        try:
+            granted, window = self._lease(key, limit, expiry, wanted, amount, refunds)
+        except Exception:
+            with self._lock:
+                self._refunds.extend(refunds)
+            raise
+
+        now = time.monotonic()
+        with self._lock:
+            lease = self._leases.get(key)
+            if lease is None or lease.expires_at <= now:
+                if lease is not None:
+                    self._return_unused(lease)
+                lease = self._leases[key] = Lease(0, '', now)
+            if granted:
+                lease.tokens += granted - amount
+                lease.window_key = f'{key}/{window}'
+                lease.expires_at = now + self.lease_seconds
+                lease.denied_until = 0.0
+            else:
+                # One entry drains out of the window every expiry / limit seconds
+                lease.denied_until = now + min(self.lease_seconds, expiry / max(limit, 1))
+                lease.expires_at = max(lease.expires_at, lease.denied_until)
+            while len(self._leases) > self.max_leases:
+                self._return_unused(self._leases.popitem(last=False)[1])
+        return bool(granted)
+
+    def _lease(self, key: str, limit: int, expiry: int, wanted: int, needed: int,
+               refunds: List[Tuple[str, int]]) -> Tuple[int, int]:
+        """One round trip: give back lapsed entries, then lease new ones"""
+        pipe = self.redis.pipeline(transaction=False)
+        for window_key, tokens in refunds:
+            self._refund_script(keys=[window_key], args=[tokens], client=pipe)
+        self._lease_script(keys=[key], args=[limit, expiry, wanted, needed], client=pipe)
+        granted, window = pipe.execute()[-1]
+        return int(granted), int(window)
+
+    def _return_unused(self, lease: Lease):
+        if lease.tokens > 0 and lease.window_key:
+            self._refunds.append((lease.window_key, lease.tokens))
+        lease.tokens = 0
+
+    def _expire_leases(self, now: float, batch: int = 32):
+        """Give back entries from leases nobody has touched since they lapsed"""
+        for key in list(self._leases)[:batch]:
+            lease = self._leases[key]
+            if lease.expires_at > now:
+                break
+            self._return_unused(lease)
+            del self._leases[key]
+
+    def get_sliding_window(self, key: str, expiry: int) -> Tuple[int, float, int, float]:
+        now = time.time()
+        window = int(now // expiry)
+        previous, current = self.redis.mget(f'{key}/{window - 1}', f'{key}/{window}')
+        previous_expires_in = (window + 1) * expiry - now
+        return int(previous or 0), previous_expires_in, int(current or 0), previous_expires_in + expiry
+
+    def clear_sliding_window(self, key: str, expiry: int) -> None:
+        window = int(time.time() // expiry)
+        with self._lock:
+            self._leases.pop(key, None)
+        self.redis.delete(f'{key}/{window - 1}', f'{key}/{window}')
+
+    # Fixed window counters, for the other strategies -------------------------
+
+    def incr(self, key: str, expiry: int, amount: int = 1) -> int:
+        return int(self._incr_script(keys=[key], args=[int(expiry), amount]))
+
+    def get(self, key: str) -> int:
+        return int(self.redis.get(key) or 0)
+
+    def get_expiry(self, key: str) -> float:
+        return max(self.redis.ttl(key), 0) + time.time()
+
+    def check(self) -> bool:
+        try:
+            return self.redis.ping()
+        except Exception:
+            return False
+
+    def reset(self) -> int:
+        with self._lock:
+            self._leases.clear()
+            self._refunds = []
+        keys = list(self.redis.scan_iter(match='LIMITER*'))
+        return self.redis.delete(*keys) if keys else 0
+
+    def clear(self, key: str) -> None:
+        with self._lock:
+            self._leases.pop(key, None)
+        self.redis.delete(key)
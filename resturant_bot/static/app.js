@@ -5,7 +5,8 @@ let appState = {
   cart: [],
   apiEndpoint: 'http://:5000/api',
   theme: 'auto',
-  menuItems: []
+  menuItems: [],
+  checkoutKeys: {}
 };
 
 // Sample Menu Data (fallback if API is unavailable)
@@ -22,6 +23,17 @@ const sampleMenu = [
   { id: 10, name: 'Cappuccino', category: 'beverages', price: 4.99, description: 'Espresso with steamed milk foam', tags: ['Vegetarian'] }
 ];
 
+// One Idempotency-Key per checkout: a double click or a retry of the same
+// checkout reuses it, so the server creates the order only once
+function checkoutKey(kind) {
+  if (!appState.checkoutKeys[kind]) {
+    appState.checkoutKeys[kind] = (window.crypto && crypto.randomUUID)
+      ? crypto.randomUUID()
+      : 'key_' + Date.now() + '_' + Math.random().toString(36).substr(2, 9);
+  }
+  return appState.checkoutKeys[kind];
+}
+
 // Initialize Session ID
 function initializeSession() {
   if (!appState.sessionId) {
@@ -65,40 +77,49 @@ async function fetchMenu() {
   renderMenu();
 }
 
-async function submitOrder(orderData) {
-  try {
-    const response = await fetch(`${appState.apiEndpoint}/orders`, {
-      method: 'POST',
-      headers: { 'Content-Type': 'application/json' },
-      body: JSON.stringify(orderData)
-    });
-    
-    if (!response.ok) throw new Error('Network response was not ok');
-    const data = await response.json();
-    return data;
-  } catch (error) {
-    console.error('Order API error:', error);
-    return { success: true, message: 'Order received (demo mode)', order_id: 'DEMO_' + Date.now() };
-  }
+// Checkout POSTs retry transient failures (no response, 408, 409 while the
+// first attempt is still in progress, 429, 5xx) with the same Idempotency-Key,
+// so a retry can't create a second order. Failures are returned as
+// { success: false, error, transient }; transient ones keep the checkout key.
+const CHECKOUT_RETRIES = 3;
+
+function isTransientStatus(status) {
+  return status === 408 || status === 409 || status === 429 || status >= 500;
 }
 
-async function submitReservation(reservationData) {
-  try {
-    const response = await fetch(`${appState.apiEndpoint}/reservations`, {
-      method: 'POST',
-      headers: { 'Content-Type': 'application/json' },
-      body: JSON.stringify(reservationData)
-    });
-    
-    if (!response.ok) throw new Error('Network response was not ok');
-    const data = await response.json();
-    return data;
-  } catch (error) {
-    console.error('Reservation API error:', error);
-    return { success: true, message: 'Reservation confirmed (demo mode)', reservation_id: 'RES_' + Date.now() };
+async function postCheckout(path, payload, idempotencyKey) {
+  const headers = { 'Content-Type': 'application/json' };
+  if (idempotencyKey) headers['Idempotency-Key'] = idempotencyKey;
+  let error = 'Could not reach the server';
+  for (let attempt = 0; ; attempt++) {
+    let delay = 1000 * 2 ** attempt;
+    try {
+      const response = await fetch(`${appState.apiEndpoint}${path}`, {
+        method: 'POST',
+        headers,
+        body: JSON.stringify(payload)
+      });
+      const data = await response.json().catch(() => ({}));
+      if (response.ok) return data;
+      error = data.error || `Server error (${response.status})`;
+      if (!isTransientStatus(response.status)) return { success: false, error, transient: false };
+      delay = 1000 * (Number(response.headers.get('Retry-After')) || data.retry_after || 2 ** attempt);
+    } catch (networkError) {
+      console.error(`${path} API error:`, networkError);
+    }
+    if (attempt >= CHECKOUT_RETRIES) return { success: false, error, transient: true };
+    await new Promise(resolve => setTimeout(resolve, delay));
   }
 }
 
+async function submitOrder(orderData, idempotencyKey) {
+  return postCheckout('/orders', orderData, idempotencyKey);
+}
+
+async function submitReservation(reservationData, idempotencyKey) {
+  return postCheckout('/reservations', reservationData, idempotencyKey);
+}
+
 // Chat Functions
 function addMessage(content, isUser = false) {
   const messagesContainer = document.getElementById('chatMessages');
@@ -303,7 +324,10 @@ async function placeOrder() {
     session_id: appState.sessionId
   };
   
-  const result = await submitOrder(orderData);
+  const result = await submitOrder(orderData, checkoutKey('order'));
+  // A transient failure may still have reached the server: keep the key so
+  // placing the order again replays it rather than ordering twice
+  if (!result.transient) delete appState.checkoutKeys.order;
   
   if (result.success !== false) {
     showToast('Order placed successfully!');
@@ -318,7 +342,7 @@ async function placeOrder() {
     addMessage(`Order placed successfully! Order ID: ${result.order_id || 'N/A'}`, false);
     switchView('chat');
   } else {
-    showToast('Error placing order. Please try again.');
+    showToast(`Order not placed: ${result.error || 'please try again'}`);
   }
 }
 
@@ -337,7 +361,8 @@ async function handleReservationSubmit(event) {
     session_id: appState.sessionId
   };
   
-  const result = await submitReservation(formData);
+  const result = await submitReservation(formData, checkoutKey('reservation'));
+  if (!result.transient) delete appState.checkoutKeys.reservation;
   
   if (result.success !== false) {
     const confirmationDiv = document.getElementById('reservationConfirmation');
@@ -363,7 +388,7 @@ async function handleReservationSubmit(event) {
     // Add confirmation to chat
     addMessage(`Reservation confirmed for ${formData.party_size} guests on ${formData.date} at ${formData.time}`, false);
   } else {
-    showToast('Error making reservation. Please try again.');
+    showToast(`Reservation not made: ${result.error || 'please try again'}`);
   }
 }
 
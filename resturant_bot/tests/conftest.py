@@ -0,0 +1,55 @@
+"""
+Shared fixtures for the Restaurant Assistant Bot tests.
+
+    cd resturant_bot && python -m pytest tests
+
+The app reads its configuration at import, so the environment is set here,
+before anything imports app: a throwaway SQLite database and tenant
+directory, the stub LLM backend, no Redis, and a known analytics key
+(ANALYTICS_HEADERS). The limiter is set up (in memory) but switched off;
+tests that exercise limits turn it on with the rate_limited fixture.
+"""
+
+import os
+import sys
+import tempfile
+
+import pytest
+
+APP_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+TEST_DIR = tempfile.mkdtemp(prefix='restaurant-tests-')
+
+os.environ.update(
+    DATABASE_URL=f"sqlite:///{os.path.join(TEST_DIR, 'test.db')}",
+    TENANTS_DIR=os.path.join(TEST_DIR, 'tenants'),
+    ARCHIVE_DIR=os.path.join(TEST_DIR, 'archive'),
+    LLM_BACKEND='stub',
+    ROLLUP_INTERVAL_SECONDS='0',
+    RETENTION_SCHEDULE_MINUTES='0',
+    ANALYTICS_API_KEY='test-analytics-key',
+)
+os.environ.pop('REDIS_URL', None)
+sys.path.insert(0, APP_DIR)
+
+ANALYTICS_HEADERS = {'Authorization': 'Bearer test-analytics-key'}
+
+
+@pytest.fixture(scope='session')
+def restaurant_app():
+    import app as restaurant_app
+    restaurant_app.warm_up()
+    restaurant_app.limiter.enabled = False
+    return restaurant_app
+
+
+@pytest.fixture
+def client(restaurant_app):
+    return restaurant_app.app.test_client()
+
+
+@pytest.fixture
+def rate_limited(restaurant_app, monkeypatch):
+    monkeypatch.setattr(restaurant_app.limiter, 'enabled', True)
+    restaurant_app.limiter.reset()
+    yield restaurant_app.limiter
+    restaurant_app.limiter.reset()
@@ -0,0 +1,27 @@
+"""Access to the /api/analytics endpoints"""
+
+import pytest
+
+from conftest import ANALYTICS_HEADERS
+
+ENDPOINTS = ['/api/analytics/revenue', '/api/analytics/top-items', '/api/analytics/conversion']
+
+
+@pytest.mark.parametrize('path', ENDPOINTS)
+@pytest.mark.parametrize('headers', [{}, {'Authorization': 'Bearer wrong-key'}, {'Authorization': 'test-analytics-key'}])
+def test_analytics_rejects_missing_or_wrong_key(client, path, headers):
+    response = client.get(path, headers=headers)
+    assert response.status_code == 401
+    assert response.get_json()['success'] is False
+
+
+@pytest.mark.parametrize('path', ENDPOINTS)
+def test_analytics_accepts_the_key(client, path):
+    response = client.get(path, headers=ANALYTICS_HEADERS)
+    assert response.status_code == 200
+    assert response.get_json()['success'] is True
+
+
+def test_analytics_disabled_without_a_key(restaurant_app, client, monkeypatch):
+    monkeypatch.setattr(restaurant_app, 'ANALYTICS_API_KEY', None)
+    assert client.get(ENDPOINTS[0], headers=ANALYTICS_HEADERS).status_code == 401
@@ -0,0 +1,64 @@
+"""Concurrency of the ASGI app (asgi.py): WSGI-routed and native model routes"""
+
+import time
+import asyncio
+from functools import wraps
+
+import httpx
+import pytest
+
+from llm import LLMClient, StubBackend, get_llm_client, set_llm_client
+
+DELAY = 0.3
+CONCURRENCY = 6
+
+
+@pytest.fixture
+def asgi_app(restaurant_app):
+    import asgi
+    return asgi.application
+
+
+def run_concurrently(application, method: str, path: str, **kwargs):
+    """Send CONCURRENCY identical requests at once; returns (statuses, seconds)"""
+    async def main():
+        transport = httpx.ASGITransport(app=application)
+        async with httpx.AsyncClient(transport=transport, base_url='http://test') as http:
+            started = time.perf_counter()
+            responses = await asyncio.gather(*[
+                http.request(method, path, **kwargs) for _ in range(CONCURRENCY)
+            ])
+            return [r.status_code for r in responses], time.perf_counter() - started
+    return asyncio.run(main())
+
+
+def test_wsgi_routes_run_in_parallel(restaurant_app, asgi_app, monkeypatch):
+    """A slow WSGI route doesn't hold up the next request to the same worker"""
+    view = restaurant_app.app.view_functions['get_menu']
+
+    @wraps(view)
+    def slow_view(*args, **kwargs):
+        time.sleep(DELAY)
+        return view(*args, **kwargs)
+
+    monkeypatch.setitem(restaurant_app.app.view_functions, 'get_menu', slow_view)
+    statuses, elapsed = run_concurrently(asgi_app, 'GET', '/api/menu')
+
+    assert statuses == [200] * CONCURRENCY
+    assert elapsed < DELAY * CONCURRENCY / 2
+
+
+def test_recommendations_await_the_model(asgi_app):
+    """Recommendations are served natively, so model calls overlap"""
+    previous = get_llm_client()
+    set_llm_client(LLMClient(StubBackend(latency_ms=DELAY * 1000)))
+    try:
+        statuses, elapsed = run_concurrently(
+            asgi_app, 'POST', '/api/recommendations',
+            json={'preferences': 'something spicy', 'session_id': 'asgi-recommendations'}
+        )
+    finally:
+        set_llm_client(previous)
+
+    assert statuses == [200] * CONCURRENCY
+    assert elapsed < DELAY * CONCURRENCY / 2
@@ -0,0 +1,23 @@
+"""/api/chat/batch draws on the same chat and session limits as /api/chat"""
+
+
+def batch(session_id, count):
+    return {'messages': [{'session_id': session_id, 'message': f'hello {i}'} for i in range(count)]}
+
+
+def test_batch_items_over_the_session_limit_get_429(client, rate_limited):
+    response = client.post('/api/chat/batch', json=batch('batch-session', 25))
+    assert response.status_code == 200
+    statuses = [result['status'] for result in response.get_json()['results']]
+    assert statuses == [200] * 20 + [429] * 5
+
+    # The batch used up the session's limit for /api/chat too
+    response = client.post('/api/chat', json={'session_id': 'batch-session', 'message': 'hello'})
+    assert response.status_code == 429
+
+
+def test_batch_is_charged_per_message_against_the_chat_limit(client, rate_limited):
+    assert client.post('/api/chat/batch', json=batch('first-session', 20)).status_code == 200
+    assert client.post('/api/chat/batch', json=batch('second-session', 11)).status_code == 429
+    assert client.post('/api/chat/batch', json=batch('second-session', 10)).status_code == 200
+    assert client.post('/api/chat', json={'session_id': 'third-session', 'message': 'hello'}).status_code == 429
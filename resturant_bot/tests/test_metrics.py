@@ -0,0 +1,19 @@
+"""/api/metrics"""
+
+
+def test_metrics_reports_the_llm_client(client):
+    response = client.get('/api/metrics')
+    assert response.status_code == 200
+    assert response.get_json()['llm']['backend'] == 'stub'
+
+
+def test_metrics_without_an_llm_client(restaurant_app, client, monkeypatch):
+    def unavailable():
+        raise ValueError('GEMINI_API_KEY is not set')
+
+    monkeypatch.setattr(restaurant_app, 'get_llm_client', unavailable)
+    response = client.get('/api/metrics')
+    assert response.status_code == 200
+    body = response.get_json()
+    assert body['llm'] == {'available': False, 'backend': None, 'hedging': None, 'circuit': None}
+    assert 'admission' in body
@@ -0,0 +1,73 @@
+"""Tenant isolation of analytics rollups and token budgets"""
+
+import os
+import json
+
+import pytest
+
+from conftest import ANALYTICS_HEADERS
+
+ORDER = {
+    'customer_name': 'Test Customer',
+    'customer_email': 'test@example.com',
+    'customer_phone': '555-123-4567',
+    'items': [{'id': 'app_1', 'quantity': 2}],
+}
+
+
+@pytest.fixture
+def second_tenant(restaurant_app):
+    """A second restaurant with the default menu"""
+    os.makedirs(restaurant_app.TENANTS_DIR, exist_ok=True)
+    path = os.path.join(restaurant_app.TENANTS_DIR, 'second.json')
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump({**restaurant_app.RESTAURANT_CONFIG, 'name': 'Second Bistro'}, f)
+    restaurant_app.tenants.invalidate()
+    yield 'second'
+    os.remove(path)
+    restaurant_app.tenants.invalidate()
+
+
+def tenant_revenue(restaurant_app, tenant_id: str) -> float:
+    with restaurant_app.app.app_context():
+        total = restaurant_app.db.session.query(restaurant_app.func.sum(restaurant_app.Order.total_price)).filter(
+            restaurant_app.Order.tenant_id == tenant_id
+        ).scalar()
+    return round(total or 0, 2)
+
+
+def test_analytics_rollups_are_per_tenant(restaurant_app, client, second_tenant):
+    for tenant_id, count in ((restaurant_app.DEFAULT_TENANT, 1), (second_tenant, 2)):
+        for i in range(count):
+            response = client.post('/api/orders', json={**ORDER, 'session_id': f'{tenant_id}-{i}'},
+                                   headers={'X-Tenant-ID': tenant_id})
+            assert response.status_code in (200, 201), response.get_json()
+    with restaurant_app.app.app_context():
+        restaurant_app.update_analytics_rollups()
+
+    for tenant_id in (restaurant_app.DEFAULT_TENANT, second_tenant):
+        body = client.get('/api/analytics/revenue', headers={'X-Tenant-ID': tenant_id, **ANALYTICS_HEADERS}).get_json()
+        assert body['total_revenue'] == tenant_revenue(restaurant_app, tenant_id)
+
+    second = client.get('/api/analytics/top-items', headers={'X-Tenant-ID': second_tenant, **ANALYTICS_HEADERS}).get_json()
+    assert [(item['item_key'], item['quantity']) for item in second['items']] == [('app_1', 4)]
+    conversion = client.get('/api/analytics/conversion', headers={'X-Tenant-ID': second_tenant, **ANALYTICS_HEADERS}).get_json()
+    assert conversion['sessions_converted'] == 2
+
+
+def test_token_budgets_are_per_tenant(restaurant_app, second_tenant, monkeypatch):
+    monkeypatch.setattr(restaurant_app, 'TOKEN_BUDGET_SESSION_DAILY', 10)
+    monkeypatch.setattr(restaurant_app, 'TOKEN_BUDGET_IP_DAILY', 10)
+
+    def budget_after_use(tenant_id: str, prompt_tokens: int):
+        with restaurant_app.app.test_request_context(headers={'X-Tenant-ID': tenant_id}):
+            restaurant_app.select_tenant()
+            if prompt_tokens:
+                restaurant_app.record_token_usage('shared-session', '10.0.0.1', prompt_tokens, 0)
+            return restaurant_app.check_token_budget('shared-session', '10.0.0.1')
+
+    assert budget_after_use(restaurant_app.DEFAULT_TENANT, 20) is not None
+    assert budget_after_use(second_tenant, 0) is None
+    with restaurant_app.app.app_context():
+        usage = restaurant_app.TokenUsage.query.filter_by(session_id='shared-session').all()
+    assert [(row.tenant_id, row.prompt_tokens) for row in usage] == [(restaurant_app.DEFAULT_TENANT, 20)]